@@ -0,0 +1,43 @@
+from sqlalchemy import inspect, text
+
+from app.db.database import Base, engine
+
+import logging
+
+
+# Columns added to tables that already existed, create_all only creates the missing tables.
+# Every entry is the table, the column and the SQL default of the rows already there (None leaves them null)
+ADDED_COLUMNS = [
+    ("projects", "calibration", None),
+    ("projects", "analysis_only", "false"),
+    ("plays", "trajectories", None),
+    ("plays", "original_video", None),
+    ("plays", "detections", None),
+]
+
+
+def get_column_names(table_name: str) -> set:
+    return {column["name"] for column in inspect(engine).get_columns(table_name)}
+
+
+def add_missing_columns():
+    # Runs on every start, a column is only added to a database that does not have it yet
+    for table_name, column_name, default in ADDED_COLUMNS:
+        if not inspect(engine).has_table(table_name) or column_name in get_column_names(table_name):
+            continue
+
+        column = Base.metadata.tables[table_name].columns[column_name]
+        column_definition = f"{column_name} {column.type.compile(dialect=engine.dialect)}"
+        if default is not None:
+            column_definition += f" DEFAULT {default}"
+        if not column.nullable:
+            column_definition += " NOT NULL"
+
+        try:
+            with engine.begin() as connection:
+                connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_definition}"))
+            logging.info(f"Added column {column_name} to {table_name}")
+        except Exception:
+            # Another worker starting at the same time added it first
+            if column_name not in get_column_names(table_name):
+                raise
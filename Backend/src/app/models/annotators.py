@@ -1,5 +1,5 @@
 from __future__ import annotations
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Tuple, Optional, List, Dict
 
 from app.models.custom_color import Color
@@ -109,15 +109,18 @@ class Detection:
     colors_list: Optional[List[str]] = None
     centers_list: Optional[List[(int,int)]] = None
     centers_minimap_list: Optional[List[(int,int)]] = None
+    frames_list: Optional[List[int]] = None
+    rects_list: Optional[List[List[float]]] = None
     color: Optional[Color] = None
     tracker_id: Optional[int] = None
 
     @classmethod
-    def from_results(cls, pred: np.ndarray, names: Dict[int, str]) -> List[Detection]:
+    def from_results(cls, pred: np.ndarray, names: Dict[int, str], offset: Tuple[int, int] = (0, 0)) -> List[Detection]:
+        # offset is the top left corner of the part of the frame the model saw
         result = []
         for i in range(len(pred.cls)):
             x_min, y_min, x_max, y_max = pred.xyxy[i]
-            rect = Rect(x=float(x_min), y=float(y_min), width=float(x_max - x_min), height=float(y_max - y_min))
+            rect = Rect(x=float(x_min) + offset[0], y=float(y_min) + offset[1], width=float(x_max - x_min), height=float(y_max - y_min))
             result.append(Detection(
                 id =  str(uuid.uuid4()),
                 rect=rect,
@@ -125,6 +128,8 @@ class Detection:
                 abled = True,
                 centers_list = [],
                 centers_minimap_list = [],
+                frames_list = [],
+                rects_list = [],
                 colors_list=[names[int(pred.cls[i])]],
                 class_name=names[int(pred.cls[i])],
                 confidence=float(pred.conf[i])
@@ -155,6 +160,8 @@ class Detection:
             "colors_list": self.colors_list,
             "centers_list": self.centers_list,
             "centers_minimap_list": self.centers_minimap_list,
+            "frames_list": self.frames_list,
+            "rects_list": self.rects_list,
             "color": self.color,
             "tracker_id": self.tracker_id
         }
@@ -197,7 +204,7 @@ class BaseAnnotator:
     thickness: int = THICKNESS
 
     def annotate(self, image: np.ndarray, detections: List[Detection]) -> np.ndarray:
-        annotated_image = image.copy()
+        annotated_image = image
         ball_colours = assign_colors_to_balls_colour_model(detections)
         for detection in detections:
             if detection.abled is True:
@@ -213,45 +220,59 @@ class BaseAnnotator:
                 )
         return annotated_image
 
+TRAIL_MASK_COLOR = Color(255, 255, 255)
+
 @dataclass
-class LineAnnotator:
-    thickness: int = THICKNESS
+class TrailLayer:
+    # Trails drawn so far on a transparent layer, only the segments added since the last frame are drawn
+    image: Optional[np.ndarray] = None
+    mask: Optional[np.ndarray] = None
+    drawn_points: Optional[Dict[str, int]] = None
+
+    def reset(self, shape: Tuple[int, ...]):
+        self.image = np.zeros(shape, dtype=np.uint8)
+        self.mask = np.zeros(shape[:2], dtype=np.uint8)
+        self.drawn_points = {}
+
+    def draw(self, image: np.ndarray, detections: List[Detection], centers_attribute: str, thickness: int) -> np.ndarray:
+        if self.image is None or self.image.shape != image.shape:
+            self.reset(image.shape)
+
+        if any(len(getattr(detection, centers_attribute)) < self.drawn_points.get(detection.id, 0) for detection in detections):
+            # A track lost points, its old segments can not be erased from the layer so it is drawn again
+            self.reset(image.shape)
 
-    def annotate(self, image: np.ndarray, detections: List[Detection]) -> np.ndarray:
-        annotated_image = image.copy()
         ball_colours = assign_colors_to_balls_colour_model(detections)
         for detection in detections:
-            previous_point = None
+            centers = getattr(detection, centers_attribute)
+            first_point = max(self.drawn_points.get(detection.id, 0) - 1, 0)
+            if len(centers) - first_point < 2:
+                continue
+
             ball_color = ball_colours[detection.id]
             color = Color(ball_color[0], ball_color[1], ball_color[2])
-            for center in detection.centers_list:
-                if previous_point is not None:
-                    annotated_image = draw_line(
-                        image=annotated_image,
-                        start_point=previous_point,
-                        end_point=center,
-                        thickness=self.thickness,
-                        color=color)
-                previous_point = center
-        return annotated_image
+            previous_point = (int(centers[first_point][0]), int(centers[first_point][1]))
+            for center in centers[first_point + 1:]:
+                point = (int(center[0]), int(center[1]))
+                draw_line(image=self.image, start_point=previous_point, end_point=point, thickness=thickness, color=color)
+                draw_line(image=self.mask, start_point=previous_point, end_point=point, thickness=thickness, color=TRAIL_MASK_COLOR)
+                previous_point = point
+            self.drawn_points[detection.id] = len(centers)
+
+        return cv2.copyTo(self.image, self.mask, image)
+
+@dataclass
+class LineAnnotator:
+    thickness: int = THICKNESS
+    frame_trails: TrailLayer = field(default_factory=TrailLayer)
+    minimap_trails: TrailLayer = field(default_factory=TrailLayer)
+
+    # Trails are drawn in place on the given image, each annotator must be used for a single video
+    def annotate(self, image: np.ndarray, detections: List[Detection]) -> np.ndarray:
+        return self.frame_trails.draw(image, detections, "centers_list", self.thickness)
 
     def annotate_minimap(self, image: np.ndarray, detections: List[Detection]) -> np.ndarray:
-        annotated_image = image.copy()
-        ball_colours = assign_colors_to_balls_colour_model(detections)
-        for detection in detections:
-            previous_point = None
-            ball_color = ball_colours[detection.id]
-            color = Color(ball_color[0], ball_color[1], ball_color[2])
-            for center in detection.centers_minimap_list:
-                if previous_point is not None:
-                    annotated_image = draw_line(
-                        image=annotated_image,
-                        start_point=previous_point,
-                        end_point=(int(center[0]),int(center[1])),
-                        thickness=self.thickness,
-                        color=color)
-                previous_point = (int(center[0]),int(center[1]))
-        return annotated_image
+        return self.minimap_trails.draw(image, detections, "centers_minimap_list", self.thickness)
     
     def annotate_from_ball_info(self, image: np.ndarray, color: str, centers: List[(float,float)], isFinallyDisabled: bool ) -> np.ndarray:
         annotated_image = image.copy()
@@ -327,7 +348,7 @@ class MarkerAnnotator:
     color: Color
 
     def annotate(self, image: np.ndarray, detections: List[Detection]) -> np.ndarray:
-        annotated_image = image.copy()
+        annotated_image = image
         for detection in detections:
             annotated_image = draw_marker(
                 image=image, 
@@ -335,3 +356,76 @@ class MarkerAnnotator:
                 color=self.color)
         return annotated_image
     
+
+FRAME_BORDER = (40, 10, 10, 10)     # top, bottom, left, right
+MINIMAP_BORDER = (70, 50, 10, 10)
+BORDER_COLOR = (255, 255, 255)
+MAX_OUTPUT_WIDTH = 1920
+MAX_OUTPUT_HEIGHT = 1080
+
+def scale_rect(x: float, y: float, width: float, height: float, scale_x: float, scale_y: float) -> Tuple[slice, slice]:
+    x_min, y_min = round(x * scale_x), round(y * scale_y)
+    x_max, y_max = round((x + width) * scale_x), round((y + height) * scale_y)
+    return slice(y_min, max(y_max, y_min + 1)), slice(x_min, max(x_max, x_min + 1))
+
+class FrameCompositor:
+    # Output frame of a video: the annotated frame and the minimap side by side with white borders.
+    # The borders are painted once on canvases at the final size and every frame is resized straight into one of them.
+
+    def __init__(self, frame_width: int, frame_height: int, table_map: np.ndarray, buffers: int = 1):
+        self.table_map = table_map
+        self.minimap = np.empty_like(table_map)
+
+        top, bottom, left, right = FRAME_BORDER
+        frame_panel_width, panel_height = frame_width + left + right, frame_height + top + bottom
+
+        map_height, map_width = table_map.shape[:2]
+        map_top, map_bottom, map_left, map_right = MINIMAP_BORDER
+        minimap_panel_width = int(panel_height * map_width / map_height)
+
+        width, height = frame_panel_width + minimap_panel_width, panel_height
+        output_width, output_height = width, height
+        if width > MAX_OUTPUT_WIDTH or height > MAX_OUTPUT_HEIGHT:
+            aspect_ratio = width / height
+            if aspect_ratio > 1:
+                output_width, output_height = MAX_OUTPUT_WIDTH, int(MAX_OUTPUT_WIDTH / aspect_ratio)
+            else:
+                output_width, output_height = int(MAX_OUTPUT_HEIGHT * aspect_ratio), MAX_OUTPUT_HEIGHT
+
+        scale_x, scale_y = output_width / width, output_height / height
+        # Several canvases are used in turn when earlier frames are still waiting to be encoded
+        self.canvases = [np.full((output_height, output_width, 3), BORDER_COLOR, dtype=np.uint8) for _ in range(buffers)]
+        self.next_canvas = 0
+        self.frame_region = scale_rect(left, top, frame_width, frame_height, scale_x, scale_y)
+
+        # The bordered table map is stretched to fill its panel, so its border scales differently than the frame one
+        minimap_scale_x = minimap_panel_width / (map_width + map_left + map_right)
+        minimap_scale_y = panel_height / (map_height + map_top + map_bottom)
+        self.minimap_region = scale_rect(
+            frame_panel_width + map_left * minimap_scale_x, map_top * minimap_scale_y,
+            map_width * minimap_scale_x, map_height * minimap_scale_y, scale_x, scale_y)
+
+    def reset_minimap(self) -> np.ndarray:
+        # Clean table map to draw the balls of the current frame on, reusing the same buffer
+        np.copyto(self.minimap, self.table_map)
+        return self.minimap
+
+    def compose(self, annotated_frame: np.ndarray, minimap: np.ndarray) -> np.ndarray:
+        canvas = self.canvases[self.next_canvas]
+        self.next_canvas = (self.next_canvas + 1) % len(self.canvases)
+        place_in_region(annotated_frame, canvas[self.frame_region])
+        place_in_region(minimap, canvas[self.minimap_region])
+        return canvas
+
+def get_minimap_photo(minimap: np.ndarray, frame_height: int) -> np.ndarray:
+    # Bordered minimap at the size it has in the output video
+    panel_height = frame_height + FRAME_BORDER[0] + FRAME_BORDER[1]
+    panel_width = int(panel_height * minimap.shape[1] / minimap.shape[0])
+    bordered_minimap = cv2.copyMakeBorder(minimap, *MINIMAP_BORDER, cv2.BORDER_CONSTANT, value=BORDER_COLOR)
+    return cv2.resize(bordered_minimap, (panel_width, panel_height))
+
+def place_in_region(image: np.ndarray, region: np.ndarray):
+    if image.shape[:2] == region.shape[:2]:
+        np.copyto(region, image)
+    else:
+        cv2.resize(image, (region.shape[1], region.shape[0]), dst=region)
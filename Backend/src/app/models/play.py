@@ -1,5 +1,5 @@
 from sqlalchemy import JSON, DateTime, ForeignKey, Column, String, Integer, Float, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 
 from app.db.database import Base
 
@@ -10,6 +10,10 @@ class Play(Base):
     id = Column(String(36), nullable=False, index= True, primary_key=True)
     photo = Column(String(255), nullable=True)
     processed_video = Column(String(255), nullable=True)
+    # Uploaded clip, the processed video is rendered from it on demand
+    original_video = Column(String(255), nullable=True)
+    # Raw outputs of the models, the play is analysed again from them without running the models
+    detections = Column(String(255), nullable=True)
     angle = Column(Integer, nullable=False)
     distance = Column(Float, nullable=False)
     success = Column(Boolean, nullable=False)
@@ -18,6 +22,8 @@ class Play(Base):
     pocket = Column(String(36), nullable=False)
     creation_date = Column(DateTime, nullable=False)
     ball_paths = Column(JSON, nullable=True) 
+    # Tracks of every ball frame by frame, deferred so listing plays does not load them
+    trajectories = deferred(Column(JSON, nullable=True))
     
     project_id = Column(String(36), ForeignKey('projects.id'), nullable=False)
     project = relationship("Project", back_populates="plays")
@@ -0,0 +1,52 @@
+from sqlalchemy import JSON, DateTime, Column, String, Integer, Boolean, Text
+from enum import Enum
+
+from app.db.database import Base
+
+
+class JobStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class PlayJob(Base):
+    # Kept in the database so every API worker can answer its polls and queued jobs survive a restart
+    __tablename__= "play_jobs"
+
+    id = Column(String(36), nullable=False, index= True, primary_key=True)
+    project_id = Column(String(36), nullable=False)
+    user_id = Column(String(36), nullable=False, index= True)
+    pocket = Column(String(36), nullable=False)
+    video_path = Column(String(255), nullable=False)
+    render = Column(Boolean, nullable=False, default=True)
+    status = Column(String(10), nullable=False, index= True, default=JobStatus.QUEUED.value)
+    creation_date = Column(DateTime, nullable=False)
+    start_date = Column(DateTime, nullable=True)
+    end_date = Column(DateTime, nullable=True)
+    # Process running the job and the last time it reported being alive, jobs of a worker that died are queued again
+    worker = Column(String(64), nullable=True)
+    heartbeat_date = Column(DateTime, nullable=True)
+    play_id = Column(String(36), nullable=True)
+    status_code = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    metrics = Column(JSON, nullable=True)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JobStatus.DONE.value, JobStatus.FAILED.value)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "project_id": self.project_id,
+            "status": self.status,
+            "creation_date": self.creation_date,
+            "start_date": self.start_date,
+            "end_date": self.end_date,
+            "play_id": self.play_id,
+            "status_code": self.status_code,
+            "error": self.error,
+            "metrics": self.metrics if self.finished else None
+        }
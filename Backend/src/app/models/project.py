@@ -1,4 +1,4 @@
-from sqlalchemy import ForeignKey, Column, String, DateTime
+from sqlalchemy import JSON, ForeignKey, Column, String, DateTime, Boolean
 from sqlalchemy.orm import relationship
 from statistics import mean, stdev
 from collections import defaultdict
@@ -21,6 +21,10 @@ class Project(Base):
     photo = Column(String(255), nullable=False)
     creation_date = Column(DateTime, nullable=False)
     description = Column(String(255), nullable=True)
+    # Plays of the project only get statistics, no annotated video is rendered
+    analysis_only = Column(Boolean, nullable=False, default=False)
+    # Homography and table keypoints of the last play, reused while the camera stays in the same place
+    calibration = Column(JSON, nullable=True)
     
     user_id = Column(String(36), ForeignKey('users.id'), nullable=False)
     user = relationship("User", back_populates="projects")
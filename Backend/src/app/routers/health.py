@@ -0,0 +1,38 @@
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import JSONResponse
+
+from app.utils.inference import WARM_UP_MODELS, get_models_state, models_ready
+
+from app.utils.logger import configure_logging
+from app.utils.literals import (
+    INTERNAL_SERVER_ERROR,
+    ERROR_500,
+    MODELS_NOT_READY,
+)
+
+import logging
+
+
+configure_logging()
+
+health_router = APIRouter(prefix="/health",tags=["Health"])
+
+
+ready_responses = {
+    503: {'description': MODELS_NOT_READY},
+}
+@health_router.get("/ready", status_code=status.HTTP_200_OK, responses= {**ERROR_500, **ready_responses})
+async def ready():
+    try:
+        ready = models_ready()
+        state = {"ready": ready, "warm_up": WARM_UP_MODELS, "models": get_models_state()}
+        
+        # Workers that warm up their models are not ready until the models are loaded, the rest load them lazily
+        if WARM_UP_MODELS and not ready:
+            return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"detail": MODELS_NOT_READY, **state})
+        
+        return state
+    
+    except Exception as e:
+        logging.error(f"Error fetching readiness: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"{INTERNAL_SERVER_ERROR}:{str(e)}")
@@ -0,0 +1,99 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from typing import Annotated
+
+from app.models.play import Play
+from app.models.play_job import JobStatus, PlayJob
+
+from app.routers.oauth import  get_current_user
+
+from app.schemas.users import User
+
+from app.db.database import get_db
+
+from app.utils.logger import configure_logging
+from app.utils.literals import (
+    INTERNAL_SERVER_ERROR,
+    HTTP_EXCEPTION,
+    ERROR_500,
+    JOB_NOT_FINISHED,
+    JOB_NOT_FOUND,
+    PLAY_NOT_FOUND,
+    YOU_ARE_NOT_THE_OWNER
+)
+
+import logging
+
+
+configure_logging()
+
+jobs_router = APIRouter(prefix="/jobs",tags=["Jobs"])
+db_dependency = Annotated[Session, Depends(get_db)]
+current_user = Annotated[User, Depends(get_current_user)]
+
+
+def get_user_job(job_id: str, db: Session, current_user: User):
+    job = db.query(PlayJob).filter(PlayJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=JOB_NOT_FOUND)
+
+    if job.user_id != current_user.user.id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=YOU_ARE_NOT_THE_OWNER)
+
+    return job
+
+
+get_job_responses = {
+    400: {'description': YOU_ARE_NOT_THE_OWNER},
+    404: {'description': JOB_NOT_FOUND},
+}
+@jobs_router.get("/{job_id}", status_code=status.HTTP_200_OK, responses= {**ERROR_500, **get_job_responses})
+async def get_job(job_id: str, db: db_dependency, current_user: current_user):
+    try:
+        logging.info(f"Fetching job")
+
+        job = get_user_job(job_id, db, current_user)
+
+        return job.to_dict()
+
+    except HTTPException as http_exception:
+        logging.error(f"Error fetching job\nError: {HTTP_EXCEPTION}: {http_exception.detail}")
+        raise http_exception
+
+    except Exception as e:
+        logging.error(f"Error fetching job: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"{INTERNAL_SERVER_ERROR}:{str(e)}")
+
+
+get_job_play_responses = {
+    400: {'description': YOU_ARE_NOT_THE_OWNER},
+    404: {'description': JOB_NOT_FOUND},
+    409: {'description': JOB_NOT_FINISHED},
+}
+@jobs_router.get("/{job_id}/play", status_code=status.HTTP_200_OK, responses= {**ERROR_500, **get_job_play_responses})
+async def get_job_play(job_id: str, db: db_dependency, current_user: current_user):
+    try:
+        logging.info(f"Fetching play of job")
+
+        job = get_user_job(job_id, db, current_user)
+
+        if job.status == JobStatus.FAILED.value:
+            raise HTTPException(status_code=job.status_code, detail=job.error)
+
+        if job.status != JobStatus.DONE.value:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=JOB_NOT_FINISHED)
+
+        play = db.query(Play).filter(Play.id == job.play_id).first()
+        if not play:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=PLAY_NOT_FOUND)
+
+        logging.info(f"Play of job found")
+        return play
+
+    except HTTPException as http_exception:
+        logging.error(f"Error fetching play of job\nError: {HTTP_EXCEPTION}: {http_exception.detail}")
+        raise http_exception
+
+    except Exception as e:
+        logging.error(f"Error fetching play of job: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"{INTERNAL_SERVER_ERROR}:{str(e)}")
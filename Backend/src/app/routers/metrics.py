@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Annotated
+
+from app.routers.oauth import get_current_admin
+
+from app.schemas.users import User
+
+from app.utils.inference import get_models_state
+from app.utils.jobs import play_job_queue
+from app.utils.profiling import pipeline_metrics
+
+from app.utils.logger import configure_logging
+from app.utils.literals import (
+    INTERNAL_SERVER_ERROR,
+    HTTP_EXCEPTION,
+    ERROR_500,
+    YOU_ARE_NOT_ADMIN
+)
+
+import logging
+
+
+configure_logging()
+
+metrics_router = APIRouter(prefix="/metrics",tags=["Metrics"])
+current_admin = Annotated[User, Depends(get_current_admin)]
+
+
+get_metrics_responses = {
+    403: {'description': YOU_ARE_NOT_ADMIN},
+}
+@metrics_router.get("", status_code=status.HTTP_200_OK, responses= {**ERROR_500, **get_metrics_responses})
+async def get_metrics(current_admin: current_admin):
+    try:
+        # Totals of the videos processed by this worker since it started, every job has its own in /jobs/{job_id}
+        return {
+            "pipeline": pipeline_metrics.to_dict(),
+            "play_jobs": play_job_queue.to_dict(),
+            "models": get_models_state()
+        }
+
+    except HTTPException as http_exception:
+        logging.error(f"Error fetching metrics\nError: {HTTP_EXCEPTION}: {http_exception.detail}")
+        raise http_exception
+
+    except Exception as e:
+        logging.error(f"Error fetching metrics: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"{INTERNAL_SERVER_ERROR}:{str(e)}")
@@ -21,6 +21,7 @@ from app.utils.literals import (
     HTTP_EXCEPTION,
     ERROR_500,
     PLEASE_LOGIN_AGAIN,
+    YOU_ARE_NOT_ADMIN,
 )
 import os, bcrypt
 
@@ -28,6 +29,8 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
+# Emails of the users allowed to use the admin endpoints, separated by commas
+ADMIN_EMAILS = [email.strip() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()]
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
@@ -88,6 +91,11 @@ async def get_current_active_user(current_user: Annotated[User, Depends(get_curr
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=INACTIVE_USER)
     return current_user
 
+async def get_current_admin(current_user: Annotated[User, Depends(get_current_active_user)]):
+    if current_user.user.email not in ADMIN_EMAILS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=YOU_ARE_NOT_ADMIN)
+    return current_user
+
 @oAuth2_router.post("/login", response_model=Token)
 async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()],db: db_dependency):
 
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import FileResponse 
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session, joinedload
 from typing import Annotated
 
@@ -13,16 +14,21 @@ from app.schemas.users import User
 from app.db.database import get_db
 
 from app.utils.logger import configure_logging
+from app.utils.reanalysis import reanalyse_play
+from app.utils.uploads import remove_play_files
+from app.utils.video_cache import rendered_video_cache
+from app.utils.video_process import render_play_video
 from app.utils.literals import (
     INTERNAL_SERVER_ERROR,
     HTTP_EXCEPTION,
     ERROR_500,
+    DETECTIONS_NOT_FOUND,
     PLAY_NOT_FOUND,
     VIDEO_NOT_FOUND,
     YOU_ARE_NOT_THE_OWNER
 )
 
-import os, logging
+import functools, os, logging
 
 
 configure_logging()
@@ -45,8 +51,15 @@ async def get_video(play_id: str, db: db_dependency):
         if not play:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=PLAY_NOT_FOUND)
         
-        video_path = f"{play.processed_video}"
-        if not os.path.exists(video_path):
+        if play.processed_video and os.path.exists(play.processed_video):
+            video_path = play.processed_video
+        
+        elif play.original_video and os.path.exists(play.original_video) and play.trajectories:
+            # Rendered the first time it is watched and kept in the cache while it is watched often
+            render = functools.partial(render_play_video, play.original_video, play.trajectories)
+            video_path = await run_in_threadpool(rendered_video_cache.get_or_render, play.id, render)
+        
+        else:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=VIDEO_NOT_FOUND)
 
         logging.info(f"Fetched video")
@@ -139,6 +152,7 @@ async def delete_play(play_id:str, db: db_dependency, current_user: current_user
             
         db.delete(play)
         db.commit()
+        remove_play_files(play)
         logging.info(f"Play deleted seccessfully")
         
     except HTTPException as http_exception:
@@ -150,3 +164,37 @@ async def delete_play(play_id:str, db: db_dependency, current_user: current_user
         db.rollback()
         logging.error(f"Error deleting play: {str(e)}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"{INTERNAL_SERVER_ERROR}:{str(e)}")
+
+
+reanalyse_play_responses = {
+    400: {'description': YOU_ARE_NOT_THE_OWNER},
+    404: {'description': f"{PLAY_NOT_FOUND} / {DETECTIONS_NOT_FOUND}"},
+}
+@plays_router.post("/{play_id}/reanalyse", status_code=status.HTTP_200_OK, responses= {**ERROR_500, **reanalyse_play_responses})
+async def reanalyse(play_id:str, db: db_dependency, current_user: current_user):
+    try:
+        logging.info(f"Reanalysing play")
+        
+        play = db.query(Play).filter(Play.id == play_id).options(joinedload(Play.project)).first()
+        if not play:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=PLAY_NOT_FOUND)
+        
+        if play.project.user_id != current_user.user.id:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=YOU_ARE_NOT_THE_OWNER)
+        
+        # Tracks and statistics are built again from the recorded detections, the models are not run
+        changes = await run_in_threadpool(reanalyse_play, play)
+        db.commit()
+        
+        logging.info(f"Play reanalysed, changed {list(changes)}")
+        return {"play_id": play.id, "changes": changes}
+        
+    except HTTPException as http_exception:
+        db.rollback()
+        logging.error(f"Error reanalysing play\nError: {HTTP_EXCEPTION}: {http_exception.detail}")
+        raise http_exception
+    
+    except Exception as e:
+        db.rollback()
+        logging.error(f"Error reanalysing play: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"{INTERNAL_SERVER_ERROR}:{str(e)}")
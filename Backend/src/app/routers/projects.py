@@ -15,16 +15,18 @@ from app.routers.oauth import  get_current_user
 
 from app.schemas.users import User
 
-from app.utils.video_process import process_statistics, process_video
+from app.utils.jobs import play_job_queue
+from app.utils.uploads import remove_play_files, remove_spooled_video, spool_video_upload
+from app.utils.video_probe import probe_video
 
 from app.utils.logger import configure_logging
 from app.utils.literals import (
     INTERNAL_SERVER_ERROR,
     HTTP_EXCEPTION,
     ERROR_500,
-    NOT_POSSIBLE_TO_RECOGNISE_PLAY_OF_VIDEO,
+    PLAY_QUEUE_IS_FULL,
     PROJECT_NOT_FOUND,
-    VIDEO_TOO_LONG,
+    VIDEO_TOO_BIG,
     YOU_ARE_NOT_THE_OWNER
 )
 
@@ -43,7 +45,7 @@ current_user = Annotated[User, Depends(get_current_user)]
 
 
 @projects_router.post("/new", status_code=status.HTTP_200_OK, responses= {**ERROR_500})
-async def new_project(db: db_dependency, current_user: current_user, name: str = Form(...), description:str = Form(...), photo: UploadFile = File(...)):
+async def new_project(db: db_dependency, current_user: current_user, name: str = Form(...), description:str = Form(...), photo: UploadFile = File(...), analysis_only: bool = Form(False)):
     try:
         logging.info(f"Creating project")
         
@@ -52,7 +54,7 @@ async def new_project(db: db_dependency, current_user: current_user, name: str =
         with open(photo_path, "wb") as image_file:
             image_file.write(photo.file.read())
 
-        new_project = Project(id =str(uuid.uuid4()), creation_date = datetime.now(), photo = photo_path, name = name, description = description, user = current_user.user)
+        new_project = Project(id =str(uuid.uuid4()), creation_date = datetime.now(), photo = photo_path, name = name, description = description, analysis_only = analysis_only, user = current_user.user)
         db.add(new_project)
         db.commit()
         
@@ -77,7 +79,7 @@ update_project_responses = {
 @projects_router.patch("/update", status_code=status.HTTP_200_OK, responses= {**ERROR_500, **update_project_responses})
 async def update_project(
     db: db_dependency, current_user: current_user, project_id: str = Form(...),
-    name: str = Form(None), description: str = Form(None), photo: UploadFile = File(None)):
+    name: str = Form(None), description: str = Form(None), photo: UploadFile = File(None), analysis_only: bool = Form(None)):
     
     try:
         logging.info(f"Updating project")
@@ -102,6 +104,8 @@ async def update_project(
             project.name = name
         if description:
             project.description = description
+        if analysis_only is not None:
+            project.analysis_only = analysis_only
         
         db.commit()
         db.refresh(project)
@@ -190,11 +194,14 @@ async def delete_project(project_id:str, db: db_dependency, current_user: curren
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=YOU_ARE_NOT_THE_OWNER)
         
         logging.info(f"Deleting plays")
-        for play in project.plays:
+        plays = list(project.plays)
+        for play in plays:
             db.delete(play)
             
         db.delete(project)
         db.commit()
+        for play in plays:
+            remove_play_files(play)
         logging.info(f"Project deleted")
         
     except HTTPException as http_exception:
@@ -247,49 +254,46 @@ async def get_plays_of_project(project_id:str, db: db_dependency, current_user:
 
 
 creating_play_responses = {
-    400: {'description': NOT_POSSIBLE_TO_RECOGNISE_PLAY_OF_VIDEO},
-    400: {'description': VIDEO_TOO_LONG},
     400: {'description': YOU_ARE_NOT_THE_OWNER},
     404: {'description': PROJECT_NOT_FOUND},
+    413: {'description': VIDEO_TOO_BIG},
+    503: {'description': PLAY_QUEUE_IS_FULL},
 }
-@projects_router.post("/{project_id}/new_play", status_code=status.HTTP_200_OK, responses= {**ERROR_500, **creating_play_responses})
-async def new_play(project_id:str, db: db_dependency, current_user: current_user, video_file: UploadFile = File(...), pocket: Pocket = Form(...)):
+@projects_router.post("/{project_id}/new_play", status_code=status.HTTP_202_ACCEPTED, responses= {**ERROR_500, **creating_play_responses})
+async def new_play(project_id:str, db: db_dependency, current_user: current_user, video_file: UploadFile = File(...), pocket: Pocket = Form(...), analysis_only: bool = Form(None)):
+    video_path = None
     try:
+        logging.info(f"Creating play")
+        
         project = db.query(Project).filter(Project.id == project_id).first()
         if not project:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=PROJECT_NOT_FOUND)
         
         if project.user != current_user.user:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=YOU_ARE_NOT_THE_OWNER)
-            
-        video_info, photo_path, processed_video_path = process_video(video_file)
-        
-        distance, angle, first_color_ball, second_color_ball, success, ball_paths = process_statistics(video_info, pocket)
-        
-        new_play = Play(id =str(uuid.uuid4()), 
-                        project = project, 
-                        photo = photo_path, 
-                        angle = angle, 
-                        distance = distance, 
-                        processed_video = processed_video_path,
-                        success = success, 
-                        first_color_ball = first_color_ball, 
-                        second_color_ball = second_color_ball, 
-                        pocket = pocket.value, 
-                        ball_paths = ball_paths, 
-                        creation_date = datetime.now())
-        
-        db.add(new_play)
-        db.commit()
-        return distance, angle, first_color_ball, second_color_ball, success
+        
+        video_path = await spool_video_upload(video_file)
+        
+        # Videos that can not be analysed are rejected before they are queued
+        probe_video(video_path).check()
+        
+        # Without a value for the play the project decides if the annotated video is rendered
+        if analysis_only is None:
+            analysis_only = project.analysis_only
+        
+        # The video is processed by the play workers, the client polls the job until it is done
+        job = play_job_queue.submit(db, project_id=project.id, user_id=current_user.user.id, pocket=pocket, video_path=video_path, render=not analysis_only)
+        
+        logging.info(f"Play queued")
+        return job.to_dict()
         
     except HTTPException as http_exception:
-        db.rollback()
+        remove_spooled_video(video_path)
         logging.error(f"Error creating play\nError: {HTTP_EXCEPTION}: {http_exception.detail}")
         raise http_exception
     
     except Exception as e:
-        db.rollback()
+        remove_spooled_video(video_path)
         logging.error(f"Error creating play: {str(e)}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"{INTERNAL_SERVER_ERROR}:{str(e)}")
 
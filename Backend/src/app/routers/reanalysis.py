@@ -0,0 +1,119 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Annotated
+
+from app.routers.oauth import get_current_admin
+
+from app.schemas.users import User
+
+from app.utils.reanalysis import ReanalysisRun, ReanalysisSource, reanalysis_runner
+
+from app.utils.logger import configure_logging
+from app.utils.literals import (
+    INTERNAL_SERVER_ERROR,
+    HTTP_EXCEPTION,
+    ERROR_500,
+    REANALYSIS_ALREADY_RUNNING,
+    REANALYSIS_NOT_FOUND,
+    YOU_ARE_NOT_ADMIN
+)
+
+import logging
+
+
+configure_logging()
+
+reanalysis_router = APIRouter(prefix="/reanalysis",tags=["Reanalysis"])
+current_admin = Annotated[User, Depends(get_current_admin)]
+
+
+def get_reanalysis_run(run_id: str) -> ReanalysisRun:
+    run = ReanalysisRun.load(run_id)
+    if not run:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=REANALYSIS_NOT_FOUND)
+    return run
+
+
+def start_reanalysis_run(run: ReanalysisRun):
+    if not reanalysis_runner.start(run):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=REANALYSIS_ALREADY_RUNNING)
+    return run.to_dict()
+
+
+start_reanalysis_responses = {
+    403: {'description': YOU_ARE_NOT_ADMIN},
+    409: {'description': REANALYSIS_ALREADY_RUNNING},
+}
+@reanalysis_router.post("", status_code=status.HTTP_202_ACCEPTED, responses= {**ERROR_500, **start_reanalysis_responses})
+async def start_reanalysis(current_admin: current_admin, source: ReanalysisSource = ReanalysisSource.TRAJECTORIES, dry_run: bool = False):
+    try:
+        logging.info(f"Starting reanalysis of every play")
+
+        # Runs in the background, its progress is polled in /reanalysis/{run_id}
+        return start_reanalysis_run(ReanalysisRun.create(source, dry_run=dry_run))
+
+    except HTTPException as http_exception:
+        logging.error(f"Error starting reanalysis\nError: {HTTP_EXCEPTION}: {http_exception.detail}")
+        raise http_exception
+
+    except Exception as e:
+        logging.error(f"Error starting reanalysis: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"{INTERNAL_SERVER_ERROR}:{str(e)}")
+
+
+resume_reanalysis_responses = {
+    403: {'description': YOU_ARE_NOT_ADMIN},
+    404: {'description': REANALYSIS_NOT_FOUND},
+    409: {'description': REANALYSIS_ALREADY_RUNNING},
+}
+@reanalysis_router.post("/{run_id}/resume", status_code=status.HTTP_202_ACCEPTED, responses= {**ERROR_500, **resume_reanalysis_responses})
+async def resume_reanalysis(run_id: str, current_admin: current_admin):
+    try:
+        logging.info(f"Resuming reanalysis")
+
+        # Continues after the last chunk saved, the plays already reanalysed are not read again
+        return start_reanalysis_run(get_reanalysis_run(run_id))
+
+    except HTTPException as http_exception:
+        logging.error(f"Error resuming reanalysis\nError: {HTTP_EXCEPTION}: {http_exception.detail}")
+        raise http_exception
+
+    except Exception as e:
+        logging.error(f"Error resuming reanalysis: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"{INTERNAL_SERVER_ERROR}:{str(e)}")
+
+
+get_reanalysis_responses = {
+    403: {'description': YOU_ARE_NOT_ADMIN},
+    404: {'description': REANALYSIS_NOT_FOUND},
+}
+@reanalysis_router.get("/{run_id}", status_code=status.HTTP_200_OK, responses= {**ERROR_500, **get_reanalysis_responses})
+async def get_reanalysis(run_id: str, current_admin: current_admin):
+    try:
+        logging.info(f"Fetching reanalysis")
+
+        return get_reanalysis_run(run_id).to_dict()
+
+    except HTTPException as http_exception:
+        logging.error(f"Error fetching reanalysis\nError: {HTTP_EXCEPTION}: {http_exception.detail}")
+        raise http_exception
+
+    except Exception as e:
+        logging.error(f"Error fetching reanalysis: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"{INTERNAL_SERVER_ERROR}:{str(e)}")
+
+
+@reanalysis_router.get("/{run_id}/changes", status_code=status.HTTP_200_OK, responses= {**ERROR_500, **get_reanalysis_responses})
+async def get_reanalysis_changes(run_id: str, current_admin: current_admin, offset: int = 0, limit: int = 100):
+    try:
+        logging.info(f"Fetching reanalysis changes")
+
+        # Only the plays whose statistics changed or could not be reanalysed
+        return get_reanalysis_run(run_id).get_changes(offset, limit)
+
+    except HTTPException as http_exception:
+        logging.error(f"Error fetching reanalysis changes\nError: {HTTP_EXCEPTION}: {http_exception.detail}")
+        raise http_exception
+
+    except Exception as e:
+        logging.error(f"Error fetching reanalysis changes: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"{INTERNAL_SERVER_ERROR}:{str(e)}")
@@ -0,0 +1,94 @@
+from dotenv import load_dotenv
+from typing import List, Optional, Tuple
+
+from app.models.annotators import Detection, Rect
+
+import base64, uuid, os, cv2, numpy as np
+
+
+load_dotenv()
+
+# Minimum normalised correlation between the first frame of a video and the frame a project was calibrated with
+CALIBRATION_SIMILARITY_THRESHOLD = float(os.getenv("CALIBRATION_SIMILARITY_THRESHOLD", 0.9))
+CALIBRATION_THUMBNAIL_WIDTH = 64
+# Fraction of the table size added around it, balls on the cushions and small homography errors stay inside
+TABLE_REGION_MARGIN = float(os.getenv("TABLE_REGION_MARGIN", 0.05))
+
+
+def get_calibration_thumbnail(frame: np.ndarray) -> np.ndarray:
+    # Small blurred grey version of the frame, balls barely change it while a moved camera does
+    height, width = frame.shape[:2]
+    thumbnail_size = (CALIBRATION_THUMBNAIL_WIDTH, max(1, round(CALIBRATION_THUMBNAIL_WIDTH * height / width)))
+    thumbnail = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), thumbnail_size, interpolation=cv2.INTER_AREA)
+    return cv2.GaussianBlur(thumbnail, (3, 3), 0)
+
+
+def create_calibration(frame: np.ndarray, homography: np.ndarray, keypoints_prediction) -> dict:
+    _, thumbnail = cv2.imencode('.png', get_calibration_thumbnail(frame))
+    return {
+        "frame_size": [frame.shape[1], frame.shape[0]],
+        "homography": homography.tolist(),
+        "keypoints": [
+            {"xyxy": [float(value) for value in xyxy], "class_id": int(class_id), "class_name": keypoints_prediction.names[int(class_id)], "confidence": float(conf)}
+            for xyxy, class_id, conf in zip(keypoints_prediction.boxes.xyxy.tolist(), keypoints_prediction.boxes.cls.tolist(), keypoints_prediction.boxes.conf.tolist())
+        ],
+        "thumbnail": base64.b64encode(thumbnail.tobytes()).decode("ascii")
+    }
+
+
+def calibration_matches(calibration: dict, frame: np.ndarray) -> bool:
+    if not calibration or calibration.get("frame_size") != [frame.shape[1], frame.shape[0]]:
+        return False
+
+    stored_thumbnail = cv2.imdecode(np.frombuffer(base64.b64decode(calibration["thumbnail"]), dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    thumbnail = get_calibration_thumbnail(frame)
+    if stored_thumbnail is None or stored_thumbnail.shape != thumbnail.shape:
+        return False
+
+    similarity = cv2.matchTemplate(thumbnail, stored_thumbnail, cv2.TM_CCOEFF_NORMED)[0][0]
+    return similarity >= CALIBRATION_SIMILARITY_THRESHOLD
+
+
+def get_calibration_homography(calibration: dict) -> np.ndarray:
+    return np.array(calibration["homography"], dtype=np.float64)
+
+
+def get_calibration_keypoints_detections(calibration: dict) -> List[Detection]:
+    result = []
+    for keypoint in calibration["keypoints"]:
+        x_min, y_min, x_max, y_max = keypoint["xyxy"]
+        result.append(Detection(
+            id = str(uuid.uuid4()),
+            rect=Rect(x=x_min, y=y_min, width=x_max - x_min, height=y_max - y_min),
+            class_id=keypoint["class_id"],
+            abled = True,
+            centers_list = [],
+            centers_minimap_list = [],
+            frames_list = [],
+            rects_list = [],
+            colors_list=[keypoint["class_name"]],
+            class_name=keypoint["class_name"],
+            confidence=keypoint["confidence"]
+        ))
+    return result
+
+
+def get_table_region(homography: np.ndarray, frame_width: int, frame_height: int, table_map_size: Tuple[int, int]) -> Optional[Tuple[int, int, int, int]]:
+    # Bounding box (x, y, width, height) in the frame of the table map corners, None if it is not usable
+    map_width, map_height = table_map_size
+    corners = np.array([[[0, 0]], [[map_width, 0]], [[map_width, map_height]], [[0, map_height]]], dtype=np.float64)
+    try:
+        frame_corners = cv2.perspectiveTransform(corners, np.linalg.inv(homography))[:, 0]
+    except np.linalg.LinAlgError:
+        return None
+    if not np.all(np.isfinite(frame_corners)):
+        return None
+
+    x_min, y_min = frame_corners.min(axis=0)
+    x_max, y_max = frame_corners.max(axis=0)
+    margin_x, margin_y = (x_max - x_min) * TABLE_REGION_MARGIN, (y_max - y_min) * TABLE_REGION_MARGIN
+    x_min, y_min = max(0, int(x_min - margin_x)), max(0, int(y_min - margin_y))
+    x_max, y_max = min(frame_width, int(np.ceil(x_max + margin_x))), min(frame_height, int(np.ceil(y_max + margin_y)))
+    if x_max - x_min < 32 or y_max - y_min < 32:
+        return None
+    return x_min, y_min, x_max - x_min, y_max - y_min
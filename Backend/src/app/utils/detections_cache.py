@@ -0,0 +1,173 @@
+from dotenv import load_dotenv
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.utils.inference_backends import BoxArray, Boxes, Prediction
+from app.utils.video_probe import VideoProbe
+
+import json, os, uuid, numpy as np
+
+
+load_dotenv()
+
+# Raw outputs of the models of every play, the play is analysed again from them without the video or the models, kept out of the public static/
+DETECTIONS_DIRECTORY = os.getenv("DETECTIONS_DIRECTORY", "data/detections/")
+SAVE_DETECTIONS = os.getenv("SAVE_DETECTIONS", "True").lower() == "true"
+DETECTIONS_FORMAT_VERSION = 1
+
+
+def get_detections_path(play_id: str) -> str:
+    return os.path.join(DETECTIONS_DIRECTORY, f'{play_id}.npz')
+
+
+class ModelOutputs:
+    # Boxes of many predictions of a model in flat arrays, the boxes of prediction i are the rows offsets[i] to offsets[i + 1]
+    def __init__(self, xyxy: np.ndarray = None, cls: np.ndarray = None, conf: np.ndarray = None, offsets: np.ndarray = None):
+        self.xyxy = [] if xyxy is None else xyxy
+        self.cls = [] if cls is None else cls
+        self.conf = [] if conf is None else conf
+        self.offsets = [0] if offsets is None else offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def add(self, prediction) -> int:
+        boxes = prediction.boxes
+        self.xyxy.append(np.asarray(boxes.xyxy.cpu().numpy(), dtype=np.float32).reshape(-1, 4))
+        self.cls.append(np.asarray(boxes.cls.cpu().numpy(), dtype=np.int16))
+        self.conf.append(np.asarray(boxes.conf.cpu().numpy(), dtype=np.float32))
+        self.offsets.append(self.offsets[-1] + len(self.cls[-1]))
+        return len(self) - 1
+
+    def to_arrays(self, prefix: str) -> Dict[str, np.ndarray]:
+        return {
+            f"{prefix}_xyxy": np.concatenate(self.xyxy) if self.xyxy else np.empty((0, 4), dtype=np.float32),
+            f"{prefix}_cls": np.concatenate(self.cls) if self.cls else np.empty(0, dtype=np.int16),
+            f"{prefix}_conf": np.concatenate(self.conf) if self.conf else np.empty(0, dtype=np.float32),
+            f"{prefix}_offsets": np.asarray(self.offsets, dtype=np.int32)
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix: str) -> "ModelOutputs":
+        return cls(xyxy=arrays[f"{prefix}_xyxy"], cls=arrays[f"{prefix}_cls"], conf=arrays[f"{prefix}_conf"], offsets=arrays[f"{prefix}_offsets"])
+
+    def get_prediction(self, index: int, names: Dict[int, str]) -> Prediction:
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return Prediction(
+            boxes=Boxes(xyxy=self.xyxy[start:end].view(BoxArray), conf=self.conf[start:end].view(BoxArray), cls=self.cls[start:end].astype(np.float32).view(BoxArray)),
+            names=names
+        )
+
+
+class DetectionsRecorder:
+    """Raw outputs of the ball and keypoints models while a video is processed, saved compressed in a .npz file.
+
+    Every analysed frame points to its ball prediction, the frames reusing a prediction point to the same one
+    and the frames the tracker predicts point to none (-1).
+    """
+
+    def __init__(self):
+        self.ball_outputs = ModelOutputs()
+        self.ball_origins: List[Tuple[int, int]] = []
+        self.frame_predictions: List[int] = []
+        self.keypoints_outputs = ModelOutputs()
+        self.keypoints_frames: List[int] = []
+        self.ball_names = {}
+        self.keypoints_names = {}
+        self.calibration = None
+        self.video_probe = None
+        self.last_prediction = None
+
+    def add_ball_prediction(self, prediction, offset: Tuple[int, int]):
+        # Called once per analysed frame, in order
+        if prediction is None:
+            self.frame_predictions.append(-1)
+            return
+
+        if prediction is not self.last_prediction:
+            self.last_prediction = prediction
+            self.ball_outputs.add(prediction)
+            self.ball_origins.append(tuple(offset))
+            self.ball_names = prediction.names
+        self.frame_predictions.append(len(self.ball_outputs) - 1)
+
+    def add_keypoints_prediction(self, frame_nbr: int, prediction):
+        self.keypoints_outputs.add(prediction)
+        self.keypoints_frames.append(frame_nbr)
+        self.keypoints_names = prediction.names
+
+    def set_calibration(self, calibration: dict):
+        # The play reused the homography of the project, there are no keypoints predictions
+        self.calibration = {"homography": calibration["homography"], "keypoints": calibration["keypoints"]}
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        meta = {
+            "version": DETECTIONS_FORMAT_VERSION,
+            "video": self.video_probe.to_dict() if self.video_probe else None,
+            "ball_names": self.ball_names,
+            "keypoints_names": self.keypoints_names,
+            "calibration": self.calibration
+        }
+        return {
+            "meta": np.array(json.dumps(meta)),
+            "frame_predictions": np.asarray(self.frame_predictions, dtype=np.int32),
+            "ball_origins": np.asarray(self.ball_origins, dtype=np.int32).reshape(-1, 2),
+            "keypoints_frames": np.asarray(self.keypoints_frames, dtype=np.int32),
+            **self.ball_outputs.to_arrays("ball"),
+            **self.keypoints_outputs.to_arrays("keypoints")
+        }
+
+    def save(self, path: str) -> str:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Written next to its final path and moved, a reader never sees half a file
+        saving_path = f'{path}.{str(uuid.uuid4())}.npz'
+        try:
+            np.savez_compressed(saving_path, **self.to_arrays())
+            os.replace(saving_path, path)
+        finally:
+            if os.path.exists(saving_path):
+                os.remove(saving_path)
+        return path
+
+
+class RecordedDetections:
+    """Model outputs of a play loaded from its .npz file, replayed frame by frame like the models returned them."""
+
+    def __init__(self, arrays):
+        self.meta = json.loads(str(arrays["meta"]))
+        self.frame_predictions = arrays["frame_predictions"]
+        self.ball_origins = arrays["ball_origins"]
+        self.ball_outputs = ModelOutputs.from_arrays(arrays, "ball")
+        self.keypoints_outputs = ModelOutputs.from_arrays(arrays, "keypoints")
+        self.keypoints_frames = {int(frame_nbr): index for index, frame_nbr in enumerate(arrays["keypoints_frames"])}
+        # JSON object keys are strings, the models name their classes by int
+        self.ball_names = {int(class_id): name for class_id, name in self.meta["ball_names"].items()}
+        self.keypoints_names = {int(class_id): name for class_id, name in self.meta["keypoints_names"].items()}
+
+    @classmethod
+    def load(cls, path: str) -> "RecordedDetections":
+        with np.load(path, allow_pickle=False) as arrays:
+            return cls({name: arrays[name] for name in arrays.files})
+
+    @property
+    def video_probe(self) -> Optional[VideoProbe]:
+        return VideoProbe.from_dict(self.meta["video"]) if self.meta.get("video") else None
+
+    @property
+    def calibration(self) -> Optional[dict]:
+        return self.meta.get("calibration")
+
+    def get_keypoints_prediction(self, frame_nbr: int) -> Optional[Prediction]:
+        index = self.keypoints_frames.get(frame_nbr)
+        return None if index is None else self.keypoints_outputs.get_prediction(index, self.keypoints_names)
+
+    def ball_frames(self) -> Iterator[Tuple[int, Optional[Prediction], Tuple[int, int]]]:
+        # Every analysed frame with its ball prediction and the offset of its boxes, as generate_ball_predictions yields them
+        prediction, prediction_index, offset = None, -1, (0, 0)
+        for frame_nbr, index in enumerate(self.frame_predictions.tolist(), start=1):
+            if index < 0:
+                yield frame_nbr, None, offset
+                continue
+            if index != prediction_index:
+                prediction, prediction_index = self.ball_outputs.get_prediction(index, self.ball_names), index
+                offset = tuple(self.ball_origins[index].tolist())
+            yield frame_nbr, prediction, offset
@@ -0,0 +1,338 @@
+from concurrent.futures import Future
+from contextlib import contextmanager, nullcontext, suppress
+from dataclasses import dataclass, field
+from enum import Enum
+from dotenv import load_dotenv
+from typing import List
+
+from app.utils.inference_backends import INFERENCE_BACKEND, get_backend_route, load_model
+from app.utils.inference_service import INFERENCE_SERVICE_SOCKET, get_authkey, get_inference_client
+from app.utils.logger import configure_logging
+
+import threading, time, os, logging, numpy as np
+
+
+configure_logging()
+load_dotenv()
+
+KEYPOINTS_MODEL_ROUTE = os.getenv("KEYPOINTS_MODEL_ROUTE")
+COLOUR_BALL_MODEL_ROUTE = os.getenv("COLOUR_BALL_MODEL_ROUTE")
+# Load the models and run a dummy inference when the play workers start instead of on the first play
+WARM_UP_MODELS = os.getenv("WARM_UP_MODELS", "False").lower() == "true"
+WARM_UP_IMAGE_SIZE = 640
+# Input sizes of the models for whole frames, the keypoints are large enough to be found in smaller images than the balls
+BALL_DETECTION_IMAGE_SIZE = int(os.getenv("BALL_DETECTION_IMAGE_SIZE", 640))
+KEYPOINTS_DETECTION_IMAGE_SIZE = int(os.getenv("KEYPOINTS_DETECTION_IMAGE_SIZE", 480))
+# Instances of every model loaded by a process at most, whatever the number of threads using it
+MODEL_INSTANCES = int(os.getenv("MODEL_INSTANCES", 2))
+# Run the ball model calls of every play in one thread, the calls made while a batch runs form the next batch.
+# Only faster on GPUs, on CPUs the plays run their calls at the same time on separate instances
+BALL_MODEL_BATCHING = os.getenv("BALL_MODEL_BATCHING", "False").lower() == "true"
+BALL_MODEL_MAX_BATCH = int(os.getenv("BALL_MODEL_MAX_BATCH", 32))
+# Longest a call may wait for the calls of other plays when the model is idle, 0 runs it right away
+BALL_MODEL_MAX_WAIT_MS = float(os.getenv("BALL_MODEL_MAX_WAIT_MS", 0))
+
+
+class ModelState(Enum):
+    NOT_LOADED = "not_loaded"
+    LOADING = "loading"
+    READY = "ready"
+    FAILED = "failed"
+
+
+class LazyModel:
+    """YOLO model built on first use with the configured backend, its runtime is not imported until then.
+
+    Ultralytics predictors are not thread safe, so every call takes an instance of its own from a pool. The pool loads
+    at most max_instances of them as they are needed, the calls of other threads wait for one to be free.
+    """
+
+    def __init__(self, name: str, route: str, imgsz: int = None, max_instances: int = MODEL_INSTANCES):
+        self.name = name
+        self.route = route
+        self.imgsz = imgsz
+        self.max_instances = max_instances
+        self.state = ModelState.NOT_LOADED
+        self.error = None
+        self.load_seconds = None
+        self.instances = 0
+        self.lock = threading.Lock()
+        self.free_instances = threading.BoundedSemaphore(max_instances)
+        self.idle = []
+
+    @contextmanager
+    def get(self):
+        with self.free_instances:
+            with self.lock:
+                model = self.idle.pop() if self.idle else None
+            if model is None:
+                model = self.load()
+            try:
+                yield model
+            finally:
+                with self.lock:
+                    self.idle.append(model)
+
+    def load(self):
+        with self.lock:
+            if self.state != ModelState.READY:
+                self.state = ModelState.LOADING
+        try:
+            start = time.perf_counter()
+            model = load_model(self.route)
+            load_seconds = time.perf_counter() - start
+        except Exception as e:
+            with self.lock:
+                self.state = ModelState.FAILED
+                self.error = str(e)
+            logging.error(f"Error loading {self.name}: {str(e)}")
+            raise
+
+        with self.lock:
+            self.state = ModelState.READY
+            self.error = None
+            self.load_seconds = round(load_seconds, 3)
+            self.instances += 1
+        logging.info(f"Loaded {self.name} in {load_seconds:.2f}s")
+        return model
+
+    def warm_up(self):
+        # A dummy inference builds the predictor and initialises the kernels before the first real frame
+        dummy_frame = np.zeros((self.imgsz or WARM_UP_IMAGE_SIZE, self.imgsz or WARM_UP_IMAGE_SIZE, 3), dtype=np.uint8)
+        self(dummy_frame, verbose=False)
+
+    def __call__(self, *args, **kwargs):
+        if self.imgsz is not None:
+            kwargs.setdefault("imgsz", self.imgsz)
+        with self.get() as model:
+            return model(*args, **kwargs)
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "state": self.state.value,
+                "route": get_backend_route(self.route),
+                "backend": INFERENCE_BACKEND,
+                "imgsz": self.imgsz,
+                "instances": self.instances,
+                "max_instances": self.max_instances,
+                "load_seconds": self.load_seconds,
+                "error": self.error
+            }
+
+
+@dataclass
+class BatchRequest:
+    images: list
+    arguments: dict
+    time: float = field(default_factory=time.monotonic)
+    future: Future = field(default_factory=Future)
+
+
+class BatchedModel:
+    """Model shared by every play worker, its calls run in batches in the scheduler thread.
+
+    The calls made while a batch runs are taken together as the next one. With max_wait_ms an idle model also waits for
+    more calls, until the batch is full, its oldest call waited max_wait_ms or every play being processed is waiting.
+    Calls with different arguments (input sizes) wait together but run in separate model calls.
+    """
+
+    def __init__(self, model: LazyModel, max_batch: int = BALL_MODEL_MAX_BATCH, max_wait_ms: float = BALL_MODEL_MAX_WAIT_MS):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.condition = threading.Condition()
+        self.pending: List[BatchRequest] = []
+        self.jobs = 0
+        self.thread = None
+        self.batches = 0
+        self.batched_images = 0
+        self.largest_batch = 0
+
+    @property
+    def name(self) -> str:
+        return self.model.name
+
+    @property
+    def state(self) -> ModelState:
+        return self.model.state
+
+    @contextmanager
+    def job(self):
+        # A play is being processed, its calls are waited for before running a batch
+        with self.condition:
+            self.jobs += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.jobs -= 1
+                self.condition.notify_all()
+
+    def warm_up(self):
+        dummy_frame = np.zeros((self.model.imgsz or WARM_UP_IMAGE_SIZE, self.model.imgsz or WARM_UP_IMAGE_SIZE, 3), dtype=np.uint8)
+        self(dummy_frame, verbose=False)
+
+    def __call__(self, source, verbose: bool = False, **kwargs):
+        request = BatchRequest(images=[source] if isinstance(source, np.ndarray) else list(source), arguments=kwargs)
+        if not request.images:
+            return []
+
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._schedule, name=f"{self.name}-batcher", daemon=True)
+                self.thread.start()
+            self.pending.append(request)
+            self.condition.notify_all()
+        return request.future.result()
+
+    def _batch_ready(self) -> bool:
+        return sum(len(request.images) for request in self.pending) >= self.max_batch or len(self.pending) >= max(self.jobs, 1)
+
+    def _take_batch(self) -> List[BatchRequest]:
+        batch = [self.pending.pop(0)]
+        images = len(batch[0].images)
+        while self.pending and images + len(self.pending[0].images) <= self.max_batch:
+            images += len(self.pending[0].images)
+            batch.append(self.pending.pop(0))
+        return batch
+
+    def _schedule(self):
+        while True:
+            batch = []
+            try:
+                with self.condition:
+                    while not self.pending:
+                        self.condition.wait()
+                    deadline = self.pending[0].time + self.max_wait
+                    while not self._batch_ready() and time.monotonic() < deadline:
+                        self.condition.wait(deadline - time.monotonic())
+                    batch = self._take_batch()
+                self._predict(batch)
+            except Exception as e:
+                # Every play worker waits on this thread, a failing batch fails its calls and the thread goes on
+                logging.error(f"Error running a batch of {self.name}: {str(e)}")
+                if not batch:
+                    # The batch could not even be taken, the calls waiting for it fail instead of being retried forever
+                    with self.condition:
+                        batch, self.pending = self.pending, []
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+
+    def _predict(self, batch: List[BatchRequest]):
+        # Grouped by the text of the arguments, their values may not be hashable (classes=[...])
+        groups = {}
+        for request in batch:
+            groups.setdefault(repr(sorted(request.arguments.items())), []).append(request)
+
+        for requests in groups.values():
+            try:
+                predictions = self.model([image for request in requests for image in request.images], verbose=False, **requests[0].arguments)
+            except Exception as e:
+                for request in requests:
+                    request.future.set_exception(e)
+                continue
+
+            # Every call gets back the predictions of its images, in order
+            start = 0
+            for request in requests:
+                request.future.set_result(predictions[start:start + len(request.images)])
+                start += len(request.images)
+
+        with self.condition:
+            images = sum(len(request.images) for request in batch)
+            self.batches += 1
+            self.batched_images += images
+            self.largest_batch = max(self.largest_batch, images)
+
+    def to_dict(self):
+        state = self.model.to_dict()
+        with self.condition:
+            state["batching"] = {
+                "batches": self.batches,
+                "mean_batch": round(self.batched_images / self.batches, 2) if self.batches else None,
+                "largest_batch": self.largest_batch,
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000,
+                "jobs": self.jobs
+            }
+        return state
+
+
+class RemoteModel:
+    """Model run by the inference server, called like the local models and returning the same boxes.
+
+    The calls of every thread go through its own connection, their frames are copied once into its shared memory block.
+    """
+
+    def __init__(self, name: str, socket_path: str = INFERENCE_SERVICE_SOCKET):
+        self.name = name
+        self.socket_path = socket_path
+
+    @property
+    def state(self) -> ModelState:
+        return ModelState(self.to_dict()["state"])
+
+    @contextmanager
+    def job(self):
+        client = get_inference_client(self.socket_path)
+        client.request("job_start", model=self.name)
+        try:
+            yield
+        finally:
+            with suppress(Exception):
+                client.request("job_end", model=self.name)
+
+    def warm_up(self):
+        get_inference_client(self.socket_path).request("warm_up", model=self.name)
+
+    def __call__(self, source, verbose: bool = False, **kwargs):
+        images = [source] if isinstance(source, np.ndarray) else list(source)
+        if not images:
+            return []
+        return get_inference_client(self.socket_path).predict(self.name, images, kwargs)
+
+    def to_dict(self):
+        try:
+            state = get_inference_client(self.socket_path).request("state")[self.name]
+        except Exception as e:
+            state = {"state": ModelState.FAILED.value, "error": str(e)}
+        return {**state, "service": self.socket_path}
+
+
+def create_models():
+    # Models run by this process, the ball model batched when BALL_MODEL_BATCHING (GPU backends)
+    ball_model = LazyModel("ball_colour_model", COLOUR_BALL_MODEL_ROUTE, BALL_DETECTION_IMAGE_SIZE)
+    if BALL_MODEL_BATCHING:
+        ball_model = BatchedModel(ball_model)
+    return ball_model, LazyModel("keypoints_model", KEYPOINTS_MODEL_ROUTE, KEYPOINTS_DETECTION_IMAGE_SIZE)
+
+
+@contextmanager
+def play_job():
+    # Wraps the processing of a play so the batched models wait for its calls
+    with ball_colour_model.job() if hasattr(ball_colour_model, "job") else nullcontext():
+        yield
+
+
+if INFERENCE_SERVICE_SOCKET:
+    # The models are loaded once by the inference server, the API workers only send it the frames
+    get_authkey()
+    ball_colour_model, keypoints_model = RemoteModel("ball_colour_model"), RemoteModel("keypoints_model")
+else:
+    ball_colour_model, keypoints_model = create_models()
+MODELS = [ball_colour_model, keypoints_model]
+
+
+def warm_up_models():
+    for model in MODELS:
+        model.warm_up()
+
+
+def models_ready() -> bool:
+    return all(model.state == ModelState.READY for model in MODELS)
+
+
+def get_models_state():
+    return {model.name: model.to_dict() for model in MODELS}
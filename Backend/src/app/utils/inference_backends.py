@@ -0,0 +1,241 @@
+from dataclasses import dataclass
+from dotenv import load_dotenv
+from typing import Dict, List
+
+from app.utils.logger import configure_logging
+
+import ast, glob, os, logging, cv2, numpy as np
+
+
+configure_logging()
+load_dotenv()
+
+# ultralytics runs the .pt models with PyTorch, onnx and openvino run the models exported next to them
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "ultralytics").lower()
+# Threads of every model instance, 0 lets the runtime decide
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", 0))
+# Use the INT8 quantised export of the models
+INFERENCE_INT8 = os.getenv("INFERENCE_INT8", "False").lower() == "true"
+
+BACKENDS = ["ultralytics", "onnx", "openvino"]
+# Same defaults as ultralytics predictions
+CONFIDENCE_THRESHOLD = 0.25
+IOU_THRESHOLD = 0.7
+MAX_DETECTIONS = 300
+LETTERBOX_COLOR = (114, 114, 114)
+
+
+class BoxArray(np.ndarray):
+    # numpy array with the tensor methods used on ultralytics boxes
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return np.asarray(self)
+
+
+@dataclass
+class Boxes:
+    xyxy: BoxArray
+    conf: BoxArray
+    cls: BoxArray
+
+    @property
+    def xywh(self) -> BoxArray:
+        xyxy = np.asarray(self.xyxy)
+        return np.concatenate([(xyxy[:, :2] + xyxy[:, 2:]) / 2, xyxy[:, 2:] - xyxy[:, :2]], axis=1).view(BoxArray)
+
+    def __len__(self):
+        return len(self.cls)
+
+
+@dataclass
+class Prediction:
+    # The part of an ultralytics Results the video processing uses
+    boxes: Boxes
+    names: Dict[int, str]
+
+
+def get_backend_route(route: str, backend: str = INFERENCE_BACKEND, int8: bool = INFERENCE_INT8) -> str:
+    # Exported models are next to the .pt one, named as ultralytics exports them
+    if not route:
+        return route
+    stem = os.path.splitext(route)[0]
+    suffix = "_int8" if int8 else ""
+    if backend == "onnx":
+        return f"{stem}{suffix}.onnx"
+    if backend == "openvino":
+        return f"{stem}{suffix}_openvino_model"
+    return route
+
+
+def letterbox(image: np.ndarray, size: int):
+    # Resized keeping its aspect ratio and padded to a size x size square, like ultralytics does
+    height, width = image.shape[:2]
+    gain = min(size / height, size / width)
+    resized_width, resized_height = round(width * gain), round(height * gain)
+    pad_x, pad_y = (size - resized_width) / 2, (size - resized_height) / 2
+    if (resized_width, resized_height) != (width, height):
+        image = cv2.resize(image, (resized_width, resized_height), interpolation=cv2.INTER_LINEAR)
+    top, left = round(pad_y - 0.1), round(pad_x - 0.1)
+    image = cv2.copyMakeBorder(image, top, size - resized_height - top, left, size - resized_width - left, cv2.BORDER_CONSTANT, value=LETTERBOX_COLOR)
+    return image, gain, (left, top)
+
+
+def preprocess(image: np.ndarray, size: int):
+    # Letterboxed RGB planes scaled to [0, 1], the input of the exported models
+    boxed, gain, pad = letterbox(image, size)
+    return boxed[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255, gain, pad
+
+
+class ExportedModel:
+    """YOLO detection model exported from ultralytics, with its pre and post processing in numpy and OpenCV.
+
+    Called like an ultralytics model and returning objects with the same boxes, torch is not needed.
+    """
+
+    def __init__(self, names: Dict[int, str], input_size: int = None):
+        self.names = names
+        self.input_size = input_size
+
+    def run(self, images: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def __call__(self, source, verbose: bool = False, imgsz: int = None, conf: float = CONFIDENCE_THRESHOLD, iou: float = IOU_THRESHOLD) -> List[Prediction]:
+        images = [source] if isinstance(source, np.ndarray) else list(source)
+        # Models exported with a fixed input size only accept that size
+        size = self.input_size or imgsz or 640
+
+        batch = np.empty((len(images), 3, size, size), dtype=np.float32)
+        letterboxes = []
+        for i, image in enumerate(images):
+            batch[i], gain, pad = preprocess(image, size)
+            letterboxes.append((gain, pad, image.shape[:2]))
+
+        outputs = self.run(batch)
+        return [self.postprocess(output, *letterbox_info, conf, iou) for output, letterbox_info in zip(outputs, letterboxes)]
+
+    def postprocess(self, output: np.ndarray, gain: float, pad, image_shape, conf: float, iou: float) -> Prediction:
+        # output is (4 + classes, anchors), boxes as centre and size in the letterboxed image
+        output = output.T
+        scores = output[:, 4:]
+        class_ids = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), class_ids]
+        keep = confidences > conf
+        centers, sizes, class_ids, confidences = output[keep, :2], output[keep, 2:4], class_ids[keep], confidences[keep]
+
+        xyxy = np.concatenate([centers - sizes / 2, centers + sizes / 2], axis=1)
+        if len(xyxy):
+            indexes = cv2.dnn.NMSBoxesBatched(np.concatenate([xyxy[:, :2], sizes], axis=1).tolist(), confidences.tolist(), class_ids.tolist(), conf, iou)
+            indexes = np.array(indexes, dtype=int).reshape(-1)[:MAX_DETECTIONS]
+            xyxy, class_ids, confidences = xyxy[indexes], class_ids[indexes], confidences[indexes]
+
+        height, width = image_shape
+        xyxy = (xyxy - [pad[0], pad[1], pad[0], pad[1]]) / gain
+        xyxy = np.clip(xyxy, 0, [width, height, width, height])
+
+        return Prediction(
+            boxes=Boxes(xyxy=xyxy.astype(np.float32).view(BoxArray), conf=confidences.astype(np.float32).view(BoxArray), cls=class_ids.astype(np.float32).view(BoxArray)),
+            names=self.names
+        )
+
+
+class OnnxRuntimeModel(ExportedModel):
+
+    def __init__(self, route: str, threads: int = INFERENCE_THREADS):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if threads > 0:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(route, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        input_size = self.session.get_inputs()[0].shape[-1]
+        super().__init__(names=ast.literal_eval(metadata["names"]), input_size=input_size if isinstance(input_size, int) else None)
+
+    def run(self, images: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: images})[0]
+
+
+class OpenVinoModel(ExportedModel):
+
+    def __init__(self, route: str, threads: int = INFERENCE_THREADS):
+        import openvino, yaml
+
+        core = openvino.Core()
+        # ultralytics exports a directory with the .xml, .bin and metadata.yaml files
+        model_path = next(glob.iglob(os.path.join(route, "*.xml"))) if os.path.isdir(route) else route
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if threads > 0:
+            config["INFERENCE_NUM_THREADS"] = threads
+        model = core.read_model(model_path)
+        self.compiled_model = core.compile_model(model, "CPU", config)
+
+        with open(os.path.join(os.path.dirname(model_path), "metadata.yaml")) as metadata_file:
+            metadata = yaml.safe_load(metadata_file)
+        input_size = model.inputs[0].get_partial_shape()[-1]
+        super().__init__(names=metadata["names"], input_size=input_size.get_length() if input_size.is_static else None)
+
+    def run(self, images: np.ndarray) -> np.ndarray:
+        return self.compiled_model(images)[0]
+
+
+def load_model(route: str, backend: str = INFERENCE_BACKEND, threads: int = INFERENCE_THREADS, int8: bool = INFERENCE_INT8):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend}, use one of {BACKENDS}")
+
+    backend_route = get_backend_route(route, backend, int8)
+    if backend == "onnx":
+        return OnnxRuntimeModel(backend_route, threads)
+    if backend == "openvino":
+        return OpenVinoModel(backend_route, threads)
+
+    import torch
+    from ultralytics import YOLO
+
+    if threads > 0:
+        torch.set_num_threads(threads)
+    return YOLO(backend_route)
+
+
+def export_model(route: str, backend: str, imgsz: int = 640, int8: bool = False, calibration_images: List[np.ndarray] = None, data: str = None) -> str:
+    # Exports a .pt model for a backend, the INT8 ONNX model is calibrated with calibration_images and the OpenVINO one with the data yaml
+    from ultralytics import YOLO
+
+    if backend == "onnx":
+        # Dynamic axes, the batch and the input size change between calls
+        onnx_route = YOLO(route).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+        if not int8:
+            return onnx_route
+        return quantize_onnx_model(onnx_route, get_backend_route(route, "onnx", int8=True), calibration_images, imgsz)
+
+    if backend == "openvino":
+        return YOLO(route).export(format="openvino", imgsz=imgsz, dynamic=not int8, int8=int8, data=data)
+
+    raise ValueError(f"Models are exported for onnx or openvino, not {backend}")
+
+
+def quantize_onnx_model(onnx_route: str, int8_route: str, calibration_images: List[np.ndarray], imgsz: int) -> str:
+    # Static INT8 quantisation with the activation ranges of real frames
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    if not calibration_images:
+        raise ValueError("INT8 quantisation needs calibration frames")
+
+    class FramesReader(CalibrationDataReader):
+        def __init__(self):
+            self.images = iter(calibration_images)
+
+        def get_next(self):
+            image = next(self.images, None)
+            if image is None:
+                return None
+            return {"images": preprocess(image, imgsz)[0][None]}
+
+    quantize_static(onnx_route, int8_route, FramesReader(), quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    logging.info(f"Quantised {onnx_route} to {int8_route}")
+    return int8_route
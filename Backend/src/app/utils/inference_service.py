@@ -0,0 +1,239 @@
+from contextlib import nullcontext, suppress
+from dotenv import load_dotenv
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Tuple
+
+from app.utils.detections_cache import ModelOutputs
+from app.utils.logger import configure_logging
+
+import threading, weakref, os, logging, numpy as np
+
+
+configure_logging()
+load_dotenv()
+
+# Unix socket of the inference server (serve_inference.py), when set the API workers send it the frames instead of loading the models
+INFERENCE_SERVICE_SOCKET = os.getenv("INFERENCE_SERVICE_SOCKET")
+# Shared secret of the server and its clients, the messages are pickles so it must never be a known value
+INFERENCE_SERVICE_AUTHKEY = os.getenv("INFERENCE_SERVICE_AUTHKEY")
+INFERENCE_SERVICE_TIMEOUT = float(os.getenv("INFERENCE_SERVICE_TIMEOUT", 60))
+# Shared memory blocks grow to the largest call seen times this, so they are not created again for every call
+SHARED_FRAMES_GROWTH = 1.5
+
+
+def get_authkey(authkey: str = INFERENCE_SERVICE_AUTHKEY) -> bytes:
+    if not authkey:
+        raise RuntimeError("INFERENCE_SERVICE_AUTHKEY is needed to use the inference server")
+    return authkey.encode()
+
+
+def predictions_to_arrays(predictions) -> Dict[str, np.ndarray]:
+    # Only the boxes of the predictions go back to the client, in the flat arrays of the recorded detections
+    outputs = ModelOutputs()
+    for prediction in predictions:
+        outputs.add(prediction)
+    return {"names": dict(predictions[0].names) if predictions else {}, **outputs.to_arrays("boxes")}
+
+
+def predictions_from_arrays(arrays: Dict[str, np.ndarray]) -> list:
+    outputs = ModelOutputs.from_arrays(arrays, "boxes")
+    return [outputs.get_prediction(index, arrays["names"]) for index in range(len(outputs))]
+
+
+def release_shared_memory(shm: SharedMemory):
+    shm.close()
+    with suppress(FileNotFoundError):
+        shm.unlink()
+
+
+class SharedFrames:
+    # Shared memory block of a client the frames of every call are copied into, only their layout is sent through the socket
+    def __init__(self):
+        self.shm = None
+        self.release = None
+
+    def write(self, images: List[np.ndarray]) -> Tuple[str, list]:
+        size = sum(image.nbytes for image in images)
+        if self.shm is None or self.shm.size < size:
+            self.close()
+            self.shm = SharedMemory(create=True, size=max(1, int(size * SHARED_FRAMES_GROWTH)))
+            # Unlinked when the client is closed, when its thread ends or when the process exits
+            self.release = weakref.finalize(self, release_shared_memory, self.shm)
+
+        layouts = []
+        offset = 0
+        for image in images:
+            # Crops of the frames are not contiguous, they are copied row by row into the block
+            np.ndarray(image.shape, dtype=image.dtype, buffer=self.shm.buf, offset=offset)[...] = image
+            layouts.append((offset, image.shape, image.dtype.str))
+            offset += image.nbytes
+        return self.shm.name, layouts
+
+    def close(self):
+        if self.release is not None:
+            self.release()
+        self.shm = None
+        self.release = None
+
+
+class AttachedFrames:
+    # Block of a client attached by the server, the frames are read from it without copying them
+    def __init__(self):
+        self.shm = None
+
+    def read(self, name: str, layouts: list) -> List[np.ndarray]:
+        if self.shm is None or self.shm.name != name:
+            self.close()
+            self.shm = SharedMemory(name=name)
+            # The client owns the block, the server must not unlink it when it exits
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        return [np.ndarray(shape, dtype=np.dtype(dtype), buffer=self.shm.buf, offset=offset) for offset, shape, dtype in layouts]
+
+    def close(self):
+        if self.shm is not None:
+            # Fails while a frame of the block is still referenced, the block is then released with the process
+            with suppress(BufferError):
+                self.shm.close()
+            self.shm = None
+
+
+class InferenceClient:
+    """Connection of a thread to the inference server, with the shared memory block of its frames."""
+
+    def __init__(self, socket_path: str = INFERENCE_SERVICE_SOCKET, authkey: bytes = None, timeout: float = INFERENCE_SERVICE_TIMEOUT):
+        self.socket_path = socket_path
+        self.authkey = authkey or get_authkey()
+        self.timeout = timeout
+        self.connection = None
+        self.frames = SharedFrames()
+
+    def request(self, command: str, **message):
+        try:
+            if self.connection is None:
+                self.connection = Client(self.socket_path, family="AF_UNIX", authkey=self.authkey)
+            self.connection.send({"command": command, **message})
+            if not self.connection.poll(self.timeout):
+                raise TimeoutError(f"The inference server did not answer in {self.timeout}s")
+            response = self.connection.recv()
+        except (OSError, EOFError, TimeoutError):
+            # The next request connects again, the server may have been restarted
+            self.close_connection()
+            raise
+
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response["result"]
+
+    def predict(self, model: str, images: List[np.ndarray], arguments: dict) -> list:
+        shm_name, layouts = self.frames.write(images)
+        return predictions_from_arrays(self.request("predict", model=model, shm=shm_name, layouts=layouts, arguments=arguments))
+
+    def close_connection(self):
+        if self.connection is not None:
+            with suppress(OSError):
+                self.connection.close()
+            self.connection = None
+
+    def close(self):
+        self.close_connection()
+        self.frames.close()
+
+
+_clients = threading.local()
+
+
+def get_inference_client(socket_path: str = INFERENCE_SERVICE_SOCKET) -> InferenceClient:
+    # One client per thread, the models of a thread share it
+    clients = getattr(_clients, "clients", None)
+    if clients is None:
+        clients = _clients.clients = {}
+    if socket_path not in clients:
+        clients[socket_path] = InferenceClient(socket_path)
+    return clients[socket_path]
+
+
+class InferenceServer:
+    """Runs the models for the API workers of this machine, every connection is served by its own thread.
+
+    The frames of every call are read from the shared memory block of its client, only the boxes found are sent back.
+    """
+
+    def __init__(self, models: dict, socket_path: str = INFERENCE_SERVICE_SOCKET, authkey: bytes = None):
+        self.models = models
+        self.socket_path = socket_path
+        self.authkey = authkey or get_authkey()
+
+    def serve_forever(self):
+        # A socket left by a server that did not stop cleanly
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+        # Only the user running the server can connect, the socket is never readable by others even before the chmod
+        umask = os.umask(0o177)
+        try:
+            listener = Listener(self.socket_path, family="AF_UNIX", authkey=self.authkey)
+        finally:
+            os.umask(umask)
+        os.chmod(self.socket_path, 0o600)
+
+        with listener:
+            logging.info(f"Inference server listening on {self.socket_path}")
+            while True:
+                try:
+                    connection = listener.accept()
+                except Exception as e:
+                    logging.error(f"Error accepting inference connection: {str(e)}")
+                    continue
+                threading.Thread(target=self.serve_connection, args=(connection,), name="inference-connection", daemon=True).start()
+
+    def serve_connection(self, connection):
+        frames = AttachedFrames()
+        jobs = []
+        try:
+            while True:
+                message = connection.recv()
+                try:
+                    response = {"result": self.handle(message, frames, jobs)}
+                except Exception as e:
+                    logging.error(f"Error in inference command {message.get('command')}: {str(e)}")
+                    response = {"error": str(e)}
+                connection.send(response)
+
+        except (EOFError, OSError):
+            pass
+
+        finally:
+            # Plays of a client that disconnected are not waited for anymore
+            for job in reversed(jobs):
+                job.__exit__(None, None, None)
+            frames.close()
+            connection.close()
+
+    def handle(self, message: dict, frames: AttachedFrames, jobs: list):
+        command = message["command"]
+        if command == "state":
+            return {name: model.to_dict() for name, model in self.models.items()}
+
+        model = self.models[message["model"]]
+        if command == "predict":
+            images = frames.read(message["shm"], message["layouts"])
+            return predictions_to_arrays(model(images, verbose=False, **message["arguments"]))
+
+        if command == "warm_up":
+            return model.warm_up()
+
+        if command == "job_start":
+            # Only the batched models wait for the calls of the plays being processed
+            job = model.job() if hasattr(model, "job") else nullcontext()
+            job.__enter__()
+            jobs.append(job)
+            return None
+
+        if command == "job_end":
+            if jobs:
+                jobs.pop().__exit__(None, None, None)
+            return None
+
+        raise ValueError(f"Unknown inference command {command}")
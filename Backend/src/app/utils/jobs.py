@@ -0,0 +1,275 @@
+from datetime import datetime, timedelta
+from typing import Optional
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.db.database import SessionLocal
+from app.models.project import Project, Pocket
+from app.models.play import Play
+from app.models.play_job import JobStatus, PlayJob
+
+from app.utils.detections_cache import SAVE_DETECTIONS, DetectionsRecorder, get_detections_path
+from app.utils.inference import WARM_UP_MODELS, play_job, warm_up_models
+from app.utils.logger import configure_logging
+from app.utils.profiling import PROFILE_TRACES_DIRECTORY, PipelineProfile, pipeline_metrics
+from app.utils.literals import INTERNAL_SERVER_ERROR, PLAY_QUEUE_IS_FULL, PROJECT_NOT_FOUND, VIDEO_NOT_FOUND
+from app.utils.uploads import get_original_video_path, keep_original_video, remove_spooled_video
+from app.utils.video_process import process_statistics, process_video
+
+import threading, socket, time, uuid, os, logging
+
+
+configure_logging()
+load_dotenv()
+
+# Plays processed at the same time by every API worker, each of them uses most of the cores while running the models
+PLAY_JOBS_WORKERS = int(os.getenv("PLAY_JOBS_WORKERS", 2))
+# Jobs waiting in the database for any worker, new plays are rejected above it
+PLAY_JOBS_QUEUE_SIZE = int(os.getenv("PLAY_JOBS_QUEUE_SIZE", 32))
+# Finished jobs are kept so clients can poll them, then they are deleted
+PLAY_JOBS_HISTORY_DAYS = int(os.getenv("PLAY_JOBS_HISTORY_DAYS", 7))
+# Idle workers look for jobs queued by other API workers this often, their own jobs wake them right away
+PLAY_JOBS_POLL_INTERVAL = float(os.getenv("PLAY_JOBS_POLL_INTERVAL", 1))
+# Running jobs report every heartbeat, a job without one for PLAY_JOBS_STALE_HEARTBEATS is queued again
+PLAY_JOBS_HEARTBEAT_INTERVAL = float(os.getenv("PLAY_JOBS_HEARTBEAT_INTERVAL", 30))
+PLAY_JOBS_STALE_HEARTBEATS = 4
+
+
+class PlayJobQueue:
+    """Queue of play processing jobs stored in the database, consumed by a pool of worker threads in every API worker.
+
+    Jobs are claimed with a conditional update so only one worker runs each of them. The uploaded videos are spooled
+    to VIDEO_SPOOL_DIRECTORY, which every API worker taking jobs must be able to read.
+    """
+
+    def __init__(self, workers: int = PLAY_JOBS_WORKERS, queue_size: int = PLAY_JOBS_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{str(uuid.uuid4())[:8]}"
+        self.new_jobs = threading.Event()
+        self.running = set()
+        self.lock = threading.Lock()
+        self.threads = []
+
+    def start(self):
+        with self.lock:
+            if self.threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"play-worker-{i}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+            thread = threading.Thread(target=self._heartbeat, name="play-jobs-heartbeat", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        logging.info(f"Started {self.workers} play workers")
+
+    def submit(self, db: Session, project_id: str, user_id: str, pocket: Pocket, video_path: str, render: bool = True) -> PlayJob:
+        self.start()
+        self._forget_old_jobs(db)
+        if db.query(PlayJob).filter(PlayJob.status == JobStatus.QUEUED.value).count() >= self.queue_size:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=PLAY_QUEUE_IS_FULL)
+
+        job = PlayJob(id=str(uuid.uuid4()), project_id=project_id, user_id=user_id, pocket=pocket.value,
+                      video_path=video_path, render=render, status=JobStatus.QUEUED.value, creation_date=datetime.now())
+        db.add(job)
+        db.commit()
+        self.new_jobs.set()
+
+        logging.info(f"Play job {job.id} queued")
+        return job
+
+    def claim(self, db: Session) -> Optional[PlayJob]:
+        # The oldest queued job nobody else claimed first, the update only succeeds for one worker
+        candidates = db.query(PlayJob.id).filter(PlayJob.status == JobStatus.QUEUED.value).order_by(PlayJob.creation_date).limit(self.workers).all()
+        for (job_id,) in candidates:
+            now = datetime.now()
+            claimed = db.query(PlayJob).filter(PlayJob.id == job_id, PlayJob.status == JobStatus.QUEUED.value).update(
+                {"status": JobStatus.RUNNING.value, "worker": self.worker_id, "start_date": now, "heartbeat_date": now},
+                synchronize_session=False)
+            db.commit()
+            if claimed:
+                return db.query(PlayJob).filter(PlayJob.id == job_id).first()
+        return None
+
+    def to_dict(self):
+        db = SessionLocal()
+        try:
+            jobs = {job_status.value: 0 for job_status in JobStatus}
+            for job_status, count in db.query(PlayJob.status, func.count(PlayJob.id)).group_by(PlayJob.status):
+                jobs[job_status] = count
+        finally:
+            db.close()
+        return {"workers": self.workers, "worker_id": self.worker_id, "queue_size": self.queue_size, "queued": jobs[JobStatus.QUEUED.value], "jobs": jobs}
+
+    def _forget_old_jobs(self, db: Session):
+        oldest = datetime.now() - timedelta(days=PLAY_JOBS_HISTORY_DAYS)
+        db.query(PlayJob).filter(PlayJob.status.in_([JobStatus.DONE.value, JobStatus.FAILED.value]), PlayJob.end_date < oldest).delete(synchronize_session=False)
+        db.commit()
+
+    def _work(self):
+        if WARM_UP_MODELS:
+            try:
+                warm_up_models()
+            except Exception as e:
+                logging.error(f"Error warming up models: {str(e)}")
+
+        while True:
+            db = SessionLocal()
+            try:
+                job = self.claim(db)
+                if job is None:
+                    db.close()
+                    self.new_jobs.wait(PLAY_JOBS_POLL_INTERVAL)
+                    self.new_jobs.clear()
+                    continue
+                self.running.add(job.id)
+                try:
+                    run_play_job(db, job)
+                finally:
+                    self.running.discard(job.id)
+            except Exception as e:
+                logging.error(f"Error in play worker: {str(e)}")
+                self.new_jobs.wait(PLAY_JOBS_POLL_INTERVAL)
+            finally:
+                db.close()
+
+    def _heartbeat(self):
+        while True:
+            db = SessionLocal()
+            try:
+                now = datetime.now()
+                running = list(self.running)
+                if running:
+                    db.query(PlayJob).filter(PlayJob.id.in_(running), PlayJob.worker == self.worker_id).update(
+                        {"heartbeat_date": now}, synchronize_session=False)
+
+                # Jobs of a worker that stopped while running them are run again from their spooled video
+                stale = now - timedelta(seconds=PLAY_JOBS_HEARTBEAT_INTERVAL * PLAY_JOBS_STALE_HEARTBEATS)
+                requeued = db.query(PlayJob).filter(PlayJob.status == JobStatus.RUNNING.value, PlayJob.heartbeat_date < stale).update(
+                    {"status": JobStatus.QUEUED.value, "worker": None, "start_date": None}, synchronize_session=False)
+                db.commit()
+                if requeued:
+                    logging.info(f"Queued again {requeued} play jobs of stopped workers")
+                    self.new_jobs.set()
+            except Exception as e:
+                db.rollback()
+                logging.error(f"Error in play jobs heartbeat: {str(e)}")
+            finally:
+                db.close()
+            time.sleep(PLAY_JOBS_HEARTBEAT_INTERVAL)
+
+
+def run_play_job(db: Session, job: PlayJob):
+    profile = PipelineProfile()
+    logging.info(f"Processing play job {job.id}")
+
+    # The claim of this run, read now because a rollback reloads the job with whoever claimed it later
+    claim = (job.worker, job.start_date)
+    play_id = str(uuid.uuid4())
+    original_video_path = None
+    detections_path = None
+    # Whether this run still owned the job when it wrote its result, a run that lost it leaves the video to the new one
+    finished = False
+    try:
+        # A job queued again after its worker stopped may have lost its video with the machine
+        if not os.path.exists(job.video_path):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=VIDEO_NOT_FOUND)
+
+        project = db.query(Project).filter(Project.id == job.project_id).first()
+        if not project:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=PROJECT_NOT_FOUND)
+
+        # The processed video is not drawn now, it is rendered from the original clip the first time it is watched
+        detections_recorder = DetectionsRecorder() if SAVE_DETECTIONS else None
+        with play_job():
+            trajectories, photo_path, _, calibration = process_video(job.video_path, project.calibration, render=False, profile=profile, detections_recorder=detections_recorder)
+
+        with profile.stage("process_statistics"):
+            distance, angle, first_color_ball, second_color_ball, success, ball_paths = process_statistics(trajectories["tracks"], Pocket(job.pocket))
+
+        if detections_recorder is not None:
+            detections_path = detections_recorder.save(get_detections_path(play_id))
+
+        new_play = Play(id =play_id,
+                        project = project,
+                        photo = photo_path,
+                        angle = angle,
+                        distance = distance,
+                        original_video = get_original_video_path(job.video_path) if job.render else None,
+                        detections = detections_path,
+                        success = success,
+                        first_color_ball = first_color_ball,
+                        second_color_ball = second_color_ball,
+                        pocket = job.pocket,
+                        ball_paths = ball_paths,
+                        trajectories = trajectories,
+                        creation_date = datetime.now())
+
+        db.add(new_play)
+        project.calibration = calibration
+
+        def keep_video():
+            nonlocal original_video_path
+            if job.render:
+                original_video_path = keep_original_video(job.video_path)
+
+        # The spooled clip is only moved once the job is known to still be ours
+        finished = finish_play_job(db, job, claim, profile, {"play_id": new_play.id, "status_code": status.HTTP_200_OK, "status": JobStatus.DONE.value}, keep_video)
+        if finished:
+            logging.info(f"Play job {job.id} done")
+        else:
+            remove_spooled_video(detections_path)
+
+    except HTTPException as http_exception:
+        db.rollback()
+        remove_spooled_video(original_video_path)
+        remove_spooled_video(detections_path)
+        finished = finish_play_job(db, job, claim, profile, {"status_code": http_exception.status_code, "error": http_exception.detail, "status": JobStatus.FAILED.value})
+        logging.error(f"Error processing play job {job.id}: {http_exception.detail}")
+
+    except Exception as e:
+        db.rollback()
+        remove_spooled_video(original_video_path)
+        remove_spooled_video(detections_path)
+        finished = finish_play_job(db, job, claim, profile, {"status_code": status.HTTP_500_INTERNAL_SERVER_ERROR, "error": f"{INTERNAL_SERVER_ERROR}:{str(e)}", "status": JobStatus.FAILED.value})
+        logging.error(f"Error processing play job {job.id}: {str(e)}")
+
+    finally:
+        if finished:
+            remove_spooled_video(job.video_path)
+
+
+def finish_play_job(db: Session, job: PlayJob, claim: tuple, profile: PipelineProfile, result: dict, before_commit=None) -> bool:
+    # The play and the end of its job are committed together, and only while the job is still claimed by this run.
+    # A job queued again as stale may already be running in another worker, then everything this run did is rolled back
+    profile.finish()
+    metrics = profile.to_dict()
+    worker, start_date = claim
+    claimed = db.query(PlayJob).filter(PlayJob.id == job.id, PlayJob.worker == worker, PlayJob.start_date == start_date,
+                                       PlayJob.status == JobStatus.RUNNING.value).update(
+        {**result, "end_date": datetime.now(), "metrics": metrics}, synchronize_session=False)
+    if not claimed:
+        db.rollback()
+        logging.warning(f"Play job {job.id} was queued again while running, its result is discarded")
+        return False
+
+    if before_commit is not None:
+        before_commit()
+    db.commit()
+
+    pipeline_metrics.add(profile, failed=result["status"] == JobStatus.FAILED.value)
+    logging.info(f"Play job {job.id} metrics: {metrics}")
+
+    if PROFILE_TRACES_DIRECTORY:
+        try:
+            profile.dump_trace(os.path.join(PROFILE_TRACES_DIRECTORY, f'{job.id}.json'))
+        except Exception as e:
+            logging.error(f"Error saving trace of play job {job.id}: {str(e)}")
+
+    return True
+
+
+play_job_queue = PlayJobQueue()
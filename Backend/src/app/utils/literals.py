@@ -8,6 +8,7 @@ INCORRECT_USER_OR_PASSWORD = "Usuario o contraseña incorrecta"
 EMAIL_NOT_FOUND_IN_TOKEN = "No se ha encontrado un email en el token"
 INACTIVE_USER = "Usuario inactivo"
 PLEASE_LOGIN_AGAIN = "Por favor, vuelva a iniciar sesión."
+YOU_ARE_NOT_ADMIN = "No tienes permisos de administrador"
 
 # USERS
 USER_NOT_FOUND = "Usuario no encontrado"
@@ -37,10 +38,26 @@ PROJECT_NOT_FOUND = "Proyecto no encontrado"
 YOU_ARE_NOT_THE_OWNER = "No eres el propietario"
 NOT_POSSIBLE_TO_RECOGNISE_PLAY_OF_VIDEO = "No es posible reconocer la jugada del video."
 VIDEO_TOO_LONG = "Video demasiado largo."
+VIDEO_TOO_BIG = "Video demasiado pesado."
+VIDEO_NOT_READABLE = "No es posible leer el video."
+VIDEO_RESOLUTION_TOO_BIG = "Resolución del video demasiado grande."
+PLAY_QUEUE_IS_FULL = "Hay demasiadas jugadas en proceso, inténtalo más tarde."
+
+# JOBS
+JOB_NOT_FOUND = "Trabajo no encontrado"
+JOB_NOT_FINISHED = "La jugada todavía se está procesando"
+
+# HEALTH
+MODELS_NOT_READY = "Los modelos todavía no están cargados"
 
 # PLAYS
 PLAY_NOT_FOUND = "Jugada no encontrada"
 VIDEO_NOT_FOUND = "Video no encontrado"
+DETECTIONS_NOT_FOUND = "Detecciones de la jugada no encontradas"
+
+# REANALYSIS
+REANALYSIS_NOT_FOUND = "Reanálisis no encontrado"
+REANALYSIS_ALREADY_RUNNING = "Ya hay un reanálisis en curso"
 
 # REQUESTS
 REQUEST_NOT_FOUND = "Invitación no encontrada"
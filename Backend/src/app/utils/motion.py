@@ -0,0 +1,85 @@
+from dotenv import load_dotenv
+from enum import Enum
+
+import os, cv2, numpy as np
+
+
+load_dotenv()
+
+# The ball model only runs on frames that changed since the last frame it saw, static frames reuse its detections
+MOTION_GATE = os.getenv("MOTION_GATE", "True").lower() == "true"
+# Pixel channels of the reduced frame that must change by more than MOTION_GATE_THRESHOLD to count as movement
+MOTION_GATE_PIXELS = int(os.getenv("MOTION_GATE_PIXELS", 4))
+MOTION_GATE_THRESHOLD = int(os.getenv("MOTION_GATE_THRESHOLD", 25))
+MOTION_GATE_WIDTH = 320
+# The ball model runs at least once every MOTION_GATE_MAX_STATIC_FRAMES frames even if nothing moves
+MOTION_GATE_MAX_STATIC_FRAMES = int(os.getenv("MOTION_GATE_MAX_STATIC_FRAMES", 15))
+# After MOTION_GATE_GRAB_AFTER static frames only one of every MOTION_GATE_GRAB_FRAMES + 1 frames is decoded
+MOTION_GATE_GRAB_AFTER = int(os.getenv("MOTION_GATE_GRAB_AFTER", 10))
+MOTION_GATE_GRAB_FRAMES = int(os.getenv("MOTION_GATE_GRAB_FRAMES", 2))
+# The ball model runs on one of every DETECTION_INTERVAL moving frames, the tracker predicts the balls in the others
+DETECTION_INTERVAL = int(os.getenv("DETECTION_INTERVAL", 1))
+
+
+class FrameAction(Enum):
+    DETECT = "detect"
+    PREDICT = "predict"
+    REUSE = "reuse"
+
+
+class MotionGate:
+    """Decides what to do with every frame before the ball model sees it.
+
+    Frame difference against the last frame sent to the ball model, on a small blurred copy of the frames.
+    Moving frames are detected, or predicted by the tracker between detections, static frames reuse the last detections.
+    """
+
+    def __init__(self, pixels: int = MOTION_GATE_PIXELS, threshold: int = MOTION_GATE_THRESHOLD, max_static_frames: int = MOTION_GATE_MAX_STATIC_FRAMES,
+                 detection_interval: int = DETECTION_INTERVAL):
+        # Without pixels every frame is taken as moving
+        self.pixels = pixels
+        self.threshold = threshold
+        self.max_static_frames = max_static_frames
+        self.detection_interval = max(1, detection_interval)
+        self.reference = None
+        self.difference = None
+        self.static_frames = 0
+        self.frames_since_detection = 0
+        self.detections = 0
+
+    def reduce(self, frame: np.ndarray) -> np.ndarray:
+        height, width = frame.shape[:2]
+        size = (min(width, MOTION_GATE_WIDTH), max(1, round(min(width, MOTION_GATE_WIDTH) * height / width)))
+        reduced = cv2.resize(frame, size, interpolation=cv2.INTER_LINEAR)
+        return cv2.GaussianBlur(reduced, (3, 3), 0)
+
+    def update(self, frame: np.ndarray) -> FrameAction:
+        # The reference is the last frame the ball model ran on, static frames reuse its detections
+        if self.pixels <= 0:
+            reduced = None
+            moving = True
+        else:
+            reduced = self.reduce(frame)
+            moving = self.reference is None or self.reference.shape != reduced.shape
+            if not moving:
+                # Colours are compared channel by channel, red balls and the green cloth have almost the same grey
+                self.difference = cv2.absdiff(reduced, self.reference, self.difference)
+                moving = np.count_nonzero(self.difference > self.threshold) >= self.pixels
+
+        self.static_frames = 0 if moving else self.static_frames + 1
+        if self.detections == 0 or (moving and self.frames_since_detection + 1 >= self.detection_interval) or self.frames_since_detection >= self.max_static_frames:
+            self.reference = reduced
+            self.frames_since_detection = 0
+            self.detections += 1
+            return FrameAction.DETECT
+
+        self.frames_since_detection += 1
+        return FrameAction.PREDICT if moving else FrameAction.REUSE
+
+    def skip(self):
+        # A frame grabbed without decoding, it is taken as static
+        self.static_frames += 1
+        self.frames_since_detection += 1
+
+    def can_grab(self, grabbed_frames: int) -> bool:
+        return self.static_frames >= MOTION_GATE_GRAB_AFTER and grabbed_frames < MOTION_GATE_GRAB_FRAMES
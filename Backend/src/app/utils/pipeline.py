@@ -0,0 +1,118 @@
+from dotenv import load_dotenv
+from queue import Queue, Full
+from typing import Iterator
+
+from app.models.annotators import VideoConfig
+from app.utils.profiling import PipelineProfile
+
+import threading, os, cv2
+
+
+load_dotenv()
+
+# Frames the decoder thread can read ahead of inference and the encoder thread can lag behind rendering.
+# OpenCV releases the GIL while decoding and encoding, so both stages overlap with inference.
+DECODE_QUEUE_SIZE = int(os.getenv("DECODE_QUEUE_SIZE", 32))
+ENCODE_QUEUE_SIZE = int(os.getenv("ENCODE_QUEUE_SIZE", 8))
+QUEUE_POLL_SECONDS = 0.1
+
+_END = object()
+
+
+def prefetch(iterator: Iterator, queue_size: int = DECODE_QUEUE_SIZE, name: str = "decoder") -> Iterator:
+    # Runs the iterator in its own thread and yields its items in order, the bounded queue stops it running too far ahead
+    queue: Queue = Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=QUEUE_POLL_SECONDS)
+                return True
+            except Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+            put(_END)
+        except BaseException as e:
+            put(e)
+
+    thread = threading.Thread(target=produce, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = queue.get()
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # The consumer may stop early (errors, videos too long), let the producer finish
+        stop.set()
+        thread.join()
+
+
+def get_video_writer(target_video_path: str, video_config: VideoConfig) -> cv2.VideoWriter:
+    video_target_dir = os.path.dirname(os.path.abspath(target_video_path))
+    os.makedirs(video_target_dir, exist_ok=True)
+    return cv2.VideoWriter(
+        target_video_path, 
+        fourcc=cv2.VideoWriter_fourcc(*"mp4v"), 
+        fps=video_config.fps, 
+        frameSize=(video_config.width, video_config.height), 
+        isColor=True
+    )
+
+
+class ThreadedVideoWriter:
+    """cv2.VideoWriter that encodes in its own thread.
+
+    Frames are queued as they are, the caller must not modify a frame until ENCODE_QUEUE_SIZE + 1 newer ones were written.
+    """
+
+    def __init__(self, video_writer: cv2.VideoWriter, queue_size: int = ENCODE_QUEUE_SIZE, profile: PipelineProfile = None):
+        self.video_writer = video_writer
+        self.profile = profile or PipelineProfile(trace=False)
+        self.queue: Queue = Queue(maxsize=queue_size)
+        self.error = None
+        self.released = False
+        self.thread = threading.Thread(target=self._encode, name="encoder", daemon=True)
+        self.thread.start()
+
+    def _encode(self):
+        while True:
+            frame = self.queue.get()
+            if frame is _END:
+                return
+            if self.error is None:
+                try:
+                    with self.profile.stage("encode"):
+                        self.video_writer.write(frame)
+                except BaseException as e:
+                    self.error = e
+
+    def write(self, frame):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(frame)
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        self.queue.put(_END)
+        self.thread.join()
+        self.video_writer.release()
+        if self.error is not None:
+            raise self.error
+
+
+def get_frame_buffers(queue_size: int = ENCODE_QUEUE_SIZE) -> int:
+    # Output frames alive at once: queued for the encoder, being encoded and being rendered
+    return queue_size + 2
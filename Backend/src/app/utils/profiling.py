@@ -0,0 +1,165 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+import threading, time, json, os, sys, psutil
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+load_dotenv()
+
+# Directory where a Chrome trace (chrome://tracing, Perfetto) of every processed video is written, unset writes none
+PROFILE_TRACES_DIRECTORY = os.getenv("PROFILE_TRACES_DIRECTORY")
+
+
+def get_peak_rss_mb() -> float:
+    # Peak resident memory of the process, shared by every job it ran
+    if resource is not None:
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes and macOS bytes
+        return round(peak_rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    memory_info = psutil.Process().memory_info()
+    return round(getattr(memory_info, "peak_wset", memory_info.rss) / (1024 * 1024), 1)
+
+
+class PipelineProfile:
+    """Time spent in every stage of the processing of a video and counters of its frames.
+
+    Stages may run in the decoder and encoder threads, so every update takes a lock.
+    With trace every stage call is also kept as a Chrome trace event.
+    """
+
+    def __init__(self, trace: bool = bool(PROFILE_TRACES_DIRECTORY)):
+        self.trace = trace
+        self.start = time.perf_counter()
+        self.end = None
+        self.stages = defaultdict(lambda: [0, 0.0, 0.0])
+        self.counters = defaultdict(int)
+        self.events = []
+        self.threads = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, start, time.perf_counter())
+
+    def add_stage(self, name: str, start: float, end: float):
+        seconds = end - start
+        with self.lock:
+            stage = self.stages[name]
+            stage[0] += 1
+            stage[1] += seconds
+            stage[2] = max(stage[2], seconds)
+            if self.trace:
+                thread = threading.current_thread()
+                self.threads[thread.ident] = thread.name
+                self.events.append({"name": name, "ph": "X", "ts": (start - self.start) * 1e6, "dur": seconds * 1e6, "pid": os.getpid(), "tid": thread.ident})
+
+    def count(self, name: str, value: int = 1):
+        with self.lock:
+            self.counters[name] += value
+
+    def merge(self, stages: dict, counters: dict):
+        # Stages and counters of the part of the video processed in another process
+        with self.lock:
+            for name, (calls, seconds, max_seconds) in stages.items():
+                stage = self.stages[name]
+                stage[0] += calls
+                stage[1] += seconds
+                stage[2] = max(stage[2], max_seconds)
+            for name, value in counters.items():
+                self.counters[name] += value
+
+    def totals(self):
+        with self.lock:
+            return {name: list(stage) for name, stage in self.stages.items()}, dict(self.counters)
+
+    def finish(self):
+        self.end = time.perf_counter()
+
+    @property
+    def seconds(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def to_dict(self):
+        with self.lock:
+            counters = dict(self.counters)
+            stages = {
+                name: {"calls": calls, "seconds": round(seconds, 4), "mean_ms": round(seconds * 1000 / calls, 3), "max_ms": round(max_seconds * 1000, 3)}
+                for name, (calls, seconds, max_seconds) in self.stages.items()
+            }
+
+        frames = counters.get("frames", 0)
+        detected_frames = counters.get("frames_detected", 0)
+        return {
+            "seconds": round(self.seconds, 3),
+            "fps": round(frames / self.seconds, 2) if frames and self.seconds else None,
+            "detections_per_frame": round(counters.get("detections", 0) / detected_frames, 2) if detected_frames else None,
+            "peak_rss_mb": get_peak_rss_mb(),
+            "counters": counters,
+            "stages": stages
+        }
+
+    def dump_trace(self, path: str):
+        with self.lock:
+            events = list(self.events)
+            threads = dict(self.threads)
+        metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}} for tid, name in threads.items()]
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as trace_file:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms", "otherData": self.to_dict()}, trace_file)
+
+
+class PipelineMetrics:
+    """Totals of the profiles of every video processed by this process, served by the metrics endpoint."""
+
+    def __init__(self):
+        self.videos = 0
+        self.failed_videos = 0
+        self.seconds = 0.0
+        self.stages = defaultdict(lambda: [0, 0.0, 0.0])
+        self.counters = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def add(self, profile: PipelineProfile, failed: bool = False):
+        stages, counters = profile.totals()
+
+        with self.lock:
+            self.videos += 1
+            self.failed_videos += failed
+            self.seconds += profile.seconds
+            for name, (calls, seconds, max_seconds) in stages.items():
+                stage = self.stages[name]
+                stage[0] += calls
+                stage[1] += seconds
+                stage[2] = max(stage[2], max_seconds)
+            for name, value in counters.items():
+                self.counters[name] += value
+
+    def to_dict(self):
+        with self.lock:
+            frames = self.counters.get("frames", 0)
+            return {
+                "videos": self.videos,
+                "failed_videos": self.failed_videos,
+                "seconds": round(self.seconds, 3),
+                "fps": round(frames / self.seconds, 2) if frames and self.seconds else None,
+                "peak_rss_mb": get_peak_rss_mb(),
+                "counters": dict(self.counters),
+                "stages": {
+                    name: {"calls": calls, "seconds": round(seconds, 4), "mean_ms": round(seconds * 1000 / calls, 3), "max_ms": round(max_seconds * 1000, 3), "share": round(seconds / self.seconds, 3) if self.seconds else None}
+                    for name, (calls, seconds, max_seconds) in self.stages.items()
+                }
+            }
+
+
+pipeline_metrics = PipelineMetrics()
@@ -0,0 +1,344 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from dotenv import load_dotenv
+from enum import Enum
+from fastapi import HTTPException, status
+from itertools import repeat
+from sqlalchemy.orm import undefer
+from typing import Optional
+
+from app.db.database import SessionLocal
+from app.models.play import Play
+from app.models.project import Pocket
+
+from app.utils.detections_cache import RecordedDetections
+from app.utils.logger import configure_logging
+from app.utils.literals import DETECTIONS_NOT_FOUND, INTERNAL_SERVER_ERROR
+from app.utils.video_cache import rendered_video_cache
+from app.utils.video_process import process_statistics, reanalyse_detections
+
+import threading, multiprocessing, json, math, os, uuid, logging
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, where the lock file is locked with msvcrt
+    fcntl = None
+    import msvcrt
+
+
+configure_logging()
+load_dotenv()
+
+# Progress and per play changes of every bulk reanalysis, a run is resumed from its state file
+REANALYSIS_DIRECTORY = os.getenv("REANALYSIS_DIRECTORY", "data/reanalysis/")
+REANALYSIS_WORKERS = int(os.getenv("REANALYSIS_WORKERS", os.cpu_count() or 1))
+# Plays read, analysed and written back together, a run interrupted repeats at most one chunk
+REANALYSIS_CHUNK_SIZE = int(os.getenv("REANALYSIS_CHUNK_SIZE", 200))
+
+
+class ReanalysisSource(Enum):
+    # Only the statistics are computed again from the stored trajectories
+    TRAJECTORIES = "trajectories"
+    # The trajectories are built again from the recorded detections, plays without them use their trajectories
+    DETECTIONS = "detections"
+
+
+class ReanalysisStatus(Enum):
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+def statistic_equal(old, new) -> bool:
+    # Floats read back from the database are not bit exact
+    if isinstance(old, float) or isinstance(new, float):
+        return old is not None and new is not None and math.isclose(old, new, rel_tol=1e-6)
+    return old == new
+
+
+def get_statistics(trajectories: dict, pocket: str):
+    distance, angle, first_color_ball, second_color_ball, success, ball_paths = process_statistics(trajectories["tracks"], Pocket(pocket))
+    statistics = {
+        "angle": round(angle),
+        "distance": distance,
+        "success": success,
+        "first_color_ball": first_color_ball,
+        "second_color_ball": second_color_ball
+    }
+    return statistics, ball_paths
+
+
+def get_changes(old_statistics: dict, statistics: dict) -> dict:
+    return {name: [old_statistics[name], value] for name, value in statistics.items() if not statistic_equal(old_statistics[name], value)}
+
+
+def reanalyse_play(play: Play) -> dict:
+    # Analyses the play again from its recorded detections and updates it, returns the old and new value of every statistic that changed
+    if not play.detections or not os.path.exists(play.detections):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=DETECTIONS_NOT_FOUND)
+
+    trajectories = reanalyse_detections(RecordedDetections.load(play.detections))
+    statistics, ball_paths = get_statistics(trajectories, play.pocket)
+    changes = get_changes({name: getattr(play, name) for name in statistics}, statistics)
+
+    for name, value in statistics.items():
+        setattr(play, name, value)
+    play.ball_paths = ball_paths
+    play.trajectories = trajectories
+    rendered_video_cache.remove(play.id)
+
+    return changes
+
+
+def get_play_values(play: Play) -> dict:
+    # What a worker process needs of a play, ORM objects are not sent between processes
+    return {
+        "id": play.id,
+        "pocket": play.pocket,
+        "detections": play.detections,
+        "trajectories": play.trajectories,
+        "ball_paths": play.ball_paths,
+        "statistics": {name: getattr(play, name) for name in ("angle", "distance", "success", "first_color_ball", "second_color_ball")}
+    }
+
+
+def reanalyse_play_values(play: dict, source: ReanalysisSource) -> dict:
+    # Runs in the worker processes, returns the row to write back (None when nothing changed) and the changes
+    result = {"play_id": play["id"], "source": ReanalysisSource.TRAJECTORIES.value, "update": None, "changes": {}, "error": None}
+    try:
+        trajectories = None
+        if source == ReanalysisSource.DETECTIONS and play["detections"] and os.path.exists(play["detections"]):
+            trajectories = reanalyse_detections(RecordedDetections.load(play["detections"]))
+            result["source"] = ReanalysisSource.DETECTIONS.value
+
+        if trajectories is None and not play["trajectories"]:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=DETECTIONS_NOT_FOUND)
+
+        statistics, ball_paths = get_statistics(trajectories or play["trajectories"], play["pocket"])
+        result["changes"] = get_changes(play["statistics"], statistics)
+
+        if result["changes"] or ball_paths != play["ball_paths"]:
+            result["update"] = {"id": play["id"], "ball_paths": ball_paths, **statistics}
+            if trajectories is not None:
+                result["update"]["trajectories"] = trajectories
+
+    except HTTPException as http_exception:
+        result["error"] = http_exception.detail
+
+    except Exception as e:
+        result["error"] = f"{INTERNAL_SERVER_ERROR}:{str(e)}"
+
+    return result
+
+
+class ReanalysisRun:
+    """Progress of a bulk reanalysis saved after every chunk, the changes of every play are appended to a .jsonl file.
+
+    Plays are walked in id order, so a run interrupted is resumed after the last play of its last saved chunk.
+    """
+
+    def __init__(self, state: dict, directory: str = REANALYSIS_DIRECTORY):
+        self.state = state
+        self.directory = directory
+
+    @classmethod
+    def create(cls, source: ReanalysisSource, dry_run: bool = False, directory: str = REANALYSIS_DIRECTORY) -> "ReanalysisRun":
+        return cls({
+            "id": str(uuid.uuid4()),
+            "source": source.value,
+            "dry_run": dry_run,
+            "status": ReanalysisStatus.RUNNING.value,
+            "start_date": datetime.now().isoformat(),
+            "end_date": None,
+            "last_play_id": None,
+            "total": None,
+            "processed": 0,
+            "updated": 0,
+            "changed": 0,
+            "failed": 0,
+            "error": None
+        }, directory)
+
+    @classmethod
+    def load(cls, run_id: str, directory: str = REANALYSIS_DIRECTORY) -> Optional["ReanalysisRun"]:
+        try:
+            # The id names the state file, only run ids are accepted
+            run = cls({"id": str(uuid.UUID(run_id))}, directory)
+        except ValueError:
+            return None
+        if not os.path.exists(run.state_path):
+            return None
+        with open(run.state_path) as state_file:
+            run.state = json.load(state_file)
+        return run
+
+    @property
+    def id(self) -> str:
+        return self.state["id"]
+
+    @property
+    def source(self) -> ReanalysisSource:
+        return ReanalysisSource(self.state["source"])
+
+    @property
+    def state_path(self) -> str:
+        return os.path.join(self.directory, f'{self.id}.json')
+
+    @property
+    def changes_path(self) -> str:
+        return os.path.join(self.directory, f'{self.id}.jsonl')
+
+    def add_chunk(self, results: list, last_play_id: str):
+        # The changes are written before the state, a chunk repeated after a crash appends its lines again
+        with open(self.changes_path, "a") as changes_file:
+            for result in results:
+                if result["changes"] or result["error"]:
+                    changes_file.write(json.dumps({key: result[key] for key in ("play_id", "source", "changes", "error")}) + "\n")
+
+        self.state["last_play_id"] = last_play_id
+        self.state["processed"] += len(results)
+        self.state["updated"] += sum(1 for result in results if result["update"])
+        self.state["changed"] += sum(1 for result in results if result["changes"])
+        self.state["failed"] += sum(1 for result in results if result["error"])
+        self.save()
+
+    def finish(self, error: str = None):
+        self.state["status"] = ReanalysisStatus.FAILED.value if error else ReanalysisStatus.DONE.value
+        self.state["error"] = error
+        self.state["end_date"] = datetime.now().isoformat()
+        self.save()
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        saving_path = f'{self.state_path}.{str(uuid.uuid4())}'
+        with open(saving_path, "w") as state_file:
+            json.dump(self.state, state_file, indent=4)
+        os.replace(saving_path, self.state_path)
+
+    def get_changes(self, offset: int = 0, limit: int = 100) -> list:
+        if not os.path.exists(self.changes_path):
+            return []
+        changes = []
+        with open(self.changes_path) as changes_file:
+            for index, line in enumerate(changes_file):
+                if index >= offset + limit:
+                    break
+                if index >= offset:
+                    changes.append(json.loads(line))
+        return changes
+
+    def to_dict(self):
+        return self.state
+
+
+class ReanalysisLock:
+    # Held while a reanalysis runs, a lock on a file of REANALYSIS_DIRECTORY is shared by every API worker and reanalyse.py.
+    # The system releases it when the process holding it ends, so a crashed run never leaves it taken
+    def __init__(self, directory: str = REANALYSIS_DIRECTORY):
+        self.path = os.path.join(directory, "reanalysis.lock")
+        self.file_descriptor = None
+
+    def acquire(self) -> bool:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        file_descriptor = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if fcntl is not None:
+                fcntl.flock(file_descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(file_descriptor, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(file_descriptor)
+            return False
+        self.file_descriptor = file_descriptor
+        return True
+
+    def release(self):
+        if self.file_descriptor is None:
+            return
+        # Closing the file releases the lock
+        os.close(self.file_descriptor)
+        self.file_descriptor = None
+
+
+def run_reanalysis(run: ReanalysisRun, workers: int = REANALYSIS_WORKERS, chunk_size: int = REANALYSIS_CHUNK_SIZE) -> ReanalysisRun:
+    db = SessionLocal()
+    # Spawned, the worker processes do not inherit the threads and connections of the server
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) if workers > 1 else None
+    try:
+        run.state["status"] = ReanalysisStatus.RUNNING.value
+        run.state["total"] = db.query(Play).count()
+        run.save()
+        logging.info(f"Reanalysing plays from {run.source.value}, run {run.id}")
+
+        while True:
+            query = db.query(Play).options(undefer(Play.trajectories)).order_by(Play.id)
+            if run.state["last_play_id"] is not None:
+                query = query.filter(Play.id > run.state["last_play_id"])
+            plays = query.limit(chunk_size).all()
+            if not plays:
+                break
+
+            plays_values = [get_play_values(play) for play in plays]
+            map_function = executor.map if executor is not None else map
+            results = list(map_function(reanalyse_play_values, plays_values, repeat(run.source)))
+
+            updates = [result["update"] for result in results if result["update"]]
+            if updates and not run.state["dry_run"]:
+                db.bulk_update_mappings(Play, updates)
+                db.commit()
+                for update in updates:
+                    if "trajectories" in update:
+                        rendered_video_cache.remove(update["id"])
+            db.expunge_all()
+
+            run.add_chunk(results, last_play_id=plays_values[-1]["id"])
+            logging.info(f"Reanalysed {run.state['processed']}/{run.state['total']} plays, {run.state['changed']} changed, {run.state['failed']} failed")
+
+        run.finish()
+        logging.info(f"Reanalysis {run.id} done")
+
+    except Exception as e:
+        db.rollback()
+        run.finish(error=str(e))
+        logging.error(f"Error in reanalysis {run.id}: {str(e)}")
+
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        db.close()
+
+    return run
+
+
+class ReanalysisRunner:
+    # Bulk reanalyses started from the API in a background thread, one at a time in every process through the ReanalysisLock
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+        self.run = None
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, run: ReanalysisRun) -> bool:
+        with self.lock:
+            if self.running:
+                return False
+            reanalysis_lock = ReanalysisLock(run.directory)
+            if not reanalysis_lock.acquire():
+                return False
+            self.run = run
+            self.thread = threading.Thread(target=self._run, args=(run, reanalysis_lock), name=f"reanalysis-{run.id}", daemon=True)
+            self.thread.start()
+            return True
+
+    def _run(self, run: ReanalysisRun, reanalysis_lock: ReanalysisLock):
+        try:
+            run_reanalysis(run)
+        finally:
+            reanalysis_lock.release()
+
+
+reanalysis_runner = ReanalysisRunner()
@@ -0,0 +1,213 @@
+from scipy.optimize import linear_sum_assignment
+from typing import List
+
+from dotenv import load_dotenv
+
+from app.models.annotators import Detection, Rect
+
+import math, os, numpy as np
+
+
+load_dotenv()
+
+# Added to the distance between a track and a detection of another colour
+BALL_CLASS_MISMATCH_PENALTY = 200
+# Furthest a detection can be from the predicted center of a track per frame the track was not seen, in pixels
+TRACKER_GATE_DISTANCE = float(os.getenv("TRACKER_GATE_DISTANCE", 150))
+# The gate stops growing after this many frames unseen, a ball lost for long must not take the detections of others
+TRACKER_GATE_MAX_FRAMES = int(os.getenv("TRACKER_GATE_MAX_FRAMES", 3))
+# Standard deviations of the ball acceleration (pixels/frame²) and of the detected centers (pixels)
+TRACKER_ACCELERATION_NOISE = float(os.getenv("TRACKER_ACCELERATION_NOISE", 4))
+TRACKER_MEASUREMENT_NOISE = float(os.getenv("TRACKER_MEASUREMENT_NOISE", 2))
+TRACKER_INITIAL_SPEED_NOISE = 10
+GATED_COST = 1e6
+
+# Constant velocity model, the state is [x, y, vx, vy] and one frame passes between steps
+TRANSITION = np.array([[1, 0, 1, 0], [0, 1, 0, 1], [0, 0, 1, 0], [0, 0, 0, 1]], dtype=np.float64)
+ACCELERATION_COVARIANCE = np.array([[0.25, 0, 0.5, 0], [0, 0.25, 0, 0.5], [0.5, 0, 1, 0], [0, 0.5, 0, 1]], dtype=np.float64)
+
+
+def get_track_of_detections(previous_detections: List[Detection], ball_detections: List[Detection]) -> List[Detection]:
+    # Optimal one to one assignment between the tracks and the new detections, minimising the total distance
+    if not previous_detections:
+        return []
+
+    if ball_detections:
+        previous_centers = np.array([detection.rect.center.int_xy_tuple for detection in previous_detections], dtype=np.float64)
+        centers = np.array([detection.rect.center.int_xy_tuple for detection in ball_detections], dtype=np.float64)
+        previous_classes = np.array([detection.class_name for detection in previous_detections])
+        classes = np.array([detection.class_name for detection in ball_detections])
+
+        cost = np.hypot(previous_centers[:, None, 0] - centers[None, :, 0], previous_centers[:, None, 1] - centers[None, :, 1])
+        cost += BALL_CLASS_MISMATCH_PENALTY * (previous_classes[:, None] != classes[None, :])
+
+        track_indexes, detection_indexes = linear_sum_assignment(cost)
+    else:
+        track_indexes, detection_indexes = np.array([], dtype=int), np.array([], dtype=int)
+
+    return assign_detections(previous_detections, ball_detections, track_indexes, detection_indexes)
+
+
+def assign_detections(previous_detections: List[Detection], ball_detections: List[Detection], track_indexes, detection_indexes) -> List[Detection]:
+    # Matched tracks keep the order of the detections, followed by the tracks that were not found
+    new_previous_detections = []
+    matched = np.zeros(len(previous_detections), dtype=bool)
+    for track_index, detection_index in sorted(zip(track_indexes, detection_indexes), key=lambda pair: pair[1]):
+        track = previous_detections[track_index]
+        ball_detection = ball_detections[detection_index]
+        track.rect = ball_detection.rect
+        track.abled = True
+        track.centers_list.append(ball_detection.rect.center.int_xy_tuple)
+        new_previous_detections.append(track)
+        matched[track_index] = True
+
+    for track_index in np.flatnonzero(~matched):
+        track = previous_detections[track_index]
+        track.abled = False
+        new_previous_detections.append(track)
+
+    return new_previous_detections
+
+
+class BallTracker:
+    """Constant velocity Kalman filter for every track, the filters of all the tracks are stepped together.
+
+    Detections are assigned to the predicted centers instead of the last seen ones, and only within a gate.
+    Between detections the tracks can be moved to their predicted centers.
+    """
+
+    def __init__(self, tracks: List[Detection], gate_distance: float = TRACKER_GATE_DISTANCE, gate_max_frames: int = TRACKER_GATE_MAX_FRAMES,
+                 acceleration_noise: float = TRACKER_ACCELERATION_NOISE, measurement_noise: float = TRACKER_MEASUREMENT_NOISE):
+        self.rows = {track.id: row for row, track in enumerate(tracks)}
+        self.gate_distance = gate_distance
+        self.gate_max_frames = gate_max_frames
+        self.process_covariance = ACCELERATION_COVARIANCE * acceleration_noise ** 2
+        self.measurement_covariance = np.eye(2) * measurement_noise ** 2
+
+        self.state = np.zeros((len(tracks), 4), dtype=np.float64)
+        self.state[:, :2] = [track.rect.center.int_xy_tuple for track in tracks]
+        self.covariance = np.tile(np.diag([measurement_noise ** 2, measurement_noise ** 2, TRACKER_INITIAL_SPEED_NOISE ** 2, TRACKER_INITIAL_SPEED_NOISE ** 2]), (len(tracks), 1, 1))
+        self.frames_unseen = np.zeros(len(tracks), dtype=np.int64)
+
+    def step(self):
+        self.state = self.state @ TRANSITION.T
+        self.covariance = TRANSITION @ self.covariance @ TRANSITION.T + self.process_covariance
+        self.frames_unseen += 1
+
+    def correct(self, rows: np.ndarray, centers: np.ndarray):
+        covariance = self.covariance[rows]
+        innovation_covariance = covariance[:, :2, :2] + self.measurement_covariance
+        gain = covariance[:, :, :2] @ np.linalg.inv(innovation_covariance)
+        self.state[rows] += (gain @ (centers - self.state[rows, :2])[:, :, None])[:, :, 0]
+        self.covariance[rows] = covariance - gain @ covariance[:, :2, :]
+        self.frames_unseen[rows] = 0
+
+    def update(self, previous_detections: List[Detection], ball_detections: List[Detection]) -> List[Detection]:
+        # Same contract as get_track_of_detections
+        if not previous_detections:
+            return []
+
+        self.step()
+        rows = np.array([self.rows[track.id] for track in previous_detections])
+
+        if ball_detections:
+            predicted_centers = self.state[rows, :2]
+            centers = np.array([detection.rect.center.int_xy_tuple for detection in ball_detections], dtype=np.float64)
+            previous_classes = np.array([detection.class_name for detection in previous_detections])
+            classes = np.array([detection.class_name for detection in ball_detections])
+
+            distance = np.hypot(predicted_centers[:, None, 0] - centers[None, :, 0], predicted_centers[:, None, 1] - centers[None, :, 1])
+            gated = distance > self.gate_distance * np.minimum(self.frames_unseen[rows, None], self.gate_max_frames)
+            cost = distance + BALL_CLASS_MISMATCH_PENALTY * (previous_classes[:, None] != classes[None, :])
+            cost[gated] = GATED_COST
+
+            track_indexes, detection_indexes = linear_sum_assignment(cost)
+            allowed = ~gated[track_indexes, detection_indexes]
+            track_indexes, detection_indexes = track_indexes[allowed], detection_indexes[allowed]
+            if len(track_indexes):
+                self.correct(rows[track_indexes], centers[detection_indexes])
+        else:
+            track_indexes, detection_indexes = np.array([], dtype=int), np.array([], dtype=int)
+
+        return assign_detections(previous_detections, ball_detections, track_indexes, detection_indexes)
+
+    def predict(self, previous_detections: List[Detection]) -> List[Detection]:
+        # Frames the ball model did not run on, the visible balls are moved to their predicted centers
+        self.step()
+        for track in previous_detections:
+            if track.abled:
+                x, y = self.state[self.rows[track.id], :2]
+                track.rect = Rect(x=x - track.rect.width / 2, y=y - track.rect.height / 2, width=track.rect.width, height=track.rect.height)
+                track.centers_list.append(track.rect.center.int_xy_tuple)
+        return previous_detections
+
+
+def get_track_of_detections_greedy(previous_detections, ball_detections):
+    # Previous nearest neighbour tracker, kept as reference for benchmarks/tracker.py
+    
+    new_previous_detections = []
+    balls_and_detections = {}
+    for ball_detection in ball_detections:
+        balls_and_detections[ball_detection.id] = 0
+    
+    cont = len(ball_detections)
+    
+    while cont != 0 and (0 in balls_and_detections.values() or len(previous_detections) == len(new_previous_detections)):
+        for ball_detection in ball_detections:
+            if balls_and_detections[ball_detection.id] == 0:
+                min_dist = float('inf')
+                closest_previous_detection = None
+                center = ball_detection.rect.center.int_xy_tuple
+                for previous_detection in previous_detections:
+                    previous_center = previous_detection.rect.center.int_xy_tuple
+                    dist = math.sqrt((center[0] - previous_center[0]) ** 2 + (center[1] - previous_center[1]) ** 2)
+                    if previous_detection.class_name != ball_detection.class_name:
+                        dist += 200
+                    if min_dist > dist:
+                        min_dist = dist
+                        closest_previous_detection = previous_detection
+
+                existing = False
+                if closest_previous_detection.tracker_id in balls_and_detections.values():
+                    existing = True
+                    index = None
+                    for new_detection in new_previous_detections:
+                        if closest_previous_detection.tracker_id == new_detection.tracker_id:
+                            second_to_last_tuple, last_tuple = new_detection.centers_list[-2:]
+                            previous_distance = math.sqrt((last_tuple[0] - second_to_last_tuple[0])**2 + (last_tuple[1] - second_to_last_tuple[1]) **2)
+                                
+                            if min_dist < previous_distance:
+                                for key,value in balls_and_detections.items():
+                                    if value == new_detection.tracker_id:
+                                        balls_and_detections[key] = 0
+                                        break
+                                
+                                balls_and_detections[ball_detection.id] = closest_previous_detection.tracker_id
+                                index = new_previous_detections.index(new_detection)
+                            break
+                        
+                    if index is not None:
+                        detection_to_delete = new_previous_detections[index]
+                        detection_to_delete.centers_list.pop()
+                        del new_previous_detections[index]
+                        
+                        new_previous_detections.append(closest_previous_detection)
+                        new_previous_detections[-1].abled = True
+                        new_previous_detections[-1].rect = ball_detection.rect
+                        new_previous_detections[-1].centers_list.append(ball_detection.rect.center.int_xy_tuple)
+                                
+                if existing is False:
+                    balls_and_detections[ball_detection.id] = closest_previous_detection.tracker_id
+                    new_previous_detections.append(closest_previous_detection)
+                    new_previous_detections[-1].rect = ball_detection.rect
+                    new_previous_detections[-1].abled = True
+                    new_previous_detections[-1].centers_list.append(ball_detection.rect.center.int_xy_tuple)
+            cont -=1 
+    
+    if len(previous_detections) > len(new_previous_detections):
+        for previous_detection in previous_detections:
+            if previous_detection.tracker_id not in balls_and_detections.values():
+                previous_detection.abled = False
+                new_previous_detections.append(previous_detection)
+
+    return new_previous_detections
@@ -0,0 +1,130 @@
+from fastapi import HTTPException, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+from dotenv import load_dotenv
+
+from app.utils.literals import VIDEO_TOO_BIG
+from app.utils.video_cache import rendered_video_cache
+
+import os, uuid, shutil, tempfile
+
+
+load_dotenv()
+
+# Uploaded videos are spooled here until a play worker processes them, a tmpfs mount keeps them in memory
+VIDEO_SPOOL_DIRECTORY = os.getenv("VIDEO_SPOOL_DIRECTORY", tempfile.gettempdir())
+MAX_VIDEO_UPLOAD_SIZE = int(os.getenv("MAX_VIDEO_UPLOAD_SIZE", 200 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Room for the form fields and multipart boundaries sent with the video
+UPLOAD_FORM_OVERHEAD = 1024 * 1024
+# Requests whose body is capped before the handler parses it
+VIDEO_UPLOAD_PATH_SUFFIX = "/new_play"
+# Original clips of the plays, their processed videos are rendered from them when watched. Outside static/, which is served without authentication
+ORIGINAL_VIDEOS_DIRECTORY = os.getenv("ORIGINAL_VIDEOS_DIRECTORY", "data/original_videos/")
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class VideoUploadLimitMiddleware:
+    # Starlette reads and spools the whole multipart body before the handler runs, so the cap is enforced on the raw body.
+    # Bodies announcing a bigger Content-Length are rejected unread, the rest stop being read once they go over it
+    def __init__(self, app, max_body_size: int = MAX_VIDEO_UPLOAD_SIZE + UPLOAD_FORM_OVERHEAD):
+        self.app = app
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].rstrip("/").endswith(VIDEO_UPLOAD_PATH_SUFFIX):
+            await self.app(scope, receive, send)
+            return
+
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_body_size:
+            await self.reject(scope, receive, send)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    exceeded = True
+                    raise UploadTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            # Whatever the app answers to the interrupted body is replaced by the 413
+            if exceeded and not response_started:
+                return
+            response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+
+        if exceeded and not response_started:
+            await self.reject(scope, receive, send)
+
+    async def reject(self, scope, receive, send):
+        response = JSONResponse({"detail": VIDEO_TOO_BIG}, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        await response(scope, receive, send)
+
+
+async def spool_video_upload(video_file: UploadFile) -> str:
+    # Moves the upload Starlette already spooled to its own file, the copy runs off the event loop
+    if video_file.size is not None and video_file.size > MAX_VIDEO_UPLOAD_SIZE:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=VIDEO_TOO_BIG)
+
+    os.makedirs(VIDEO_SPOOL_DIRECTORY, exist_ok=True)
+    video_path = os.path.join(VIDEO_SPOOL_DIRECTORY, f'{str(uuid.uuid4())}.mp4')
+
+    try:
+        await run_in_threadpool(copy_upload, video_file.file, video_path)
+        return video_path
+
+    except BaseException:
+        remove_spooled_video(video_path)
+        raise
+
+
+def copy_upload(upload_file, video_path: str):
+    upload_file.seek(0)
+    with open(video_path, "wb") as spool_file:
+        shutil.copyfileobj(upload_file, spool_file, UPLOAD_CHUNK_SIZE)
+
+    if os.path.getsize(video_path) > MAX_VIDEO_UPLOAD_SIZE:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=VIDEO_TOO_BIG)
+
+
+def remove_spooled_video(video_path: str):
+    if video_path and os.path.exists(video_path):
+        os.remove(video_path)
+
+
+def remove_play_files(play):
+    # Files of a play kept outside the database, deleted with it
+    remove_spooled_video(play.original_video)
+    remove_spooled_video(play.detections)
+    rendered_video_cache.remove(play.id)
+
+
+def get_original_video_path(video_path: str) -> str:
+    return os.path.join(ORIGINAL_VIDEOS_DIRECTORY, os.path.basename(video_path))
+
+
+def keep_original_video(video_path: str) -> str:
+    os.makedirs(ORIGINAL_VIDEOS_DIRECTORY, exist_ok=True)
+    original_video_path = get_original_video_path(video_path)
+    shutil.move(video_path, original_video_path)
+    return original_video_path
@@ -0,0 +1,110 @@
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from typing import Callable
+
+from app.utils.logger import configure_logging
+
+import threading, time, os, uuid, logging
+
+
+configure_logging()
+load_dotenv()
+
+PROCESSED_VIDEOS_DIRECTORY = os.getenv("PROCESSED_VIDEOS_DIRECTORY")
+RENDERED_VIDEOS_DIRECTORY = os.getenv("RENDERED_VIDEOS_DIRECTORY", os.path.join(PROCESSED_VIDEOS_DIRECTORY or ".", "cache"))
+RENDERED_VIDEOS_CACHE_SIZE = int(os.getenv("RENDERED_VIDEOS_CACHE_SIZE", 2 * 1024 * 1024 * 1024))
+# Videos watched this recently are not evicted, their response may not have opened them yet
+RENDERED_VIDEOS_MIN_AGE = int(os.getenv("RENDERED_VIDEOS_MIN_AGE", 300))
+
+
+class RenderedVideoCache:
+    """Processed videos rendered on demand, the least recently watched are deleted when the cache is full."""
+
+    def __init__(self, directory: str = RENDERED_VIDEOS_DIRECTORY, max_size: int = RENDERED_VIDEOS_CACHE_SIZE, min_age: int = RENDERED_VIDEOS_MIN_AGE):
+        self.directory = directory
+        self.max_size = max_size
+        self.min_age = min_age
+        self.lock = threading.Lock()
+        self.eviction_lock = threading.Lock()
+        # Lock of every play in use and how many threads use it, removed when the last one is done
+        self.play_locks = {}
+
+    def get_path(self, play_id: str) -> str:
+        return os.path.join(self.directory, f'{play_id}.mp4')
+
+    def get_or_render(self, play_id: str, render: Callable[[str], None]) -> str:
+        # render writes the video to the given path, only one thread renders each play
+        video_path = self.get_path(play_id)
+        with self._lock_play(play_id):
+            if os.path.exists(video_path):
+                # The modification time is the last access, it orders the eviction
+                os.utime(video_path)
+                return video_path
+
+            os.makedirs(self.directory, exist_ok=True)
+            rendering_path = os.path.join(self.directory, f'{play_id}.{str(uuid.uuid4())}.rendering.mp4')
+            try:
+                render(rendering_path)
+                os.replace(rendering_path, video_path)
+            finally:
+                if os.path.exists(rendering_path):
+                    os.remove(rendering_path)
+
+        logging.info(f"Rendered video of play {play_id}")
+        self.evict(keep=video_path)
+        return video_path
+
+    def remove(self, play_id: str):
+        # The trajectories of the play changed, its video is rendered again the next time it is watched
+        with self._lock_play(play_id):
+            if os.path.exists(self.get_path(play_id)):
+                os.remove(self.get_path(play_id))
+
+    def evict(self, keep: str = None):
+        with self.eviction_lock:
+            videos = []
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if name.endswith(".rendering.mp4") or not os.path.isfile(path):
+                    continue
+                stat = os.stat(path)
+                videos.append((stat.st_mtime, stat.st_size, path, name[:-len(".mp4")]))
+
+            total_size = sum(size for _, size, _, _ in videos)
+            now = time.time()
+            for mtime, size, path, play_id in sorted(videos):
+                if total_size <= self.max_size:
+                    break
+                if path == keep or now - mtime < self.min_age:
+                    continue
+
+                # A play being rendered or fetched is skipped, as one watched again since it was listed
+                with self._lock_play(play_id, blocking=False) as locked:
+                    if not locked or not os.path.exists(path) or os.stat(path).st_mtime != mtime:
+                        continue
+                    os.remove(path)
+                total_size -= size
+                logging.info(f"Evicted {path} from the rendered videos cache")
+
+    @contextmanager
+    def _lock_play(self, play_id: str, blocking: bool = True):
+        with self.lock:
+            play_lock, users = self.play_locks.get(play_id, (None, 0))
+            play_lock = play_lock or threading.Lock()
+            self.play_locks[play_id] = (play_lock, users + 1)
+
+        locked = play_lock.acquire(blocking)
+        try:
+            yield locked
+        finally:
+            if locked:
+                play_lock.release()
+            with self.lock:
+                play_lock, users = self.play_locks[play_id]
+                if users == 1:
+                    del self.play_locks[play_id]
+                else:
+                    self.play_locks[play_id] = (play_lock, users - 1)
+
+
+rendered_video_cache = RenderedVideoCache()
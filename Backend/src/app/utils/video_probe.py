@@ -0,0 +1,93 @@
+from dataclasses import dataclass, fields
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+
+from app.utils.literals import VIDEO_NOT_READABLE, VIDEO_RESOLUTION_TOO_BIG, VIDEO_TOO_LONG
+
+import os, math, cv2
+
+
+load_dotenv()
+
+# Frames analysed at most per play, after downsampling
+MAX_VIDEO_FRAMES = int(os.getenv("MAX_VIDEO_FRAMES", 450))
+MAX_VIDEO_PIXELS = int(os.getenv("MAX_VIDEO_PIXELS", 3840 * 2160))
+# Slow motion videos are analysed at about this rate, only one of every few frames is decoded
+ANALYSIS_FPS = float(os.getenv("ANALYSIS_FPS", 30))
+
+
+def exceeds_max_frames(frames: int) -> bool:
+    # The only comparison with MAX_VIDEO_FRAMES, frames counts the analysed frames up to the current one
+    return frames > MAX_VIDEO_FRAMES
+
+
+@dataclass
+class VideoProbe:
+    # Container metadata, read before decoding any frame
+    frame_count: int
+    fps: float
+    width: int
+    height: int
+    codec: str
+
+    @classmethod
+    def from_capture(cls, video: cv2.VideoCapture) -> "VideoProbe":
+        fourcc = int(video.get(cv2.CAP_PROP_FOURCC))
+        return cls(
+            frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT)),
+            fps = float(video.get(cv2.CAP_PROP_FPS)),
+            width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            codec = "".join(chr((fourcc >> 8 * i) & 0xFF) for i in range(4)).strip("\x00")
+        )
+
+    @classmethod
+    def from_dict(cls, video: dict) -> "VideoProbe":
+        return cls(**{field.name: video[field.name] for field in fields(cls)})
+
+    @property
+    def frame_step(self) -> int:
+        # One of every frame_step frames is analysed
+        if self.fps <= ANALYSIS_FPS:
+            return 1
+        return max(1, round(self.fps / ANALYSIS_FPS))
+
+    @property
+    def analysis_fps(self) -> float:
+        return self.fps / self.frame_step
+
+    @property
+    def analysis_frames(self) -> int:
+        return math.ceil(self.frame_count / self.frame_step)
+
+    def check(self):
+        # Rejects the videos that can not be analysed before any frame is decoded
+        if self.fps <= 0 or self.width <= 0 or self.height <= 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=VIDEO_NOT_READABLE)
+
+        if self.width * self.height > MAX_VIDEO_PIXELS:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=VIDEO_RESOLUTION_TOO_BIG)
+
+        # Some containers do not store the frame count, those are stopped while processing
+        if self.frame_count > 0 and exceeds_max_frames(self.analysis_frames):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=VIDEO_TOO_LONG)
+
+    def to_dict(self):
+        return {
+            "frame_count": self.frame_count,
+            "fps": self.fps,
+            "width": self.width,
+            "height": self.height,
+            "codec": self.codec,
+            "frame_step": self.frame_step
+        }
+
+
+def probe_video(video_path: str) -> VideoProbe:
+    video = cv2.VideoCapture(video_path)
+    try:
+        if not video.isOpened():
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=VIDEO_NOT_READABLE)
+        return VideoProbe.from_capture(video)
+    finally:
+        video.release()
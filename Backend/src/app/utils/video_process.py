@@ -1,12 +1,24 @@
 from fastapi import APIRouter, HTTPException, status
 from dotenv import load_dotenv
-from ultralytics import YOLO
-from typing import Generator
-
-from app.models.annotators import BaseAnnotator, Detection, LineAnnotator, MarkerAnnotator, VideoConfig, assign_colors_to_balls_colour_model
+from typing import Generator, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from contextlib import suppress
+from itertools import islice
+
+from app.models.annotators import BaseAnnotator, Detection, FrameCompositor, Rect, LineAnnotator, MarkerAnnotator, VideoConfig, assign_colors_to_balls_colour_model, get_minimap_photo
 from app.models.custom_color import Color
+from app.utils.detections_cache import DetectionsRecorder, RecordedDetections
+from app.utils.calibration import calibration_matches, create_calibration, get_calibration_homography, get_calibration_keypoints_detections, get_table_region
+from app.utils.inference import BALL_DETECTION_IMAGE_SIZE, ball_colour_model, keypoints_model
+from app.utils.motion import MOTION_GATE, FrameAction, MotionGate
+from app.utils.pipeline import ThreadedVideoWriter, get_frame_buffers, get_video_writer, prefetch
+from app.utils.profiling import PipelineProfile
+from app.utils.tracker import BallTracker
+from app.utils.video_probe import VideoProbe, exceeds_max_frames
 
-import shutil, math, cv2, os, uuid, numpy as np 
+import math, multiprocessing, cv2, os, uuid, logging, numpy as np 
 
 from app.utils.literals import (
     INTERNAL_SERVER_ERROR,
@@ -17,13 +29,27 @@ from app.utils.literals import (
 load_dotenv()
 
 SNOOKER_TABLE_MAP = os.getenv("SNOOKER_TABLE_MAP")
-KEYPOINTS_MODEL_ROUTE = os.getenv("KEYPOINTS_MODEL_ROUTE")
-COLOUR_BALL_MODEL_ROUTE = os.getenv("COLOUR_BALL_MODEL_ROUTE")
 PLAYS_IMAGES_DIRECTORY = os.getenv("PLAYS_IMAGES_DIRECTORY")
 PROCESSED_VIDEOS_DIRECTORY = os.getenv("PROCESSED_VIDEOS_DIRECTORY")
-
-ball_colour_model = YOLO(COLOUR_BALL_MODEL_ROUTE)
-keypoints_model = YOLO(KEYPOINTS_MODEL_ROUTE)
+# Frames decoded ahead and sent together to the ball model, 1 disables batching
+BALL_DETECTION_BATCH_SIZE = int(os.getenv("BALL_DETECTION_BATCH_SIZE", 8))
+# Processing stops once the shot started and no ball moved more than SHOT_SETTLED_DISTANCE minimap pixels
+# in the last SHOT_SETTLED_FRAMES frames, 0 frames processes the whole video
+SHOT_SETTLED_FRAMES = int(os.getenv("SHOT_SETTLED_FRAMES", 30))
+SHOT_SETTLED_DISTANCE = float(os.getenv("SHOT_SETTLED_DISTANCE", 10))
+# Once the table is located the ball model only sees the part of the frames around it
+TABLE_REGION_DETECTION = os.getenv("TABLE_REGION_DETECTION", "True").lower() == "true"
+# Processes decoding and detecting frame ranges of the same clip at once, 1 processes every clip in its play worker.
+# Only used when the video is not rendered, the renderer needs every frame in order
+VIDEO_SEGMENT_WORKERS = int(os.getenv("VIDEO_SEGMENT_WORKERS", 1))
+# Analysed frames of every segment. Segments are detected in order, the ones after the shot settled are cancelled
+VIDEO_SEGMENT_FRAMES = int(os.getenv("VIDEO_SEGMENT_FRAMES", 60))
+
+# A ball starts moving when its minimap center moves more than MOVEMENT_DISTANCE pixels in MOVEMENT_STEP frames
+MOVEMENT_STEP = 5
+MOVEMENT_DISTANCE = 30
+# Moving balls needed to analyse a play, the cue ball and the object ball
+SHOT_BALLS = 2
 
 POCKETS = {
         "BottomLeft": [44, 1837],
@@ -57,10 +83,20 @@ KNOWN_COLORS = {
 }
 
 # PROCESS VIDEO
-def generate_frames(video_file: str) -> Generator[np.ndarray, None, None]:
-    video = cv2.VideoCapture(video_file)
-
+def skip_frames(video: cv2.VideoCapture, frames: int) -> bool:
+    # Frames dropped by downsampling are only grabbed, never decoded
+    for _ in range(frames):
+        if not video.grab():
+            return False
+    return True
+
+def generate_frames(video: cv2.VideoCapture, frame_step: int = 1) -> Generator[np.ndarray, None, None]:
+    first_frame = True
     while video.isOpened():
+        if not first_frame and not skip_frames(video, frame_step - 1):
+            break
+        first_frame = False
+        
         success, frame = video.read()
 
         if not success:
@@ -69,6 +105,120 @@ def generate_frames(video_file: str) -> Generator[np.ndarray, None, None]:
         yield frame
 
     video.release()
+
+def generate_gated_frames(video: cv2.VideoCapture, motion_gate: MotionGate, grab: bool = True, frame_step: int = 1, profile: PipelineProfile = None):
+    # Yields every analysed frame with what to do with it.
+    # While the table is static some frames are only grabbed, they are yielded as None
+    profile = profile or PipelineProfile(trace=False)
+    grabbed_frames = 0
+    first_frame = True
+    while video.isOpened():
+        if not first_frame and frame_step > 1:
+            with profile.stage("decode"):
+                skipped = skip_frames(video, frame_step - 1)
+            if not skipped:
+                break
+            profile.count("frames_downsampled", frame_step - 1)
+        first_frame = False
+        
+        if grab and motion_gate.can_grab(grabbed_frames):
+            with profile.stage("decode"):
+                grabbed = video.grab()
+            if not grabbed:
+                break
+            grabbed_frames += 1
+            motion_gate.skip()
+            profile.count("frames_grabbed")
+            yield None, FrameAction.REUSE
+            continue
+        
+        with profile.stage("decode"):
+            success, frame = video.read()
+        if not success:
+            break
+        
+        grabbed_frames = 0
+        with profile.stage("motion_gate"):
+            action = motion_gate.update(frame)
+        yield frame, action
+
+    video.release()
+
+MODEL_STRIDE = 32
+
+@dataclass
+class DetectionRegion:
+    # Part of the frames the ball model sees, the whole frames until it is set.
+    # The region is scaled as much as the whole frame would be, the balls keep their size and the model gets fewer pixels
+    x: int = 0
+    y: int = 0
+    width: Optional[int] = None
+    height: Optional[int] = None
+    imgsz: Optional[int] = None
+
+    def set(self, region, frame: np.ndarray):
+        if region is not None:
+            self.x, self.y, self.width, self.height = region
+            scale = BALL_DETECTION_IMAGE_SIZE / max(frame.shape[:2])
+            self.imgsz = min(BALL_DETECTION_IMAGE_SIZE, math.ceil(max(self.width, self.height) * scale / MODEL_STRIDE) * MODEL_STRIDE)
+
+    @property
+    def offset(self):
+        return self.x, self.y
+
+    def crop(self, frame: np.ndarray) -> np.ndarray:
+        if self.width is None:
+            return frame
+        return frame[self.y:self.y + self.height, self.x:self.x + self.width]
+
+def generate_ball_predictions(frame_iterator, batch_size: int = BALL_DETECTION_BATCH_SIZE, region: DetectionRegion = None, profile: PipelineProfile = None):
+    # Runs the ball model over batches of the frames to detect, yielding every frame with its prediction and the offset of its boxes in order.
+    # Reused frames get the prediction of the last detected frame, predicted frames get None
+    region = region or DetectionRegion()
+    profile = profile or PipelineProfile(trace=False)
+    items = []
+    batch = []
+    last_prediction = None
+    offset = region.offset
+    
+    def detected_items():
+        nonlocal items, batch, last_prediction, offset
+        # The region may change between batches, never inside one
+        batch_offset = region.offset
+        model_arguments = {"imgsz": region.imgsz} if region.imgsz else {}
+        predictions = []
+        if batch:
+            with profile.stage("ball_colour_model"):
+                predictions = ball_colour_model([region.crop(frame) for frame in batch], verbose=False, **model_arguments)
+            profile.count("ball_colour_model_batches")
+            profile.count("frames_detected", len(batch))
+            profile.count("detections", sum(len(prediction.boxes) for prediction in predictions))
+        predictions = iter(predictions)
+        for frame, action in items:
+            if action == FrameAction.DETECT:
+                last_prediction = next(predictions)
+                offset = batch_offset
+            else:
+                profile.count("frames_predicted" if action == FrameAction.PREDICT else "frames_reused")
+            yield frame, None if action == FrameAction.PREDICT else last_prediction, offset
+        items = []
+        batch = []
+    
+    for frame, action in frame_iterator:
+        items.append((frame, action))
+        if action == FrameAction.DETECT:
+            batch.append(frame)
+        if len(batch) == batch_size:
+            yield from detected_items()
+
+    yield from detected_items()
+  
+@lru_cache(maxsize=1)
+def get_snooker_table_map() -> np.ndarray:
+    # Read once per process and shared by all the videos, it is read only so nobody draws on it
+    snooker_table_map = cv2.imread(SNOOKER_TABLE_MAP)
+    snooker_table_map.setflags(write=False)
+    return snooker_table_map
   
 def get_keypoints_info():
     
@@ -162,269 +312,586 @@ def delete_repeated_or_bad_detected_keypoints(prediction):
     
     return cls, xywh
 
-def get_track_of_detections(previous_detections, ball_detections):
-    
-    new_previous_detections = []
-    balls_and_detections = {}
-    for ball_detection in ball_detections:
-        balls_and_detections[ball_detection.id] = 0
-    
-    cont = len(ball_detections)
-    
-    while cont != 0 and (0 in balls_and_detections.values() or len(previous_detections) == len(new_previous_detections)):
-        for ball_detection in ball_detections:
-            if balls_and_detections[ball_detection.id] == 0:
-                min_dist = float('inf')
-                closest_previous_detection = None
-                center = ball_detection.rect.center.int_xy_tuple
-                for previous_detection in previous_detections:
-                    previous_center = previous_detection.rect.center.int_xy_tuple
-                    dist = math.sqrt((center[0] - previous_center[0]) ** 2 + (center[1] - previous_center[1]) ** 2)
-                    if previous_detection.class_name != ball_detection.class_name:
-                        dist += 200
-                    if min_dist > dist:
-                        min_dist = dist
-                        closest_previous_detection = previous_detection
-
-                existing = False
-                if closest_previous_detection.tracker_id in balls_and_detections.values():
-                    existing = True
-                    index = None
-                    for new_detection in new_previous_detections:
-                        if closest_previous_detection.tracker_id == new_detection.tracker_id:
-                            second_to_last_tuple, last_tuple = new_detection.centers_list[-2:]
-                            previous_distance = math.sqrt((last_tuple[0] - second_to_last_tuple[0])**2 + (last_tuple[1] - second_to_last_tuple[1]) **2)
-                                
-                            if min_dist < previous_distance:
-                                for key,value in balls_and_detections.items():
-                                    if value == new_detection.tracker_id:
-                                        balls_and_detections[key] = 0
-                                        break
-                                
-                                balls_and_detections[ball_detection.id] = closest_previous_detection.tracker_id
-                                index = new_previous_detections.index(new_detection)
-                            break
-                        
-                    if index is not None:
-                        detection_to_delete = new_previous_detections[index]
-                        detection_to_delete.centers_list.pop()
-                        del new_previous_detections[index]
-                        
-                        new_previous_detections.append(closest_previous_detection)
-                        new_previous_detections[-1].abled = True
-                        new_previous_detections[-1].rect = ball_detection.rect
-                        new_previous_detections[-1].centers_list.append(ball_detection.rect.center.int_xy_tuple)
-                                
-                if existing is False:
-                    balls_and_detections[ball_detection.id] = closest_previous_detection.tracker_id
-                    new_previous_detections.append(closest_previous_detection)
-                    new_previous_detections[-1].rect = ball_detection.rect
-                    new_previous_detections[-1].abled = True
-                    new_previous_detections[-1].centers_list.append(ball_detection.rect.center.int_xy_tuple)
-            cont -=1 
-    
-    if len(previous_detections) > len(new_previous_detections):
-        for previous_detection in previous_detections:
-            if previous_detection.tracker_id not in balls_and_detections.values():
-                previous_detection.abled = False
-                new_previous_detections.append(previous_detection)
-
-    return new_previous_detections
-
-def get_video_writer(target_video_path: str, video_config: VideoConfig) -> cv2.VideoWriter:
-    video_target_dir = os.path.dirname(os.path.abspath(target_video_path))
-    os.makedirs(video_target_dir, exist_ok=True)
-    return cv2.VideoWriter(
-        target_video_path, 
-        fourcc=cv2.VideoWriter_fourcc(*"mp4v"), 
-        fps=video_config.fps, 
-        frameSize=(video_config.width, video_config.height), 
-        isColor=True
-    )
+class MinimapProjector:
+    # Projects all the ball centres of a frame to the tactical map plane in one call, reusing the same buffers every frame
+    def __init__(self, homography: np.ndarray, max_points: int):
+        self.homography = homography
+        self.centers = np.empty((max(max_points, 1), 1, 2), dtype=np.float64)
+        self.projected = np.empty_like(self.centers)
+
+    def project(self, detections) -> np.ndarray:
+        points = len(detections)
+        if points > len(self.centers):
+            self.centers = np.empty((points, 1, 2), dtype=np.float64)
+            self.projected = np.empty_like(self.centers)
+
+        for i, detection in enumerate(detections):
+            self.centers[i, 0] = detection.rect.center.int_xy_tuple
+
+        cv2.perspectiveTransform(self.centers[:points], self.homography, self.projected[:points])
+        return self.projected[:points, 0]
+
+class ShotSettlement:
+    # Tells when the balls of a shot stopped moving, using the same movement onset as process_statistics
+    def __init__(self, frames: int = SHOT_SETTLED_FRAMES, distance: float = SHOT_SETTLED_DISTANCE):
+        self.frames = frames
+        self.distance = distance
+        self.moved_balls = set()
+    
+    def update(self, detections) -> bool:
+        if self.frames <= 0:
+            return False
+        
+        for detection in detections:
+            centers = detection.centers_minimap_list
+            if detection.id not in self.moved_balls and len(centers) > MOVEMENT_STEP + 1:
+                if calculate_distance(centers[-1], centers[-MOVEMENT_STEP - 2]) > MOVEMENT_DISTANCE:
+                    self.moved_balls.add(detection.id)
+        
+        if len(self.moved_balls) < SHOT_BALLS:
+            return False
+        
+        # Pocketed balls keep their last center, so they count as stopped
+        for detection in detections:
+            centers = detection.centers_minimap_list
+            if len(centers) <= self.frames:
+                return False
+            last_centers = np.asarray(centers[-self.frames - 1:], dtype=np.float64)
+            if np.any(np.hypot(*(last_centers - last_centers[-1]).T) > self.distance):
+                return False
+        
+        return True
+
+def draw_minimap(minimap: np.ndarray, detections, minimap_points, line_annotator: LineAnnotator) -> np.ndarray:
+    ball_colours = assign_colors_to_balls_colour_model(detections)
+    
+    minimap_balls_drawn = False
+    for detection, minimap_point in zip(detections, minimap_points):
+        if detection.abled == True:
+            ball_colour = ball_colours[detection.id]
+            if ball_colour is not None:
+                colour = Color(ball_colour[0],ball_colour[1],ball_colour[2])
+                minimap = cv2.circle(minimap, (int(minimap_point[0]), int(minimap_point[1])), radius=15, color=colour.rgb_tuple , thickness=-1)
+                minimap_balls_drawn = True
+    
+    # Trails go over all the balls of the minimap
+    if minimap_balls_drawn:
+        minimap = line_annotator.annotate_minimap( image = minimap, detections = detections )
+    
+    return minimap
+
+class PlayRenderer:
+    # Annotates the frames of a play, combines them with the minimap and encodes the processed video
+    def __init__(self, processed_video_path: str, fps: float, profile: PipelineProfile = None):
+        self.processed_video_path = processed_video_path
+        self.fps = fps
+        self.profile = profile or PipelineProfile(trace=False)
+        self.base_annotator = BaseAnnotator()
+        self.marker_annotator = MarkerAnnotator(color=Color.from_hex_string('#FFFF00'))
+        self.line_annotator = LineAnnotator()
+        self.frame_compositor = None
+        self.video_writer = None
+
+    def render(self, frame: np.ndarray, detections, minimap_points, keypoints_detections):
+        if self.frame_compositor is None:
+            self.frame_compositor = FrameCompositor(frame_width=frame.shape[1], frame_height=frame.shape[0], table_map=get_snooker_table_map(), buffers=get_frame_buffers())
+        
+        with self.profile.stage("annotation"):
+            minimap = draw_minimap(self.frame_compositor.reset_minimap(), detections, minimap_points, self.line_annotator)
+            
+            # The decoded frame is not used again, it is annotated in place
+            annotated_image = self.base_annotator.annotate( image = frame, detections = detections )
+            annotated_image = self.marker_annotator.annotate( image = annotated_image, detections = keypoints_detections )
+            annotated_image = self.line_annotator.annotate( image = annotated_image, detections = detections )
+            
+            # Combine annotated frame and tactical map in one image with colored border separation
+            final_img = self.frame_compositor.compose(annotated_image, minimap)
+        
+        if self.video_writer is None:
+            video_config = VideoConfig(width=final_img.shape[1], height=final_img.shape[0], fps=self.fps)
+            self.video_writer = ThreadedVideoWriter(get_video_writer(target_video_path=self.processed_video_path, video_config=video_config), profile=self.profile)
+        
+        self.video_writer.write(final_img)
+
+    def release(self):
+        if self.video_writer is not None:
+            self.video_writer.release()
 
+    def remove_unfinished_video(self):
+        if self.video_writer is not None:
+            with suppress(Exception):
+                self.video_writer.release()
+        if os.path.exists(self.processed_video_path):
+            os.remove(self.processed_video_path)
 
+def save_minimap_photo(detections, minimap_points, frame_height: int) -> str:
+    minimap = draw_minimap(get_snooker_table_map().copy(), detections, minimap_points, LineAnnotator())
+    
+    photo_path = os.path.join(PLAYS_IMAGES_DIRECTORY, f'{str(uuid.uuid4())}.png')
+    cv2.imwrite(photo_path, get_minimap_photo(minimap, frame_height))
+    return photo_path
+
+def get_trajectories(detections, keypoints_detections, start_frame: int, video_probe: VideoProbe):
+    # Everything needed to analyse or render the play again without running the models, frames are counted after downsampling
+    return {
+        "fps": video_probe.analysis_fps,
+        "frame_step": video_probe.frame_step,
+        "video": video_probe.to_dict(),
+        "start_frame": start_frame,
+        "keypoints": [keypoint.rect.to_dict() for keypoint in keypoints_detections],
+        "tracks": [detection.to_dict() for detection in detections]
+    }
 
-def process_video(video_file):
+def get_track_to_render(track: dict) -> Detection:
+    # Same ball as in the stored track, its centers are added again frame by frame while rendering
+    return Detection(
+        id = track["id"],
+        rect = Rect(**track["rect"]),
+        class_id = track["class_id"],
+        abled = True,
+        centers_list = [],
+        centers_minimap_list = [],
+        colors_list = track["colors_list"],
+        class_name = track["class_name"],
+        confidence = track["confidence"],
+        tracker_id = track["tracker_id"]
+    )
+
+def render_play_video(original_video_path: str, trajectories: dict, processed_video_path: str, profile: PipelineProfile = None):
+    # Draws the processed video of a play again from its original clip and stored trajectories, no model is run
+    stored_tracks = trajectories["tracks"]
+    tracks = [get_track_to_render(track) for track in stored_tracks]
+    keypoints_detections = [Detection(id=str(uuid.uuid4()), rect=Rect(**keypoint), class_id=0, class_name="keypoint", confidence=1.0, abled=True) for keypoint in trajectories["keypoints"]]
+    start_frame = trajectories["start_frame"]
+    processed_frames = max((len(track["centers_minimap_list"]) for track in stored_tracks), default=0)
+    next_centers = [0] * len(tracks)
+    minimap_points = np.empty((len(tracks), 2), dtype=np.float64)
+    
+    video = None
+    frame_iterator = None
+    renderer = PlayRenderer(processed_video_path, trajectories["fps"], profile)
     try:
-        processed_video_path = os.path.join(PROCESSED_VIDEOS_DIRECTORY, f'{str(uuid.uuid4())}.mp4')
-        
-        snooker_table_map = cv2.imread(SNOOKER_TABLE_MAP)
-        snooker_table_map_aspect_ratio = snooker_table_map.shape[1] / snooker_table_map.shape[0]  # height/width
+        video = cv2.VideoCapture(original_video_path)
+        frame_iterator = prefetch(generate_frames(video, trajectories.get("frame_step", 1)))
         
-        with open("temp_video.mp4", "wb") as buffer_file:
-                shutil.copyfileobj(video_file.file, buffer_file)
+        for frame_nbr, frame in enumerate(frame_iterator, start=1):
+            if frame_nbr < start_frame:
+                continue
+            
+            frame_index = frame_nbr - start_frame
+            if frame_index >= processed_frames:
+                break
+            
+            for i, (track, stored_track) in enumerate(zip(tracks, stored_tracks)):
+                # A track is abled in the frames it was matched, keeping its last box otherwise
+                center_index = next_centers[i]
+                track.abled = center_index < len(stored_track["frames_list"]) and stored_track["frames_list"][center_index] == frame_nbr
+                if track.abled:
+                    x, y, width, height = stored_track["rects_list"][center_index]
+                    track.rect = Rect(x=x, y=y, width=width, height=height)
+                    track.centers_list.append(stored_track["centers_list"][center_index])
+                    next_centers[i] += 1
+                
+                track.centers_minimap_list.append(stored_track["centers_minimap_list"][frame_index])
+                minimap_points[i] = stored_track["centers_minimap_list"][frame_index]
+            
+            renderer.render(frame, tracks, minimap_points, keypoints_detections)
         
-        base_annotator = BaseAnnotator()
-        marker_annotator = MarkerAnnotator(color=Color.from_hex_string('#FFFF00'))
-        line_annotator = LineAnnotator()
+        renderer.release()
+
+    except Exception:
+        renderer.remove_unfinished_video()
+        raise
 
-        frame_iterator = iter(generate_frames(video_file="temp_video.mp4"))
+    finally:
+        if frame_iterator is not None:
+            frame_iterator.close()
+        if video is not None:
+            video.release()
 
-        keypoints_dict, keypoints_coords = get_keypoints_info()
+def get_keypoints_homography(keypoints_prediciton):
+    # Homography from the frame to the tactical map with the keypoints the model found, None with fewer than 4 keypoints
+    keypoints_dict, keypoints_coords = get_keypoints_info()
+    
+    keypoints_cls, keypoints_bb_xywh = delete_repeated_or_bad_detected_keypoints(keypoints_prediciton)     # Detected field keypoints (x,y,w,h) bounding boxes and cls
+    
+    labels_k = list(keypoints_cls)                                                                  # Detected field keypoints labels list
+    
+    # Convert detected numerical labels to alphabetical labels
+    detected_keypoints_labels = [keypoints_dict[i] for i in labels_k]
+    
+    # Extract detected field keypoints coordiantes on the current frame
+    detected_keypoints_labels_src_pts = np.array([list(np.round(keypoints_bb_xywh[i][:2]).astype(int)) for i in range(keypoints_bb_xywh.shape[0])])
+    
+    # Get the detected field keypoints coordinates on the tactical map
+    detected_keypoints_labels_dst_pts = np.array([keypoints_coords[i] for i in detected_keypoints_labels])
+    
+    if len(detected_keypoints_labels)>3:
+        # Always calculate homography matrix on the first frame or if it is not created in first frame if detected points > 3 
+        homog, _ = cv2.findHomography(detected_keypoints_labels_src_pts, detected_keypoints_labels_dst_pts)     # Calculate homography matrix
+        return homog
+    
+    return None
+
+def locate_table(frame: np.ndarray, frame_nbr: int, calibration, profile: PipelineProfile, detections_recorder: DetectionsRecorder = None):
+    # Homography of the frame, from the calibration of the project when the camera did not move since its last play or from the keypoints model.
+    # Returns the homography (None when the table was not found), the keypoints to draw, the calibration of the project and whether no keypoint was found
+    if frame_nbr == 1 and calibration_matches(calibration, frame):
+        # Same camera position as the last play of the project, reuse its homography and keypoints
+        if detections_recorder is not None:
+            detections_recorder.set_calibration(calibration)
+        return get_calibration_homography(calibration), get_calibration_keypoints_detections(calibration), calibration, False
+    
+    with profile.stage("keypoints_model"):
+        keypoints_prediciton = keypoints_model(frame)[0]
+    if detections_recorder is not None:
+        detections_recorder.add_keypoints_prediction(frame_nbr, keypoints_prediciton)
+    
+    with profile.stage("delete_repeated_or_bad_detected_keypoints"):
+        homog = get_keypoints_homography(keypoints_prediciton)
+    
+    no_keypoints = len(keypoints_prediciton.boxes) < 1
+    if homog is None:
+        return None, None, calibration, no_keypoints
+    
+    keypoints_detections = Detection.from_results(pred=keypoints_prediciton.boxes, names=keypoints_prediciton.names)
+    return homog, keypoints_detections, create_calibration(frame, homog, keypoints_prediciton), no_keypoints
+
+class PlayTracks:
+    # Tracks of the balls built frame by frame from the ball model predictions, with their centers on the tactical map
+    def __init__(self, homography: np.ndarray, profile: PipelineProfile = None):
+        self.homography = homography
+        self.profile = profile or PipelineProfile(trace=False)
+        self.detections = None
+        self.ball_tracker = None
+        self.minimap_projector = None
+        self.minimap_points = []
+        self.start_frame = None
+    
+    def update(self, frame_nbr: int, ball_colour_prediction, detection_offset):
+        # ball_colour_prediction is None in the frames the tracker predicts, the first frame needs one
+        if ball_colour_prediction is None:
+            with self.profile.stage("tracking"):
+                self.detections = self.ball_tracker.predict(self.detections)
+        
+        elif self.detections is None:
+            ball_detections = Detection.from_results(pred=ball_colour_prediction.boxes, names=ball_colour_prediction.names, offset=detection_offset)
+            cont = 1
+            for ball_detection in ball_detections:
+                ball_detection.tracker_id = cont
+                ball_detection.centers_list.append(ball_detection.rect.center.int_xy_tuple)
+                cont += 1 
+            self.detections = ball_detections
+            self.ball_tracker = BallTracker(self.detections)
+            self.start_frame = frame_nbr
+        else:
+            with self.profile.stage("tracking"):
+                ball_detections = Detection.from_results(pred=ball_colour_prediction.boxes, names=ball_colour_prediction.names, offset=detection_offset)
+                self.detections = self.ball_tracker.update(self.detections, ball_detections)
+        
+        # Frames and boxes of every center, needed to draw the play again from the trajectories
+        for detection in self.detections:
+            if detection.abled:
+                detection.frames_list.append(frame_nbr)
+                detection.rects_list.append([round(detection.rect.x, 1), round(detection.rect.y, 1), round(detection.rect.width, 1), round(detection.rect.height, 1)])
+        
+        # Transform ball coordinates from frame plane to tactical map plane using the calculated Homography matrix
+        with self.profile.stage("projection"):
+            if self.minimap_projector is None:
+                self.minimap_projector = MinimapProjector(homography=self.homography, max_points=len(self.detections))
+            self.minimap_points = self.minimap_projector.project(self.detections)
+            for detection, dest_point in zip(self.detections, self.minimap_points.tolist()):
+                detection.centers_minimap_list.append(dest_point)
+        
+        return self.detections
+
+@dataclass
+class VideoSegment:
+    # Range of analysed frames, counted from 0 after downsampling. The last segment has no end, it reads until the video does
+    start: int
+    frames: Optional[int]
+
+def split_video_segments(start: int, analysis_frames: int, segment_frames: int = VIDEO_SEGMENT_FRAMES) -> List[VideoSegment]:
+    segment_frames = max(segment_frames, 1)
+    segments_count = max(1, math.ceil((analysis_frames - start) / segment_frames))
+    segments = [VideoSegment(start=start + i * segment_frames, frames=segment_frames) for i in range(segments_count)]
+    segments[-1].frames = None
+    return segments
+
+def init_segment_worker(workers: int):
+    # The segment workers share the cores, the runtimes of the models read their thread count before they are imported
+    os.environ.setdefault("OMP_NUM_THREADS", str(max(1, (os.cpu_count() or 1) // workers)))
+    cv2.setNumThreads(1)
+
+@lru_cache(maxsize=1)
+def get_segment_executor() -> ProcessPoolExecutor:
+    # Shared by every play, each process loads the models the first time it detects a segment and keeps them.
+    # Spawned, the workers do not inherit the threads of the server
+    return ProcessPoolExecutor(max_workers=VIDEO_SEGMENT_WORKERS, mp_context=multiprocessing.get_context("spawn"), initializer=init_segment_worker, initargs=(VIDEO_SEGMENT_WORKERS,))
+
+def detect_segment(video_path: str, segment: VideoSegment, frame_step: int, region: DetectionRegion):
+    # Runs in a segment worker, decodes its frames and runs the ball model over them.
+    # Only the raw model outputs go back to the play worker, in the arrays of the recorded detections, the frames never leave this process
+    profile = PipelineProfile(trace=False)
+    recorder = DetectionsRecorder()
+    video = None
+    frame_iterator = None
+    try:
+        video = cv2.VideoCapture(video_path)
+        video.set(cv2.CAP_PROP_POS_FRAMES, segment.start * frame_step)
+        motion_gate = MotionGate() if MOTION_GATE else MotionGate(pixels=0)
+        frame_iterator = prefetch(islice(generate_gated_frames(video, motion_gate, frame_step=frame_step, profile=profile), segment.frames))
+        for _, ball_colour_prediction, detection_offset in generate_ball_predictions(frame_iterator, region=region, profile=profile):
+            recorder.add_ball_prediction(ball_colour_prediction, detection_offset)
+    finally:
+        if frame_iterator is not None:
+            frame_iterator.close()
+        if video is not None:
+            video.release()
+    
+    stages, counters = profile.totals()
+    return recorder.to_arrays(), stages, counters
+
+def process_video_segments(video: cv2.VideoCapture, video_path: str, video_probe: VideoProbe, calibration=None, profile: PipelineProfile = None, detections_recorder: DetectionsRecorder = None):
+    # The table is located here in the first frames, then the rest of the clip is split in segments decoded and detected at once in the segment workers.
+    # Their detections are tracked here in order like the detections of a single pass, so the tracks go on across the segment boundaries.
+    # Returns the same as process_video without render
+    profile = profile or PipelineProfile(trace=False)
+    
+    frame_nbr = 0
+    homog = None
+    frame_height = None
+    frames_without_detections = 0
+    detection_region = DetectionRegion()
+    for frame in generate_frames(video, video_probe.frame_step):
+        frame_nbr += 1
+        profile.count("frames_located")
+        frame_height = frame.shape[0]
+        homog, keypoints_detections, calibration, no_keypoints = locate_table(frame, frame_nbr, calibration, profile, detections_recorder)
+        frames_without_detections += no_keypoints
+        
+        if homog is not None:
+            if TABLE_REGION_DETECTION:
+                detection_region.set(get_table_region(homog, frame.shape[1], frame.shape[0], get_snooker_table_map().shape[1::-1]), frame)
+            break
+        
+        if frames_without_detections > 10 or exceeds_max_frames(frame_nbr):
+            break
+    
+    if homog is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=NOT_POSSIBLE_TO_RECOGNISE_PLAY_OF_VIDEO)
+    
+    # The ball model did not run on the frames before the table was found
+    if detections_recorder is not None:
+        for _ in range(frame_nbr - 1):
+            detections_recorder.add_ball_prediction(None, (0, 0))
+    
+    segments = split_video_segments(frame_nbr - 1, video_probe.analysis_frames)
+    executor = get_segment_executor()
+    logging.info(f"Detecting {len(segments)} segments of the video from frame {frame_nbr}")
+    
+    # At most one segment per worker is submitted ahead, few segments are detected in vain when the shot settles
+    futures = []
+    def submit_segments(segments_ahead: int):
+        while len(futures) < min(len(segments), segments_ahead):
+            futures.append(executor.submit(detect_segment, video_path, segments[len(futures)], video_probe.frame_step, detection_region))
+    
+    play_tracks = None
+    previous_detections = None
+    shot_settlement = ShotSettlement()
+    shot_settled = False
+    try:
+        for segment_index, segment in enumerate(segments):
+            submit_segments(segment_index + VIDEO_SEGMENT_WORKERS)
+            with profile.stage("segment_wait"):
+                segment_arrays, segment_stages, segment_counters = futures[segment_index].result()
+            profile.merge(segment_stages, segment_counters)
+            
+            for segment_frame_nbr, ball_colour_prediction, detection_offset in RecordedDetections(segment_arrays).ball_frames():
+                if frames_without_detections > 10:
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=NOT_POSSIBLE_TO_RECOGNISE_PLAY_OF_VIDEO)
+                
+                frame_nbr = segment.start + segment_frame_nbr
+                if exceeds_max_frames(frame_nbr):
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=VIDEO_TOO_LONG)
+                
+                profile.count("frames")
+                if detections_recorder is not None:
+                    detections_recorder.add_ball_prediction(ball_colour_prediction, detection_offset)
+                
+                if ball_colour_prediction is not None and len(ball_colour_prediction.boxes)<1:
+                    frames_without_detections += 1
+                
+                if play_tracks is not None or ball_colour_prediction is not None:
+                    if play_tracks is None:
+                        play_tracks = PlayTracks(homog, profile)
+                    previous_detections = play_tracks.update(frame_nbr, ball_colour_prediction, detection_offset)
+                    
+                    if shot_settlement.update(previous_detections):
+                        shot_settled = True
+                        break
+            
+            if shot_settled:
+                break
+    
+    finally:
+        # Segments after the shot settled are not detected if they did not start yet
+        for future in futures:
+            future.cancel()
+    
+    if previous_detections is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=NOT_POSSIBLE_TO_RECOGNISE_PLAY_OF_VIDEO)
+    
+    with profile.stage("minimap_photo"):
+        photo_path = save_minimap_photo(previous_detections, play_tracks.minimap_points, frame_height)
+    
+    trajectories = get_trajectories(previous_detections, keypoints_detections, play_tracks.start_frame, video_probe)
+    
+    return trajectories, photo_path, None, calibration
+
+def process_video(video_path, calibration=None, render=True, profile=None, detections_recorder: DetectionsRecorder = None):
+    # Without render only the trajectories and the minimap photo are produced, no video is drawn or encoded.
+    # The time of every stage and the frame counters are added to profile, the raw model outputs to detections_recorder
+    profile = profile or PipelineProfile(trace=False)
+    processed_video_path = os.path.join(PROCESSED_VIDEOS_DIRECTORY, f'{str(uuid.uuid4())}.mp4') if render else None
+    video = None
+    frame_iterator = None
+    renderer = None
+    try:
+        video = cv2.VideoCapture(video_path)
+        # The container metadata rejects the videos that can not be analysed before any inference
+        video_probe = VideoProbe.from_capture(video)
+        video_probe.check()
+        logging.info(f"Processing video {video_probe.to_dict()}")
+        if detections_recorder is not None:
+            detections_recorder.video_probe = video_probe
+        
+        # Clips with a known length are split between the segment workers
+        if not render and VIDEO_SEGMENT_WORKERS > 1 and video_probe.frame_count > 0:
+            return process_video_segments(video, video_path, video_probe, calibration, profile, detections_recorder)
+        
+        # Rendering draws every frame, so they are only grabbed without decoding when nothing is rendered
+        motion_gate = MotionGate() if MOTION_GATE else MotionGate(pixels=0)
+        frame_iterator = prefetch(generate_gated_frames(video, motion_gate, grab=not render, frame_step=video_probe.frame_step, profile=profile))
+        
+        if render:
+            renderer = PlayRenderer(processed_video_path, video_probe.analysis_fps, profile)
         
         #variables needed inside the loop
         frame_nbr = 0
         table_map_created = False
-        video_writer_created = False
-        first_video_processed = False
+        play_tracks = None
         previous_detections = None
-        last_minimap_photo = None
+        frame_height = None
         frames_without_detections = 0
-        max_width = 1920
-        max_height = 1080
+        shot_settlement = ShotSettlement()
+        detection_region = DetectionRegion()
         
-        for frame in frame_iterator:
+        for frame, ball_colour_prediction, detection_offset in generate_ball_predictions(frame_iterator, region=detection_region, profile=profile):
             if frames_without_detections > 10:
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=NOT_POSSIBLE_TO_RECOGNISE_PLAY_OF_VIDEO)
             
-            if frame_nbr > 450:
+            frame_nbr+=1
+            if exceeds_max_frames(frame_nbr):
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=VIDEO_TOO_LONG)
                
-            frame_nbr+=1
-            
-            #reset tactical map
-            snooker_table_map_copy = snooker_table_map.copy()
+            profile.count("frames")
+            if frame is not None:
+                frame_height = frame.shape[0]
+            if detections_recorder is not None:
+                detections_recorder.add_ball_prediction(ball_colour_prediction, detection_offset)
             
-            #ball prediction
-            ball_colour_prediction = ball_colour_model(frame)[0]
-            if len(ball_colour_prediction.boxes)<1:
+            #ball prediction, None in the frames the tracker predicts
+            if ball_colour_prediction is not None and len(ball_colour_prediction.boxes)<1:
                 frames_without_detections += 1
             
             #HOMOGRAPHY
-            if (frame_nbr == 1 or not table_map_created):
-                
-                keypoints_prediciton = keypoints_model(frame)[0]
-                if len(keypoints_prediciton.boxes)<1:
-                    frames_without_detections += 1
-            
-                keypoints_cls, keypoints_bb_xywh = delete_repeated_or_bad_detected_keypoints(keypoints_prediciton)     # Detected field keypoints (x,y,w,h) bounding boxes and cls
-                
-                labels_k = list(keypoints_cls)                                                                  # Detected field keypoints labels list
+            if frame is not None and not table_map_created:
+                table_homography, table_keypoints, calibration, no_keypoints = locate_table(frame, frame_nbr, calibration, profile, detections_recorder)
+                frames_without_detections += no_keypoints
                 
-                # Convert detected numerical labels to alphabetical labels
-                detected_keypoints_labels = [keypoints_dict[i] for i in labels_k]
-                
-                # Extract detected field keypoints coordiantes on the current frame
-                detected_keypoints_labels_src_pts = np.array([list(np.round(keypoints_bb_xywh[i][:2]).astype(int)) for i in range(keypoints_bb_xywh.shape[0])])
-                
-                # Get the detected field keypoints coordinates on the tactical map
-                detected_keypoints_labels_dst_pts = np.array([keypoints_coords[i] for i in detected_keypoints_labels])
-                
-                if len(detected_keypoints_labels)>3:
-                    # Always calculate homography matrix on the first frame or if it is not created in first frame if detected points > 3 
-                    homog, _ = cv2.findHomography(detected_keypoints_labels_src_pts, detected_keypoints_labels_dst_pts)     # Calculate homography matrix
+                if table_homography is not None:
+                    homog, keypoints_detections = table_homography, table_keypoints
                     table_map_created = True
+                    if TABLE_REGION_DETECTION:
+                        detection_region.set(get_table_region(homog, frame.shape[1], frame.shape[0], get_snooker_table_map().shape[1::-1]), frame)
             
-            if table_map_created:
+            if table_map_created and (play_tracks is not None or ball_colour_prediction is not None):
                 
-                ball_detections = Detection.from_results(pred=ball_colour_prediction.boxes, names=ball_colour_prediction.names)
+                if play_tracks is None:
+                    play_tracks = PlayTracks(homog, profile)
+                previous_detections = play_tracks.update(frame_nbr, ball_colour_prediction, detection_offset)
                 
-                keypoints_detections = Detection.from_results(pred=keypoints_prediciton.boxes, names=keypoints_prediciton.names)
-
-                if not first_video_processed:
-                    cont = 1
-                    for ball_detection in ball_detections:
-                        ball_detection.tracker_id = cont
-                        ball_detection.centers_list.append(ball_detection.rect.center.int_xy_tuple)
-                        cont += 1 
-                    previous_detections = ball_detections
-                    first_video_processed = True
-                else:
-                    previous_detections = get_track_of_detections(previous_detections, ball_detections)
+                if renderer is not None:
+                    renderer.render(frame, previous_detections, play_tracks.minimap_points, keypoints_detections)
                 
-                if 'homog' in locals():
-                    
-                    # Transform ball coordinates from frame plane to tactical map plance using the calculated Homography matrix
-                    pred_dst_pts = []                                                           # Initialize balls tactical map coordiantes list
-                    for detection in previous_detections:                                       # Loop over balls frame coordiantes
-                        pt = np.array(detection.rect.center.int_xy_tuple)
-                        pt = np.append(np.array(pt), np.array([1]), axis=0)                     # Covert to homogeneous coordiantes
-                        dest_point = np.matmul(homog, np.transpose(pt))                         # Apply homography transofrmation
-                        dest_point = dest_point/dest_point[2]                                   # Revert to 2D-coordiantes
-                        pred_dst_pts.append(list(np.transpose(dest_point)[:2]))                 # Update players tactical map coordiantes list
-                        detection.centers_minimap_list.append(list(np.transpose(dest_point)[:2]))
-                    pred_dst_pts = np.array(pred_dst_pts)
-                    
-
-                ball_colours = assign_colors_to_balls_colour_model(previous_detections)
-                
-                i=0
-                for detection in previous_detections:
-                    if detection.abled == True:
-                        ball_colour = ball_colours[detection.id]
-                        if ball_colour is not None:
-                            colour = Color(ball_colour[0],ball_colour[1],ball_colour[2])
-                            
-                            if 'homog' in locals():
-                                snooker_table_map_copy = cv2.circle(snooker_table_map_copy, (int(pred_dst_pts[i][0]), int(pred_dst_pts[i][1])), radius=15, color=colour.rgb_tuple , thickness=-1)
-                                snooker_table_map_copy = line_annotator.annotate_minimap( image = snooker_table_map_copy, detections = previous_detections )
-                    i+=1
-                    
-                last_minimap_photo = snooker_table_map_copy
-                
-                annotated_image = frame.copy()
-                annotated_image = base_annotator.annotate( image = annotated_image, detections = previous_detections )
-                annotated_image = marker_annotator.annotate( image = annotated_image, detections = keypoints_detections )
-                annotated_image = line_annotator.annotate( image = annotated_image, detections = previous_detections )
-                
-                # Combine annotated frame and tactical map in one image with colored border separation
-                annotated_image=cv2.copyMakeBorder(annotated_image, 40, 10, 10, 10, cv2.BORDER_CONSTANT, value= [255,255,255])
-                snooker_table_map_copy = cv2.copyMakeBorder(snooker_table_map_copy, 70, 50, 10, 10, cv2.BORDER_CONSTANT, value= [255,255,255]) 
-                
-                snooker_table_map_copy = cv2.resize(snooker_table_map_copy, (int(annotated_image.shape[0] * snooker_table_map_aspect_ratio), annotated_image.shape[0]))         
-                
-                final_img = cv2.hconcat((annotated_image, snooker_table_map_copy)) 
-
-                # Obtener las dimensiones actuales de la imagen
-                height, width = final_img.shape[:2]
-                aspect_ratio = width / height
-
-                # Redimensionar manteniendo la relación de aspecto
-                if width > max_width or height > max_height:
-                    if aspect_ratio > 1:
-                        # La imagen es más ancha que alta, ajustar al ancho máximo
-                        new_width = max_width
-                        new_height = int(max_width / aspect_ratio)
-                    else:
-                        # La imagen es más alta que ancha, ajustar a la altura máxima
-                        new_height = max_height
-                        new_width = int(max_height * aspect_ratio)
-
-                    # Redimensionar la imagen
-                    final_img = cv2.resize(final_img, (new_width, new_height))
-    
-                if not video_writer_created:
-                    final_img_width = final_img.shape[1]
-                    final_img_height = final_img.shape[0]
-                    
-                    cap = cv2.VideoCapture("temp_video.mp4")
+                if shot_settlement.update(previous_detections):
+                    break
         
-                    fps = int(cap.get(cv2.CAP_PROP_FPS))
-                    video_config = VideoConfig(width=final_img_width, height=final_img_height, fps=fps)
-                    cap.release()
-                    video_writer =  get_video_writer(target_video_path=processed_video_path, video_config=video_config)
-                    video_writer_created = True
-                
-                video_writer.write(final_img)
-                    
-        video_writer.release()
-        os.remove("temp_video.mp4")
+        if previous_detections is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=NOT_POSSIBLE_TO_RECOGNISE_PLAY_OF_VIDEO)
         
-        if last_minimap_photo is not None:
-            
-            photo_path = os.path.join(PLAYS_IMAGES_DIRECTORY, f'{str(uuid.uuid4())}.png')
-            cv2.imwrite(photo_path, snooker_table_map_copy)
-
-        detections_serializable = [d.to_dict() for d in previous_detections]
+        if renderer is not None:
+            with profile.stage("encode_flush"):
+                renderer.release()
         
-        return detections_serializable, photo_path, processed_video_path
+        with profile.stage("minimap_photo"):
+            photo_path = save_minimap_photo(previous_detections, play_tracks.minimap_points, frame_height)
+        
+        trajectories = get_trajectories(previous_detections, keypoints_detections, play_tracks.start_frame, video_probe)
+        
+        return trajectories, photo_path, processed_video_path, calibration
 
     except HTTPException as http_exception:
+        if renderer is not None:
+            renderer.remove_unfinished_video()
         raise http_exception
 
     except Exception as e:
+        if renderer is not None:
+            renderer.remove_unfinished_video()
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"{INTERNAL_SERVER_ERROR}:{str(e)}")
 
+    finally:
+        # The decoder thread has to stop before its capture is released
+        if frame_iterator is not None:
+            frame_iterator.close()
+        if video is not None:
+            video.release()
+        profile.finish()
+
+def reanalyse_detections(recorded_detections: RecordedDetections):
+    # Trajectories of a play built again from its recorded model outputs with the current keypoints filter, tracker and projection.
+    # No frame is decoded and no model is run
+    homog = None
+    keypoints_detections = []
+    if recorded_detections.calibration:
+        homog = get_calibration_homography(recorded_detections.calibration)
+        keypoints_detections = get_calibration_keypoints_detections(recorded_detections.calibration)
+
+    play_tracks = None
+    previous_detections = None
+    shot_settlement = ShotSettlement()
+    for frame_nbr, ball_colour_prediction, detection_offset in recorded_detections.ball_frames():
+        keypoints_prediciton = recorded_detections.get_keypoints_prediction(frame_nbr)
+        if homog is None and keypoints_prediciton is not None:
+            homog = get_keypoints_homography(keypoints_prediciton)
+            if homog is not None:
+                keypoints_detections = Detection.from_results(pred=keypoints_prediciton.boxes, names=keypoints_prediciton.names)
+
+        if homog is not None and (play_tracks is not None or ball_colour_prediction is not None):
+            if play_tracks is None:
+                play_tracks = PlayTracks(homog)
+            previous_detections = play_tracks.update(frame_nbr, ball_colour_prediction, detection_offset)
+
+            if shot_settlement.update(previous_detections):
+                break
+
+    if previous_detections is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=NOT_POSSIBLE_TO_RECOGNISE_PLAY_OF_VIDEO)
+
+    return get_trajectories(previous_detections, keypoints_detections, play_tracks.start_frame, recorded_detections.video_probe)
+
 
 # PROCESS STATISTICS
 def calculate_distance(point1, point2):
@@ -502,7 +969,7 @@ def process_statistics(video_info, pocket):
             centers_list = detection['centers_minimap_list']
             first_center = None
             prev_center = None
-            step = 5  # Paso de 5 para comparar con el centro 5 posiciones más adelante
+            step = MOVEMENT_STEP  # Paso de 5 para comparar con el centro 5 posiciones más adelante
             
             for index, center in enumerate(centers_list):
                 # Asegurarse de que hay al menos 5 centros más adelante
@@ -513,7 +980,7 @@ def process_statistics(video_info, pocket):
                     if prev_center is not None:
                         dist = math.sqrt((next_center[0] - prev_center[0])**2 + (next_center[1] - prev_center[1])**2)
                         
-                        if dist > 30:
+                        if dist > MOVEMENT_DISTANCE:
                             mov_in_frame.append((index, dist, detection['tracker_id'], detection['class_name'], first_center, detection['abled'], centers_list))
                             break
                         
@@ -525,7 +992,7 @@ def process_statistics(video_info, pocket):
                     # No hay suficiente centros para hacer la comparación, salir del bucle
                     break
     
-        if len(mov_in_frame) < 2:
+        if len(mov_in_frame) < SHOT_BALLS:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No ha sido posible analizar el video, revisa la calidad.")
         
         order_list = sorted(mov_in_frame, key=lambda x: x[0])
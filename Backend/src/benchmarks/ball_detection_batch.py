@@ -0,0 +1,39 @@
+"""Frames per second of the ball model for several batch sizes.
+
+Usage (from Backend/src, with the models configured in .env):
+    python -m benchmarks.ball_detection_batch path/to/video.mp4 1 4 8 16
+"""
+from app.utils.motion import FrameAction
+from app.utils.video_process import generate_ball_predictions, generate_frames
+
+import cv2, sys, time
+
+
+def measure(video_path: str, batch_size: int, max_frames: int = 450):
+    frames = []
+    for frame in generate_frames(cv2.VideoCapture(video_path)):
+        frames.append(frame)
+        if len(frames) == max_frames:
+            break
+
+    start = time.perf_counter()
+    # Every frame is detected, as when the motion gate is off
+    for _ in generate_ball_predictions(((frame, FrameAction.DETECT) for frame in frames), batch_size=batch_size):
+        pass
+    elapsed = time.perf_counter() - start
+
+    return len(frames) / elapsed
+
+
+if __name__ == "__main__":
+    video_path = sys.argv[1]
+    batch_sizes = [int(size) for size in sys.argv[2:]] or [1, 4, 8, 16]
+
+    # Warm up the model so the first measure does not pay the load
+    measure(video_path, batch_sizes[0], max_frames=8)
+
+    baseline = None
+    for batch_size in batch_sizes:
+        fps = measure(video_path, batch_size)
+        baseline = baseline or fps
+        print(f"batch {batch_size:>3}: {fps:7.2f} fps ({fps / baseline:.2f}x)")
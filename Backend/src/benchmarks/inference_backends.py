@@ -0,0 +1,142 @@
+"""Export of the models for the ONNX Runtime and OpenVINO backends, and their parity and latency against ultralytics.
+
+Usage (from Backend/src):
+    python -m benchmarks.inference_backends export --backend onnx --int8 --video clip.mp4
+    python -m benchmarks.inference_backends compare --backend onnx --int8 --video clip.mp4 --threads 4
+
+compare exits with an error when the backend finds less than --min-recall of the ultralytics detections.
+"""
+from app.utils.inference import BALL_DETECTION_IMAGE_SIZE, COLOUR_BALL_MODEL_ROUTE, KEYPOINTS_DETECTION_IMAGE_SIZE, KEYPOINTS_MODEL_ROUTE
+from app.utils.inference_backends import BACKENDS, INFERENCE_THREADS, export_model, load_model
+
+import argparse, sys, time, cv2, numpy as np
+
+MODELS = {
+    "ball": (COLOUR_BALL_MODEL_ROUTE, BALL_DETECTION_IMAGE_SIZE),
+    "keypoints": (KEYPOINTS_MODEL_ROUTE, KEYPOINTS_DETECTION_IMAGE_SIZE),
+}
+MATCH_IOU = 0.5
+
+
+def read_frames(video_path: str, frames: int):
+    video = cv2.VideoCapture(video_path)
+    result = []
+    while len(result) < frames:
+        success, frame = video.read()
+        if not success:
+            break
+        result.append(frame)
+    video.release()
+    return result
+
+
+def get_boxes(prediction):
+    return prediction.boxes.xyxy.cpu().numpy(), prediction.boxes.cls.cpu().numpy(), prediction.boxes.conf.cpu().numpy()
+
+
+def iou(boxes, other_boxes):
+    top_left = np.maximum(boxes[:, None, :2], other_boxes[None, :, :2])
+    bottom_right = np.minimum(boxes[:, None, 2:], other_boxes[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    areas = np.prod(boxes[:, 2:] - boxes[:, :2], axis=1)
+    other_areas = np.prod(other_boxes[:, 2:] - other_boxes[:, :2], axis=1)
+    return intersection / (areas[:, None] + other_areas[None, :] - intersection + 1e-9)
+
+
+def match_detections(reference, candidate):
+    # Greedy matching of boxes of the same class by IoU, returns the matched pairs
+    reference_xyxy, reference_cls, _ = reference
+    candidate_xyxy, candidate_cls, _ = candidate
+    if not len(reference_xyxy) or not len(candidate_xyxy):
+        return []
+
+    overlaps = iou(reference_xyxy, candidate_xyxy) * (reference_cls[:, None] == candidate_cls[None, :])
+    pairs = []
+    while True:
+        reference_index, candidate_index = np.unravel_index(np.argmax(overlaps), overlaps.shape)
+        if overlaps[reference_index, candidate_index] < MATCH_IOU:
+            return pairs
+        pairs.append((reference_index, candidate_index, overlaps[reference_index, candidate_index]))
+        overlaps[reference_index, :] = 0
+        overlaps[:, candidate_index] = 0
+
+
+def time_model(model, frames, batch_size, imgsz):
+    # Predictions of every frame and seconds of every batch, the first batch warms the model up
+    model(frames[:batch_size], verbose=False, imgsz=imgsz)
+    predictions, seconds = [], []
+    for start in range(0, len(frames), batch_size):
+        batch_start = time.perf_counter()
+        predictions.extend(model(frames[start:start + batch_size], verbose=False, imgsz=imgsz))
+        seconds.append(time.perf_counter() - batch_start)
+    return predictions, seconds
+
+
+def compare(args):
+    route, imgsz = MODELS[args.model]
+    frames = read_frames(args.video, args.frames)
+    if not frames:
+        sys.exit(f"No frames read from {args.video}")
+
+    reference_model = load_model(route, "ultralytics", args.threads)
+    candidate_model = load_model(route, args.backend, args.threads, args.int8)
+    reference_predictions, reference_seconds = time_model(reference_model, frames, args.batch, imgsz)
+    candidate_predictions, candidate_seconds = time_model(candidate_model, frames, args.batch, imgsz)
+
+    reference_detections = candidate_detections = 0
+    ious, confidence_differences = [], []
+    matched = 0
+    for reference_prediction, candidate_prediction in zip(reference_predictions, candidate_predictions):
+        reference, candidate = get_boxes(reference_prediction), get_boxes(candidate_prediction)
+        reference_detections += len(reference[0])
+        candidate_detections += len(candidate[0])
+        for reference_index, candidate_index, overlap in match_detections(reference, candidate):
+            matched += 1
+            ious.append(overlap)
+            confidence_differences.append(abs(reference[2][reference_index] - candidate[2][candidate_index]))
+
+    recall = matched / reference_detections if reference_detections else 1.0
+    precision = matched / candidate_detections if candidate_detections else 1.0
+    name = f"{args.backend}{' int8' if args.int8 else ''}"
+    print(f"{len(frames)} frames of {args.video}, {args.model} model, batches of {args.batch}")
+    for label, seconds in (("ultralytics", reference_seconds), (name, candidate_seconds)):
+        per_frame = np.array(seconds) * 1000 / args.batch
+        print(f"{label:>16}: {np.sum(seconds) * 1000 / len(frames):8.2f} ms/frame, p95 {np.percentile(per_frame, 95):8.2f} ms/frame")
+    print(f"{'parity':>16}: recall {recall:.3f}, precision {precision:.3f}, mean IoU {np.mean(ious) if ious else 0:.3f}, "
+          f"mean confidence difference {np.mean(confidence_differences) if confidence_differences else 0:.3f}")
+
+    if recall < args.min_recall:
+        sys.exit(f"Parity check failed, recall {recall:.3f} < {args.min_recall}")
+
+
+def export(args):
+    calibration_images = read_frames(args.video, args.frames) if args.video else None
+    for model in ([args.model] if args.model else MODELS):
+        route, imgsz = MODELS[model]
+        print(export_model(route, args.backend, imgsz, args.int8, calibration_images, args.data))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export")
+    export_parser.add_argument("--backend", choices=BACKENDS[1:], required=True)
+    export_parser.add_argument("--model", choices=list(MODELS))
+    export_parser.add_argument("--int8", action="store_true")
+    export_parser.add_argument("--video", help="frames to calibrate the INT8 ONNX model")
+    export_parser.add_argument("--frames", type=int, default=100)
+    export_parser.add_argument("--data", help="dataset yaml to calibrate the INT8 OpenVINO model")
+
+    compare_parser = subparsers.add_parser("compare")
+    compare_parser.add_argument("--backend", choices=BACKENDS[1:], required=True)
+    compare_parser.add_argument("--model", choices=list(MODELS), default="ball")
+    compare_parser.add_argument("--int8", action="store_true")
+    compare_parser.add_argument("--video", required=True)
+    compare_parser.add_argument("--frames", type=int, default=100)
+    compare_parser.add_argument("--batch", type=int, default=8)
+    compare_parser.add_argument("--threads", type=int, default=INFERENCE_THREADS)
+    compare_parser.add_argument("--min-recall", type=float, default=0.95)
+
+    args = parser.parse_args()
+    export(args) if args.command == "export" else compare(args)
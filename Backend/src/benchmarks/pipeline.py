@@ -0,0 +1,245 @@
+"""Throughput of every stage of the video processing on a synthetic clip, with the models replaced by replay detectors.
+
+Runs without footage, models, GPU or network. Every stage reports frames per second, milliseconds per frame
+and the peak of the memory allocated through Python (numpy buffers included, OpenCV ones are not traced).
+
+Usage (from Backend/src):
+    python -m benchmarks.pipeline
+    python -m benchmarks.pipeline --stages decode tracking --repeat 5
+    python -m benchmarks.pipeline --save benchmarks/baseline.json
+    python -m benchmarks.pipeline --compare benchmarks/baseline.json --tolerance 0.25
+
+--compare exits with an error when a stage is slower than the baseline by more than the tolerance
+or the play statistics changed. Baselines depend on the machine, compare results taken on the same one.
+"""
+from benchmarks.synthetic import BENCHMARKS_DIRECTORY, SyntheticClip, install_replay_detectors, replay_detectors
+
+from app.models.annotators import Detection, VideoConfig
+from app.models.project import Pocket
+from app.utils.motion import FrameAction, MotionGate
+from app.utils.pipeline import ThreadedVideoWriter, get_video_writer, prefetch
+from app.utils.tracker import BallTracker
+from app.utils import video_process
+from app.utils.video_process import MinimapProjector, PlayRenderer, delete_repeated_or_bad_detected_keypoints, generate_ball_predictions, generate_frames, process_statistics
+
+import argparse, json, os, platform, sys, time, tracemalloc, cv2, numpy as np
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+class StageContext:
+    # The synthetic clip, its decoded frames and the replayed detections every stage starts from
+    def __init__(self, clip: SyntheticClip, video_path: str):
+        self.clip = clip
+        self.video_path = video_path
+        self.frames = list(generate_frames(cv2.VideoCapture(video_path)))
+        self.ball_detector, self.keypoints_detector = replay_detectors(clip)
+        for frame_index, frame in enumerate(self.frames):
+            self.ball_detector.register(frame, frame_index)
+            self.keypoints_detector.register(frame, frame_index)
+        self.ball_predictions = [self.ball_detector.predict(frame) for frame in self.frames]
+        self.keypoints_prediction = self.keypoints_detector.predict(self.frames[0])
+        self.homography = np.linalg.inv(clip.homography)
+        self.tracks = self.get_tracks()
+
+    def get_detections(self, frame_index: int):
+        prediction = self.ball_predictions[frame_index]
+        return Detection.from_results(pred=prediction.boxes, names=prediction.names)
+
+    def get_tracks(self):
+        tracks = self.get_detections(0)
+        for tracker_id, track in enumerate(tracks, start=1):
+            track.tracker_id = tracker_id
+            track.centers_list.append(track.rect.center.int_xy_tuple)
+        return tracks
+
+
+def bench_decode(context: StageContext) -> int:
+    return sum(1 for _ in generate_frames(cv2.VideoCapture(context.video_path)))
+
+
+def bench_motion_gate(context: StageContext) -> int:
+    motion_gate = MotionGate()
+    for frame in context.frames:
+        motion_gate.update(frame)
+    return len(context.frames)
+
+
+def bench_ball_detection(context: StageContext) -> int:
+    # Batching and building of the predictions around the ball model, the replay detector takes no time
+    video_process.ball_colour_model = context.ball_detector
+    return sum(1 for _ in generate_ball_predictions((frame, FrameAction.DETECT) for frame in context.frames))
+
+
+def bench_keypoints_cleaning(context: StageContext) -> int:
+    for _ in context.frames:
+        delete_repeated_or_bad_detected_keypoints(context.keypoints_prediction)
+    return len(context.frames)
+
+
+def bench_tracking(context: StageContext) -> int:
+    tracks = context.get_tracks()
+    ball_tracker = BallTracker(tracks)
+    for frame_index in range(1, len(context.frames)):
+        tracks = ball_tracker.update(tracks, context.get_detections(frame_index))
+    return len(context.frames) - 1
+
+
+def bench_projection(context: StageContext) -> int:
+    minimap_projector = MinimapProjector(homography=context.homography, max_points=len(context.tracks))
+    for _ in context.frames:
+        minimap_projector.project(context.tracks)
+    return len(context.frames)
+
+
+def bench_render(context: StageContext) -> int:
+    # Annotation, composition with the minimap and encoding of the processed video
+    renderer = PlayRenderer(os.path.join(BENCHMARKS_DIRECTORY, "render.mp4"), context.clip.fps)
+    minimap_points = MinimapProjector(homography=context.homography, max_points=len(context.tracks)).project(context.tracks)
+    for frame in context.frames:
+        renderer.render(frame.copy(), context.tracks, minimap_points, [])
+    renderer.release()
+    return len(context.frames)
+
+
+def simulate_inference(frame):
+    # CPU work standing in for the ball model, OpenCV releases the GIL while doing it as the model runtimes do
+    return cv2.GaussianBlur(cv2.resize(frame, (640, 640)), (0, 0), 8)
+
+
+def bench_overlap(context: StageContext, pipelined: bool) -> int:
+    # Decode, inference and encode of every frame, one after the other or with the decoder and encoder threads.
+    # The ratio of the two stages is the gain of the prefetching decoder and the threaded writer on this machine
+    video_config = VideoConfig(fps=context.clip.fps, width=context.clip.width, height=context.clip.height)
+    video_writer = get_video_writer(os.path.join(BENCHMARKS_DIRECTORY, "overlap.mp4"), video_config)
+    frames = generate_frames(cv2.VideoCapture(context.video_path))
+    if pipelined:
+        video_writer = ThreadedVideoWriter(video_writer)
+        frames = prefetch(frames)
+
+    frame_count = 0
+    for frame in frames:
+        simulate_inference(frame)
+        video_writer.write(frame)
+        frame_count += 1
+    video_writer.release()
+    return frame_count
+
+
+def bench_process_video(context: StageContext, render: bool = False) -> int:
+    ball_detector, keypoints_detector = replay_detectors(context.clip)
+    install_replay_detectors(ball_detector, keypoints_detector)
+    trajectories, photo_path, processed_video_path, _ = video_process.process_video(context.video_path, render=render)
+    for path in (photo_path, processed_video_path):
+        if path and os.path.exists(path):
+            os.remove(path)
+    context.trajectories = trajectories
+    return len(context.frames)
+
+
+def bench_process_statistics(context: StageContext) -> int:
+    if not hasattr(context, "trajectories"):
+        bench_process_video(context)
+    for _ in context.frames:
+        process_statistics(context.trajectories["tracks"], Pocket.TOP_LEFT)
+    return len(context.frames)
+
+
+STAGES = {
+    "decode": bench_decode,
+    "motion_gate": bench_motion_gate,
+    "ball_detection": bench_ball_detection,
+    "keypoints_cleaning": bench_keypoints_cleaning,
+    "tracking": bench_tracking,
+    "projection": bench_projection,
+    "render": bench_render,
+    "overlap_serial": lambda context: bench_overlap(context, pipelined=False),
+    "overlap_pipelined": lambda context: bench_overlap(context, pipelined=True),
+    "process_video": bench_process_video,
+    "process_video_render": lambda context: bench_process_video(context, render=True),
+    "process_statistics": bench_process_statistics,
+}
+
+
+def measure(stage, context: StageContext, repeat: int):
+    # Best time of repeat runs, then one more run traced for the allocations
+    best_seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        frames = stage(context)
+        best_seconds = min(best_seconds, time.perf_counter() - start)
+
+    tracemalloc.start()
+    stage(context)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "frames": frames,
+        "fps": round(frames / best_seconds, 2),
+        "ms_per_frame": round(best_seconds * 1000 / frames, 4),
+        "peak_allocated_kb": round(peak_bytes / 1024, 1)
+    }
+
+
+def get_statistics(context: StageContext):
+    if not hasattr(context, "trajectories"):
+        bench_process_video(context)
+    distance, angle, first_color_ball, second_color_ball, success, _ = process_statistics(context.trajectories["tracks"], Pocket.TOP_LEFT)
+    return {"distance": round(distance, 3), "angle": round(angle, 2), "first_color_ball": first_color_ball, "second_color_ball": second_color_ball, "success": success}
+
+
+def compare(results, baseline, tolerance: float) -> bool:
+    passed = True
+    print(f"\n{'stage':>22} {'baseline ms':>12} {'ms':>10} {'change':>8}")
+    for name, stage in results["stages"].items():
+        baseline_stage = baseline["stages"].get(name)
+        if baseline_stage is None:
+            continue
+        change = stage["ms_per_frame"] / baseline_stage["ms_per_frame"] - 1
+        regressed = change > tolerance
+        passed = passed and not regressed
+        print(f"{name:>22} {baseline_stage['ms_per_frame']:12.4f} {stage['ms_per_frame']:10.4f} {change:+8.1%}{'  REGRESSION' if regressed else ''}")
+
+    if results["statistics"] != baseline["statistics"]:
+        passed = False
+        print(f"\nStatistics changed: {baseline['statistics']} -> {results['statistics']}")
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--frames", type=int, default=150)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", help="write the results to this json file, to use them as baseline")
+    parser.add_argument("--compare", nargs="?", const=BASELINE_PATH, help=f"baseline json to compare against, {BASELINE_PATH} by default")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    clip = SyntheticClip(frames=args.frames, width=args.width, height=args.height)
+    context = StageContext(clip, clip.write(os.path.join(BENCHMARKS_DIRECTORY, f"synthetic_{args.width}x{args.height}_{args.frames}.mp4")))
+
+    results = {
+        "clip": {"frames": args.frames, "width": args.width, "height": args.height, "fps": clip.fps},
+        "machine": {"python": platform.python_version(), "processor": platform.processor() or platform.machine(), "cpus": os.cpu_count(), "opencv": cv2.__version__, "numpy": np.__version__},
+        "statistics": get_statistics(context),
+        "stages": {}
+    }
+    print(f"{'stage':>22} {'fps':>10} {'ms/frame':>10} {'peak KB':>10}")
+    for name in args.stages:
+        stage = results["stages"][name] = measure(STAGES[name], context, args.repeat)
+        print(f"{name:>22} {stage['fps']:10.2f} {stage['ms_per_frame']:10.4f} {stage['peak_allocated_kb']:10.1f}")
+    print(f"statistics: {results['statistics']}")
+
+    if args.save:
+        with open(args.save, "w") as results_file:
+            json.dump(results, results_file, indent=4)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if not compare(results, baseline, args.tolerance):
+            sys.exit("Slower than the baseline")
@@ -0,0 +1,248 @@
+"""Synthetic snooker clips and detectors that replay their known ball and keypoint boxes.
+
+The clips are the table map warped into a camera view with the balls drawn along a scripted shot:
+the cue ball hits a red that rolls into the top left pocket. No footage, models, GPU or network are needed.
+
+Usage (from Backend/src):
+    python -m benchmarks.synthetic clip.mp4 --frames 150 --fps 30 --width 1280 --height 720
+"""
+import os, tempfile
+
+# The video processing reads its directories when imported, benchmarks write to a temporary directory unless they are set.
+# The models import the database engine, no connection is opened
+BENCHMARKS_DIRECTORY = os.path.join(tempfile.gettempdir(), "snooker_benchmarks")
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite://")
+os.environ.setdefault("SNOOKER_TABLE_MAP", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static", "snooker_table.png"))
+os.environ.setdefault("PLAYS_IMAGES_DIRECTORY", os.path.join(BENCHMARKS_DIRECTORY, "plays_images"))
+os.environ.setdefault("PROCESSED_VIDEOS_DIRECTORY", os.path.join(BENCHMARKS_DIRECTORY, "processed_videos"))
+for directory in (os.environ["PLAYS_IMAGES_DIRECTORY"], os.environ["PROCESSED_VIDEOS_DIRECTORY"]):
+    os.makedirs(directory, exist_ok=True)
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from app.utils.inference_backends import BoxArray, Boxes, Prediction
+from app.utils.video_process import get_keypoints_info
+
+import argparse, time, weakref, cv2, numpy as np
+
+BALL_NAMES = {0: "Black", 1: "Blue", 2: "Brown", 3: "Green", 4: "Pink", 5: "Red", 6: "White", 7: "Yellow"}
+BALL_COLORS = {
+    "Black": (20, 20, 20), "Blue": (200, 80, 20), "Brown": (30, 60, 120), "Green": (40, 140, 30),
+    "Pink": (180, 105, 255), "Red": (20, 20, 210), "White": (245, 245, 245), "Yellow": (40, 220, 240)
+}
+# Spots on the table map, the coloured balls do not move during the shot
+BALL_SPOTS = {
+    "Yellow": (347, 419), "Brown": (495, 419), "Green": (639, 419),
+    "Blue": (495, 941), "Pink": (495, 1390), "Black": (495, 1680)
+}
+BALL_RADIUS = 14
+KEYPOINT_SIZE = 12
+TOP_LEFT_POCKET = np.array([44.0, 40.0])
+# Frame rate the shot is scripted at, faster clips show it in slow motion
+SHOT_FPS = 30
+
+
+def ease_out(t: float) -> float:
+    # Rolling balls slow down until they stop
+    t = min(max(t, 0.0), 1.0)
+    return 1 - (1 - t) ** 2
+
+
+@dataclass
+class ScriptedShot:
+    # Table map positions of the balls, the cue ball hits the red on hit_frame and the red drops at pocket_frame, at SHOT_FPS
+    cue_ball: Tuple[float, float] = (420.0, 1000.0)
+    red: Tuple[float, float] = (260.0, 560.0)
+    start_frame: int = 10
+    hit_frame: int = 40
+    pocket_frame: int = 75
+
+    def positions(self, frame_index: float) -> Dict[str, np.ndarray]:
+        red = np.array(self.red)
+        direction = (TOP_LEFT_POCKET - red) / np.linalg.norm(TOP_LEFT_POCKET - red)
+        contact = red - direction * 2 * BALL_RADIUS
+
+        cue_ball = np.array(self.cue_ball)
+        if frame_index >= self.start_frame:
+            cue_ball = cue_ball + (contact - cue_ball) * ease_out((frame_index - self.start_frame) / (self.hit_frame - self.start_frame))
+
+        positions = {"White": cue_ball}
+        if frame_index < self.pocket_frame:
+            positions["Red"] = red + (TOP_LEFT_POCKET - red) * ease_out((frame_index - self.hit_frame) / (self.pocket_frame - self.hit_frame)) if frame_index >= self.hit_frame else red
+        positions.update({name: np.array(spot, dtype=np.float64) for name, spot in BALL_SPOTS.items()})
+        return positions
+
+
+@dataclass
+class SyntheticClip:
+    frames: int = 150
+    fps: float = 30
+    width: int = 1280
+    height: int = 720
+    noise: int = 3
+    seed: int = 0
+    shot: ScriptedShot = field(default_factory=ScriptedShot)
+
+    def __post_init__(self):
+        table_map = cv2.imread(os.environ["SNOOKER_TABLE_MAP"])
+        map_height, map_width = table_map.shape[:2]
+        # Camera behind the top cushion looking down the table, the far end is narrower
+        table_corners = np.float32([[0, 0], [map_width, 0], [map_width, map_height], [0, map_height]])
+        frame_corners = np.float32(np.array([[0.30, 0.94], [0.70, 0.94], [0.61, 0.08], [0.39, 0.08]]) * [self.width, self.height])
+        self.homography = cv2.getPerspectiveTransform(table_corners, frame_corners)
+        self.background = cv2.warpPerspective(table_map, self.homography, (self.width, self.height))
+
+        # Sensor noise, a few precomputed patterns are cycled so rendering stays cheap
+        rng = np.random.default_rng(self.seed)
+        self.noise_patterns = [(rng.integers(0, self.noise + 1, (self.height, self.width, 3), dtype=np.uint8),
+                                rng.integers(0, self.noise + 1, (self.height, self.width, 3), dtype=np.uint8)) for _ in range(4)] if self.noise > 0 else []
+
+        keypoints_dict, keypoints_coords = get_keypoints_info()
+        self.keypoint_ids = {name: keypoint_id for keypoint_id, name in keypoints_dict.items()}
+        self.keypoints = {name: self.to_frame(coords) for name, coords in keypoints_coords.items()}
+
+    def to_frame(self, point) -> np.ndarray:
+        return cv2.perspectiveTransform(np.array([[point]], dtype=np.float64), self.homography)[0, 0]
+
+    def ball_radius(self, point) -> float:
+        # The balls look smaller at the far end of the table
+        return np.linalg.norm(self.to_frame(np.add(point, (BALL_RADIUS, 0))) - self.to_frame(point))
+
+    def positions(self, frame_index: int) -> Dict[str, np.ndarray]:
+        return self.shot.positions(frame_index * SHOT_FPS / self.fps)
+
+    def ball_boxes(self, frame_index: int) -> List[Tuple[int, List[float]]]:
+        # Class and xyxy box in the frame of every ball on the table
+        boxes = []
+        class_ids = {name: class_id for class_id, name in BALL_NAMES.items()}
+        for name, position in self.positions(frame_index).items():
+            center, radius = self.to_frame(position), self.ball_radius(position) + 1
+            boxes.append((class_ids[name], [center[0] - radius, center[1] - radius, center[0] + radius, center[1] + radius]))
+        return boxes
+
+    def keypoint_boxes(self) -> List[Tuple[int, List[float]]]:
+        half = KEYPOINT_SIZE / 2
+        return [(self.keypoint_ids[name], [x - half, y - half, x + half, y + half]) for name, (x, y) in self.keypoints.items()]
+
+    def render(self, frame_index: int) -> np.ndarray:
+        frame = self.background.copy()
+        for name, position in self.positions(frame_index).items():
+            center = self.to_frame(position)
+            cv2.circle(frame, (int(round(center[0])), int(round(center[1]))), int(round(self.ball_radius(position))), BALL_COLORS[name], -1, cv2.LINE_AA)
+        if self.noise_patterns:
+            positive, negative = self.noise_patterns[frame_index % len(self.noise_patterns)]
+            cv2.add(frame, positive, frame)
+            cv2.subtract(frame, negative, frame)
+        return frame
+
+    def write(self, video_path: str) -> str:
+        os.makedirs(os.path.dirname(os.path.abspath(video_path)), exist_ok=True)
+        video_writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*"mp4v"), self.fps, (self.width, self.height))
+        for frame_index in range(self.frames):
+            video_writer.write(self.render(frame_index))
+        video_writer.release()
+        return video_path
+
+
+class ReplayDetector:
+    """Called like the YOLO models, returns the known boxes of the clip frames it is given.
+
+    Frames are registered with their index in the clip when decoded. The ball model gets crops of them,
+    which are numpy views, so the frame and the offset of a crop are found from its base array.
+    """
+
+    def __init__(self, frames_boxes, names: Dict[int, str], latency_ms: float = 0, jitter: float = 0.5, seed: int = 0):
+        # frames_boxes(frame_index) gives the (class, xyxy) boxes of a frame, latency_ms is slept per image like a model would take
+        self.frames_boxes = frames_boxes
+        self.names = names
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.seed = seed
+        self.frames = {}
+        self.calls = 0
+        self.images = 0
+
+    def register(self, frame: np.ndarray, frame_index: int):
+        if len(self.frames) > 256:
+            self.frames = {key: value for key, value in self.frames.items() if value[0]() is not None}
+        self.frames[id(frame)] = (weakref.ref(frame), frame_index)
+
+    def locate(self, image: np.ndarray):
+        # Index of the frame an image comes from and the (x, y) offset of the image in it
+        frame = image if image.base is None else image.base
+        frame_ref, frame_index = self.frames.get(id(frame), (None, None))
+        if frame_ref is None or frame_ref() is not frame:
+            raise ValueError("Image of a frame that was not registered")
+        byte_offset = image.__array_interface__["data"][0] - frame.__array_interface__["data"][0]
+        y, x_bytes = divmod(byte_offset, frame.strides[0])
+        return frame_index, (x_bytes // frame.strides[1], y)
+
+    def predict(self, image: np.ndarray) -> Prediction:
+        frame_index, (x, y) = self.locate(image)
+        height, width = image.shape[:2]
+        rng = np.random.default_rng((self.seed, frame_index))
+
+        class_ids, boxes = [], []
+        for class_id, xyxy in self.frames_boxes(frame_index):
+            shift = rng.normal(0, self.jitter, 2) if self.jitter > 0 else np.zeros(2)
+            box = np.array(xyxy) - [x, y, x, y] + np.tile(shift, 2)
+            # Boxes outside the crop are not seen, partly outside ones are clipped
+            if box[2] <= 0 or box[3] <= 0 or box[0] >= width or box[1] >= height:
+                continue
+            class_ids.append(class_id)
+            boxes.append(np.clip(box, 0, [width, height, width, height]))
+
+        xyxy = np.array(boxes, dtype=np.float32).reshape(-1, 4)
+        return Prediction(
+            boxes=Boxes(xyxy=xyxy.view(BoxArray), conf=np.full(len(xyxy), 0.9, dtype=np.float32).view(BoxArray), cls=np.array(class_ids, dtype=np.float32).view(BoxArray)),
+            names=self.names
+        )
+
+    def __call__(self, source, verbose: bool = False, **kwargs) -> List[Prediction]:
+        images = [source] if isinstance(source, np.ndarray) else list(source)
+        self.calls += 1
+        self.images += len(images)
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms * len(images) / 1000)
+        return [self.predict(image) for image in images]
+
+
+def replay_detectors(clip: SyntheticClip, latency_ms: float = 0, keypoints_latency_ms: float = 0):
+    ball_detector = ReplayDetector(clip.ball_boxes, BALL_NAMES, latency_ms=latency_ms, seed=clip.seed)
+    keypoints_detector = ReplayDetector(lambda frame_index: clip.keypoint_boxes(), get_keypoints_info()[0], latency_ms=keypoints_latency_ms, jitter=0)
+    return ball_detector, keypoints_detector
+
+
+def install_replay_detectors(ball_detector: ReplayDetector, keypoints_detector: ReplayDetector):
+    # Replaces the models of the video processing and registers every decoded frame with its index in the clip
+    from app.utils import video_process
+
+    generate_gated_frames = getattr(video_process.generate_gated_frames, "replayed", video_process.generate_gated_frames)
+
+    def generate_registered_frames(video, *args, **kwargs):
+        for frame, action in generate_gated_frames(video, *args, **kwargs):
+            if frame is not None:
+                frame_index = int(video.get(cv2.CAP_PROP_POS_FRAMES)) - 1
+                ball_detector.register(frame, frame_index)
+                keypoints_detector.register(frame, frame_index)
+            yield frame, action
+
+    generate_registered_frames.replayed = generate_gated_frames
+    video_process.generate_gated_frames = generate_registered_frames
+    video_process.ball_colour_model = ball_detector
+    video_process.keypoints_model = keypoints_detector
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("video_path")
+    parser.add_argument("--frames", type=int, default=150)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--noise", type=int, default=3)
+    args = parser.parse_args()
+
+    clip = SyntheticClip(frames=args.frames, fps=args.fps, width=args.width, height=args.height, noise=args.noise)
+    print(clip.write(args.video_path))
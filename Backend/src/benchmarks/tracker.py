@@ -0,0 +1,83 @@
+"""Kalman and Hungarian trackers against the previous nearest neighbour tracker on synthetic ball tracks.
+
+Usage (from Backend/src):
+    python -m benchmarks.tracker --balls 22 --frames 450 --interval 3
+"""
+from app.models.annotators import Detection, Rect
+from app.utils.tracker import BallTracker, get_track_of_detections, get_track_of_detections_greedy
+
+import argparse, copy, time, uuid, numpy as np
+
+BALL_SIZE = 20
+CLASS_NAMES = ["red", "white", "blue", "pink", "black", "green", "yellow", "brown"]
+
+
+def make_detection(center, class_name):
+    return Detection(id=str(uuid.uuid4()), rect=Rect(x=center[0] - BALL_SIZE / 2, y=center[1] - BALL_SIZE / 2, width=BALL_SIZE, height=BALL_SIZE),
+                     class_id=CLASS_NAMES.index(class_name), class_name=class_name, confidence=1.0, abled=True,
+                     centers_list=[], centers_minimap_list=[], colors_list=[class_name])
+
+
+def generate_frames_detections(balls: int, frames: int, seed: int = 0):
+    # Balls spread over a 1920x1080 frame, a few of them rolling with some detector jitter
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform([100, 100], [1820, 980], size=(balls, 2))
+    velocities = np.zeros((balls, 2))
+    velocities[:max(1, balls // 5)] = rng.uniform(-8, 8, size=(max(1, balls // 5), 2))
+    class_names = [CLASS_NAMES[0] if i >= 7 else CLASS_NAMES[i + 1] for i in range(balls)]
+
+    frames_detections = []
+    for _ in range(frames):
+        positions = np.clip(positions + velocities, 0, [1920, 1080])
+        observed = positions + rng.normal(0, 1, size=positions.shape)
+        order = rng.permutation(balls)
+        frames_detections.append([make_detection(observed[i], class_names[i]) for i in order])
+    return frames_detections
+
+
+def run(tracker, frames_detections, interval: int = 1):
+    # The detections of one of every interval frames are used, the tracker predicts the others
+    frames_detections = copy.deepcopy(frames_detections)
+    tracks = frames_detections[0]
+    for tracker_id, track in enumerate(tracks, start=1):
+        track.tracker_id = tracker_id
+        track.centers_list.append(track.rect.center.int_xy_tuple)
+
+    ball_tracker = tracker(tracks) if tracker is BallTracker else None
+    start = time.perf_counter()
+    for frame, ball_detections in enumerate(frames_detections[1:], start=1):
+        if ball_tracker is None:
+            tracks = tracker(tracks, ball_detections)
+        elif frame % interval == 0:
+            tracks = ball_tracker.update(tracks, ball_detections)
+        else:
+            tracks = ball_tracker.predict(tracks)
+    elapsed = time.perf_counter() - start
+
+    return elapsed, tracks
+
+
+def id_switches(tracks):
+    # Jumps longer than any ball moves in a frame mean the track took another ball
+    switches = 0
+    for track in tracks:
+        centers = np.array(track.centers_list, dtype=np.float64)
+        if len(centers) > 1:
+            switches += int(np.sum(np.linalg.norm(np.diff(centers, axis=0), axis=1) > 50))
+    return switches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--balls", type=int, default=22)
+    parser.add_argument("--frames", type=int, default=450)
+    parser.add_argument("--interval", type=int, default=3)
+    args = parser.parse_args()
+
+    frames_detections = generate_frames_detections(args.balls, args.frames)
+
+    trackers = (("greedy", get_track_of_detections_greedy, 1), ("hungarian", get_track_of_detections, 1),
+                ("kalman", BallTracker, 1), (f"kalman/{args.interval}", BallTracker, args.interval))
+    for name, tracker, interval in trackers:
+        elapsed, tracks = run(tracker, frames_detections, interval)
+        print(f"{name:>9}: {elapsed * 1000 / (args.frames - 1):8.3f} ms/frame, {id_switches(tracks)} identity switches")
@@ -9,8 +9,16 @@ from app.routers.plays import plays_router
 from app.routers.matches import matches_router
 from app.routers.statistics import statistics_router
 from app.routers.requests import requests_router
+from app.routers.jobs import jobs_router
+from app.routers.health import health_router
+from app.routers.metrics import metrics_router
+from app.routers.reanalysis import reanalysis_router
 
 from app.db.database import Base,engine
+from app.db.migrations import add_missing_columns
+
+from app.utils.jobs import play_job_queue
+from app.utils.uploads import VideoUploadLimitMiddleware
 
 import uvicorn
 
@@ -25,12 +33,24 @@ app.include_router(projects_router)
 app.include_router(statistics_router)
 app.include_router(matches_router)
 app.include_router(requests_router)
+app.include_router(jobs_router)
+app.include_router(health_router)
+app.include_router(metrics_router)
+app.include_router(reanalysis_router)
 
 def create_tables():
     Base.metadata.create_all(bind = engine)
+    add_missing_columns()
     
 create_tables() 
 
+@app.on_event("startup")
+def start_play_workers():
+    play_job_queue.start()
+
+# Oversized play videos are rejected before their body is read
+app.add_middleware(VideoUploadLimitMiddleware)
+
 origins = [
     "*", 
 ]
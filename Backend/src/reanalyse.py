@@ -0,0 +1,49 @@
+"""Reanalyses every play after a change in the tracking or the statistics, and writes back the plays that changed.
+
+Usage (from Backend/src):
+    python reanalyse.py
+    python reanalyse.py --source detections --workers 8 --chunk-size 500
+    python reanalyse.py --dry-run
+    python reanalyse.py --resume <run_id>
+
+--source trajectories only computes the statistics again, detections also builds the trajectories again
+from the recorded model outputs. The progress is saved after every chunk, an interrupted run is resumed
+with its id. The changes of every play are written to REANALYSIS_DIRECTORY/<run_id>.jsonl. Only one reanalysis
+runs at a time, in this script or in any API worker.
+"""
+# Every model is imported so the relationships between them can be mapped, as the routers do in the server
+from app.models import codes, join_request, match, play, project, user
+from app.utils.reanalysis import REANALYSIS_CHUNK_SIZE, REANALYSIS_WORKERS, ReanalysisLock, ReanalysisRun, ReanalysisSource, run_reanalysis
+
+import argparse, json, sys
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", choices=[source.value for source in ReanalysisSource], default=ReanalysisSource.TRAJECTORIES.value)
+    parser.add_argument("--workers", type=int, default=REANALYSIS_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=REANALYSIS_CHUNK_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="report the changes without writing them")
+    parser.add_argument("--resume", metavar="RUN_ID", help="continue an interrupted run")
+    args = parser.parse_args()
+
+    if args.resume:
+        run = ReanalysisRun.load(args.resume)
+        if run is None:
+            sys.exit(f"Reanalysis {args.resume} not found")
+    else:
+        run = ReanalysisRun.create(ReanalysisSource(args.source), dry_run=args.dry_run)
+
+    # The server may be running one too, both would write the same plays
+    reanalysis_lock = ReanalysisLock(run.directory)
+    if not reanalysis_lock.acquire():
+        sys.exit("A reanalysis is already running")
+    try:
+        run = run_reanalysis(run, workers=args.workers, chunk_size=args.chunk_size)
+    finally:
+        reanalysis_lock.release()
+    for change in run.get_changes(limit=sys.maxsize):
+        print(json.dumps(change))
+    print(json.dumps(run.to_dict(), indent=4))
+    if run.state["error"]:
+        sys.exit(run.state["error"])
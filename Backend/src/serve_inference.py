@@ -0,0 +1,33 @@
+"""Inference server, loads the models once and runs them for every API worker of the machine.
+
+Usage (from Backend/src):
+    export INFERENCE_SERVICE_AUTHKEY=$(python -c "import secrets; print(secrets.token_hex(32))")
+    INFERENCE_SERVICE_SOCKET=/run/snooker/inference.sock python serve_inference.py
+    python serve_inference.py --socket /run/snooker/inference.sock --warm-up
+
+Start the API workers with the same INFERENCE_SERVICE_SOCKET and INFERENCE_SERVICE_AUTHKEY, they then send their
+frames here through shared memory instead of loading the models themselves.
+"""
+from app.utils.inference import WARM_UP_MODELS, create_models
+from app.utils.inference_service import INFERENCE_SERVICE_AUTHKEY, INFERENCE_SERVICE_SOCKET, InferenceServer
+
+import argparse
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--socket", default=INFERENCE_SERVICE_SOCKET, help="unix socket path, INFERENCE_SERVICE_SOCKET by default")
+    parser.add_argument("--warm-up", action="store_true", default=WARM_UP_MODELS, help="load the models before the first connection")
+    args = parser.parse_args()
+    if not args.socket:
+        parser.error("--socket or INFERENCE_SERVICE_SOCKET is needed")
+    if not INFERENCE_SERVICE_AUTHKEY:
+        parser.error("INFERENCE_SERVICE_AUTHKEY is needed, a random secret shared with the API workers")
+
+    # The models serve every connection, with BALL_MODEL_BATCHING the ball model calls of all of them are batched together
+    models = {model.name: model for model in create_models()}
+    if args.warm_up:
+        for model in models.values():
+            model.warm_up()
+
+    InferenceServer(models, socket_path=args.socket).serve_forever()
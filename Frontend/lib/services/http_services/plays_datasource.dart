@@ -45,7 +45,9 @@ class PlaysService {
       });
       response =
           await dio.post('/projects/$projectId/new_play', data: formData);
-      if (response.statusCode == 200) {
+      if (response.statusCode == 202) {
+        // El video se procesa en segundo plano, se consulta el trabajo hasta que termina
+        await _waitForJob(response.data['id']);
         const dynamic data = 'Jugada procesada correctamente';
         return (data);
       } else {
@@ -60,6 +62,25 @@ class PlaysService {
     }
   }
 
+  static const Duration _jobPollInterval = Duration(seconds: 2);
+  static const Duration _jobTimeout = Duration(minutes: 10);
+
+  Future<void> _waitForJob(String jobId) async {
+    final DateTime deadline = DateTime.now().add(_jobTimeout);
+    while (DateTime.now().isBefore(deadline)) {
+      await Future.delayed(_jobPollInterval);
+      final response = await dio.get('/jobs/$jobId');
+      final String status = response.data['status'];
+      if (status == 'done') {
+        return;
+      }
+      if (status == 'failed') {
+        throw Exception(response.data['error'] ?? 'Error al procesar la jugada');
+      }
+    }
+    throw Exception('La jugada está tardando demasiado en procesarse');
+  }
+
   Future<List<Play>> getMyPlays(int? limit) async {
     try {
       String endpoint = '/plays/my_plays';